@@ -0,0 +1,215 @@
+import os
+import logging
+import json
+import time
+import asyncio
+from uuid import uuid4
+from fastapi import APIRouter, WebSocket
+from starlette.websockets import WebSocketDisconnect, WebSocketState
+
+from backend.logs import bind
+from backend.kyc_jobs import enqueue_step
+from backend.kyc_pipeline import run_aadhaar_step, run_pan_step, run_face_step
+from backend.quality_gate import score_preview, record, RETAKE_MESSAGES
+from backend.workers import run_in_process
+
+# Live capture: the browser streams compressed preview frames over a WebSocket
+#   WS /kyc/capture/{doc_type}?session_id=...&mode=job
+#   client -> server  binary JPEG frames; text {"type": "commit"} to take the best frame now
+#   server -> client  {"type": "frame"} score per frame, {"type": "hint"} retake advice,
+#                     {"type": "slow_down"} when frames arrive faster than they are scored,
+#                     {"type": "committed"} with the step result, {"type": "timeout"}
+# Each frame is scored in the worker pool with the quality gate (sharpness, exposure,
+# face / document presence) plus motion against the previous frame. Once enough
+# consecutive frames pass and are steady, the sharpest one goes to the KYC pipeline.
+# Per connection only KYC_STREAM_BUFFER frames wait to be scored; when the buffer is
+# full the oldest waiting frame is dropped and the client is asked to slow down.
+
+KYC_STREAM_BUFFER = int(os.getenv("KYC_STREAM_BUFFER", "2"))
+KYC_STREAM_MAX_FRAME_BYTES = int(os.getenv("KYC_STREAM_MAX_FRAME_BYTES", str(512 * 1024)))
+KYC_STREAM_MAX_CONNECTIONS = int(os.getenv("KYC_STREAM_MAX_CONNECTIONS", "100"))
+KYC_STREAM_STABLE_FRAMES = int(os.getenv("KYC_STREAM_STABLE_FRAMES", "3"))
+# Mean absolute difference of 16x16 grey thumbnails (0-255) below which a frame is steady
+KYC_STREAM_MAX_MOTION = float(os.getenv("KYC_STREAM_MAX_MOTION", "6"))
+KYC_STREAM_TIMEOUT = float(os.getenv("KYC_STREAM_TIMEOUT", "30"))
+HINT_EVERY_FRAMES = 5
+SLOW_DOWN_INTERVAL = 1.0
+
+STEPS = {
+    "aadhaar": (run_aadhaar_step, None),
+    "pan": (run_pan_step, None),
+    "face": (run_face_step, "aadhaar"),
+}
+
+log = logging.getLogger(__name__)
+router = APIRouter()
+
+stream_stats = {"active": 0, "rejected": 0, "frames": 0, "scored": 0, "dropped": 0,
+                "committed": 0, "forced": 0, "timeouts": 0}
+
+
+def motion(a, b):
+    if not a or not b or len(a) != len(b):
+        return None
+    return sum(abs(x - y) for x, y in zip(a, b)) / len(a)
+
+
+class FrameSelector:
+    """Keeps the best usable frame and decides when the stream has settled."""
+
+    def __init__(self, stable_frames=KYC_STREAM_STABLE_FRAMES, max_motion=KYC_STREAM_MAX_MOTION):
+        self.stable_frames = stable_frames
+        self.max_motion = max_motion
+        self.best = None  # (score, seq, frame bytes)
+        self.prev_thumb = None
+        self.stable_run = 0
+        self.rejections = 0
+
+    def add(self, seq, data, reasons, metrics, thumb):
+        """Score one frame; returns (feedback dict, whether to commit now)."""
+        moved = motion(self.prev_thumb, thumb)
+        self.prev_thumb = thumb
+        steady = moved is not None and moved <= self.max_motion
+        usable = not reasons
+        self.stable_run = self.stable_run + 1 if usable and steady else 0
+        self.rejections = 0 if usable else self.rejections + 1
+        # Sharpness decides between usable frames; movement since the last frame counts against it
+        score = metrics.get("sharpness", 0.0) / (1.0 + (moved if moved is not None else self.max_motion))
+        if usable and (self.best is None or score > self.best[0]):
+            self.best = (score, seq, data)
+        feedback = {"type": "frame", "seq": seq, "usable": usable, "steady": steady, "reasons": reasons,
+                    "score": round(score, 1), "motion": round(moved, 2) if moved is not None else None}
+        return feedback, self.stable_run >= self.stable_frames
+
+
+def step_message(response_or_result):
+    """Normalize a JSONResponse (job mode) or (body, status) tuple into a committed message."""
+    if isinstance(response_or_result, tuple):
+        body, status_code = response_or_result
+    else:
+        body, status_code = json.loads(response_or_result.body), response_or_result.status_code
+    return {"type": "committed", "status_code": status_code, "body": body}
+
+
+async def commit(doc_type, session_id, frame, mode):
+    step, after_kind = STEPS[doc_type]
+    if mode == "job":
+        return step_message(await enqueue_step(doc_type, session_id, step, session_id, frame, after_kind=after_kind))
+    return step_message(await step(session_id, frame))
+
+
+@router.websocket("/kyc/capture/{doc_type}")
+async def capture_stream(websocket: WebSocket, doc_type: str):
+    await websocket.accept()
+    if doc_type not in STEPS:
+        await websocket.close(code=1008, reason="unknown document type")
+        return
+    if stream_stats["active"] >= KYC_STREAM_MAX_CONNECTIONS:
+        stream_stats["rejected"] += 1
+        await websocket.close(code=1013, reason="too many capture streams")
+        return
+
+    session_id = websocket.query_params.get("session_id") or str(uuid4())
+    bind(session_id)
+    mode = websocket.query_params.get("mode")
+    frames = asyncio.Queue(maxsize=KYC_STREAM_BUFFER)
+    force = asyncio.Event()
+    selector = FrameSelector()
+    deadline = time.monotonic() + KYC_STREAM_TIMEOUT
+
+    async def receive():
+        seq = 0
+        last_slow_down = 0.0
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes") is not None:
+                data = message["bytes"]
+                if len(data) > KYC_STREAM_MAX_FRAME_BYTES:
+                    await websocket.close(code=1009, reason="frame too large")
+                    raise WebSocketDisconnect(1009)
+                stream_stats["frames"] += 1
+                if frames.full():
+                    # Scoring is behind: keep the newest frames, tell the client to send fewer
+                    frames.get_nowait()
+                    stream_stats["dropped"] += 1
+                    if time.monotonic() - last_slow_down >= SLOW_DOWN_INTERVAL:
+                        last_slow_down = time.monotonic()
+                        await websocket.send_json({"type": "slow_down", "dropped_seq": seq - KYC_STREAM_BUFFER})
+                frames.put_nowait((seq, data))
+                seq += 1
+            elif message.get("text"):
+                try:
+                    command = json.loads(message["text"])
+                except ValueError:
+                    continue
+                if command.get("type") == "commit":
+                    force.set()
+
+    async def select():
+        """Score frames until one should be committed; returns its bytes, or None on timeout."""
+        while True:
+            if force.is_set() and selector.best is not None:
+                stream_stats["forced"] += 1
+                return selector.best[2]
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return selector.best[2] if selector.best is not None else None
+            get = asyncio.ensure_future(frames.get())
+            forced = asyncio.ensure_future(force.wait())
+            done, _ = await asyncio.wait({get, forced}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            forced.cancel()
+            if get not in done:
+                get.cancel()
+                if force.is_set() and selector.best is None:
+                    force.clear()
+                    await websocket.send_json({"type": "hint", "message": "No usable frame yet, please hold steady."})
+                continue
+            seq, data = get.result()
+            try:
+                reasons, metrics, thumb = await run_in_process(score_preview, data, doc_type)
+            except Exception as e:
+                log.warning("capture stream scoring failed", extra={"doc_type": doc_type, "error": str(e)})
+                continue
+            stream_stats["scored"] += 1
+            record(f"{doc_type}_stream", reasons)
+            feedback, settled = selector.add(seq, data, reasons, metrics, thumb)
+            await websocket.send_json(feedback)
+            if reasons and selector.rejections % HINT_EVERY_FRAMES == 0:
+                await websocket.send_json({"type": "hint", "reasons": reasons, "message": RETAKE_MESSAGES[reasons[0]]})
+            if settled:
+                return selector.best[2]
+
+    stream_stats["active"] += 1
+    receiver = asyncio.create_task(receive())
+    try:
+        selection = asyncio.create_task(select())
+        done, _ = await asyncio.wait({receiver, selection}, return_when=asyncio.FIRST_COMPLETED)
+        if selection not in done:
+            # The client went away (or sent an oversized frame) before a frame was chosen
+            selection.cancel()
+            receiver.exception()
+            return
+        # Frames arriving while the step runs are not needed any more
+        receiver.cancel()
+        frame = selection.result()
+        if frame is None:
+            stream_stats["timeouts"] += 1
+            await websocket.send_json({"type": "timeout", "session_id": session_id})
+        else:
+            stream_stats["committed"] += 1
+            await websocket.send_json(await commit(doc_type, session_id, frame, mode))
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        stream_stats["active"] -= 1
+        receiver.cancel()
+        if websocket.application_state == WebSocketState.CONNECTED:
+            await websocket.close()
+
+
+@router.get("/kyc/capture/stats")
+def get_stream_stats():
+    return stream_stats
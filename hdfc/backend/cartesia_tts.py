@@ -1,37 +1,376 @@
 import os
-from fastapi import APIRouter, Request
-from cartesia import Cartesia
+import logging
+import json
+import time
 import base64
+import asyncio
+import hashlib
+import functools
+import threading
+from collections import deque
+from dotenv import load_dotenv
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from backend.content_cache import ContentCache, TTLCache
+from backend.metrics import span
 
+load_dotenv()
+
+log = logging.getLogger(__name__)
 router = APIRouter()
 CARTESIA_API_KEY = os.getenv("CARTESIA_API_KEY")
 CARTESIA_VOICE_ID = os.getenv("CARTESIA_VOICE_ID")
+CARTESIA_MODEL_ID = "sonic-2"
+CARTESIA_LANGUAGE = "hi"
+OUTPUT_FORMAT = {
+    "container": "wav",
+    "sample_rate": 44100,
+    "encoding": "pcm_f32le",
+}
+
+# name -> (Cartesia output_format, media type). 16-bit PCM at 22/16 kHz is 4-5x smaller
+# than 44.1 kHz float WAV; MP3 at 64 kbps is ~20x smaller.
+TTS_FORMATS = {
+    "wav44k_f32": (OUTPUT_FORMAT, "audio/wav"),
+    "wav22k": ({"container": "wav", "sample_rate": 22050, "encoding": "pcm_s16le"}, "audio/wav"),
+    "wav16k": ({"container": "wav", "sample_rate": 16000, "encoding": "pcm_s16le"}, "audio/wav"),
+    "mp3": ({"container": "mp3", "sample_rate": 22050, "bit_rate": 64000}, "audio/mpeg"),
+}
+TTS_JSON_FORMAT = "wav44k_f32"
+TTS_STREAM_FORMAT = os.getenv("TTS_STREAM_FORMAT", "mp3")
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", ".tts_cache")
+TTS_CACHE_SIZE = int(os.getenv("TTS_CACHE_SIZE", "256"))
+# Only the fixed prompts are kept on disk, at most this many files (least recently used go first)
+TTS_CACHE_MAX_FILES = int(os.getenv("TTS_CACHE_MAX_FILES", "500"))
+# Any other text (personalized lines, ad-hoc requests) is cached in memory only, this long
+TTS_ADHOC_TTL = float(os.getenv("TTS_ADHOC_TTL", "3600"))
+TTS_WARMUP = os.getenv("TTS_WARMUP", "true").lower() in ("1", "true", "yes")
+TTS_WARMUP_FORMATS = os.getenv("TTS_WARMUP_FORMATS", TTS_STREAM_FORMAT).split(",")
+TTS_WARMUP_CONCURRENCY = 4
+
+# Fixed prompts spoken by frontend/app.js; pre-rendered at startup
+STATIC_PROMPTS = [
+    "Please allow microphone access to continue your KYC process.",
+    "Please allow audio access to continue your KYC process.",
+    "Please allow location access to continue your KYC process.",
+    "Please show your Aadhaar card to the camera and click Capture.",
+    "Now please show your PAN card.",
+    "Now, please show your PAN card to the camera and click Capture.",
+    "Now please align your face for verification.",
+    "Now, please align your face in the camera and click Capture Face.",
+    "Please wait while we verify your details...",
+    "Please review your details. You can modify them if needed, then click Confirm.",
+    "Please read the following statement on camera: I confirm that the information given is correct and with my own will, I am interested in an HDFC loan.",
+    "Thank you! Your KYC is completed.",
+]
+
+
+class DiskStore:
+    """Audio files on disk, one per cache key; values are exchanged as base64 strings.
+
+    Holds at most ``max_files`` files; reads refresh a file's mtime and the oldest are
+    removed first.
+    """
+
+    def __init__(self, directory, max_files=TTS_CACHE_MAX_FILES):
+        self.directory = directory
+        self.max_files = max_files
+        os.makedirs(directory, exist_ok=True)
+        self.count = len(self._files())
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".audio")
+
+    def _files(self):
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith(".audio")]
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return base64.b64encode(audio).decode()
+
+    def set(self, key, value):
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.count += 1
+        with open(path + ".tmp", "wb") as f:
+            f.write(base64.b64decode(value))
+        os.replace(path + ".tmp", path)
+        if self.count > self.max_files:
+            self._evict()
+
+    def _evict(self):
+        files = sorted(self._files(), key=lambda entry: entry.stat().st_mtime)
+        for entry in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        self.count = len(self._files())
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+# Fixed prompts: memory, then disk
+tts_cache = ContentCache(
+    "tts",
+    memory=TTLCache(maxsize=TTS_CACHE_SIZE, ttl=float("inf")),
+    persistent=DiskStore(TTS_CACHE_DIR) if TTS_CACHE_DIR else None,
+)
+# Everything else: memory only, expiring
+adhoc_cache = ContentCache("tts_adhoc", memory=TTLCache(maxsize=TTS_CACHE_SIZE, ttl=TTS_ADHOC_TTL))
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        from cartesia import Cartesia
+        _client = Cartesia(api_key=CARTESIA_API_KEY)
+    return _client
+
+
+def tts_cache_key(text, voice_id, model_id, language, output_format):
+    return hashlib.sha256(json.dumps(
+        [text, voice_id, model_id, language, output_format], sort_keys=True).encode()).hexdigest()
+
+
+def audio_key(text, fmt):
+    return tts_cache_key(text, CARTESIA_VOICE_ID, CARTESIA_MODEL_ID, CARTESIA_LANGUAGE, TTS_FORMATS[fmt][0])
+
+
+@functools.lru_cache(maxsize=1)
+def fixed_prompts():
+    from backend.quality_gate import RETAKE_MESSAGES
+    return frozenset(STATIC_PROMPTS + list(RETAKE_MESSAGES.values()))
+
+
+def cache_for(text, persist=True):
+    """Cache tier for text: only the app's fixed prompts may be written to disk."""
+    return tts_cache if persist and text in fixed_prompts() else adhoc_cache
+
+
+def stream_synthesis(text, fmt=TTS_JSON_FORMAT):
+    """Iterator over audio chunks as Cartesia produces them."""
+    return iter(get_client().tts.bytes(
+        model_id=CARTESIA_MODEL_ID,
+        transcript=text,
+        voice={
+            "mode": "id",
+            "id": CARTESIA_VOICE_ID,
+        },
+        language=CARTESIA_LANGUAGE,
+        output_format=TTS_FORMATS[fmt][0],
+    ))
+
+
+def open_stream(text, fmt):
+    """Start synthesis and wait for the first chunk; returns (chunk iterator, first chunk)."""
+    chunks = stream_synthesis(text, fmt)
+    return chunks, next(chunks, b'')
+
+
+def pump(chunks, loop, queue, stop):
+    """Feed chunks into an asyncio queue from a worker thread, ending with None.
+
+    The iterator is advanced and closed on this one thread; setting ``stop`` makes it
+    close after the chunk in progress instead of reading on.
+    """
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            pass  # event loop already closed
+
+    try:
+        for chunk in chunks:
+            if stop.is_set():
+                break
+            put(chunk)
+    except Exception as e:
+        put(e)
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+        put(None)
+
+
+def synthesize(text, fmt=TTS_JSON_FORMAT):
+    with span("tts_synth"):
+        return b''.join(stream_synthesis(text, fmt))
+
+
+async def cached_audio_b64(cache, key):
+    if cache.persistent is None:
+        return cache.get(key)
+    audio_b64 = cache.get_memory(key)
+    if audio_b64 is None:
+        # Disk reads block, so the rest of the lookup runs in a thread
+        audio_b64 = await asyncio.to_thread(cache.get, key)
+    return audio_b64
+
+
+async def get_audio_b64(text, fmt=TTS_JSON_FORMAT, persist=True):
+    """Base64 audio for text, served from memory, then disk (fixed prompts), then Cartesia.
+
+    With persist=False the audio is only ever cached in memory (e.g. text with a user's name).
+    """
+    cache = cache_for(text, persist)
+    key = audio_key(text, fmt)
+    audio_b64 = await cached_audio_b64(cache, key)
+    if audio_b64 is None:
+        audio_b64 = base64.b64encode(await asyncio.to_thread(synthesize, text, fmt)).decode()
+        await asyncio.to_thread(cache.set, key, audio_b64)
+    return audio_b64
+
+
+# Time to first audio byte per format and source, in ms (most recent samples)
+ttfb_samples = {}
+
+
+def record_ttfb(fmt, source, started):
+    ms = (time.perf_counter() - started) * 1000
+    ttfb_samples.setdefault((fmt, source), deque(maxlen=500)).append(ms)
+    return ms
+
+
+async def warm_up(prompts=None):
+    """Pre-render prompts into the cache so they are served without calling Cartesia."""
+    prompts = prompts or sorted(fixed_prompts())
+    semaphore = asyncio.Semaphore(TTS_WARMUP_CONCURRENCY)
+
+    async def render(text, fmt):
+        async with semaphore:
+            try:
+                await get_audio_b64(text, fmt)
+            except Exception as e:
+                log.warning("tts warm-up failed", extra={"chars": len(text), "format": fmt, "error": str(e)})
+
+    async def render_all(text):
+        for fmt in TTS_WARMUP_FORMATS:
+            await render(text, fmt)
+
+    await asyncio.gather(*(render_all(text) for text in prompts))
+    log.info("tts cache warmed", extra={"prompts": len(prompts), "formats": TTS_WARMUP_FORMATS})
+
+
+_warm_up_task = None
+
+
+def start_warm_up():
+    """Start pre-rendering in the background (called from the app lifespan)."""
+    global _warm_up_task
+    if TTS_WARMUP and CARTESIA_API_KEY and _warm_up_task is None:
+        _warm_up_task = asyncio.create_task(warm_up())
+
 
 @router.post("/cartesia/tts")
 async def cartesia_tts(request: Request):
     data = await request.json()
     text = data.get("text")
-    
+    fmt = data.get("format", TTS_JSON_FORMAT)
+    if fmt not in TTS_FORMATS:
+        return JSONResponse({"audio_b64": None, "error": f"unknown format {fmt}", "formats": list(TTS_FORMATS)},
+                            status_code=400)
+
     try:
-        client = Cartesia(api_key=CARTESIA_API_KEY)
-        audio_gen = client.tts.bytes(
-            model_id="sonic-2",
-            transcript=text,
-            voice={
-                "mode": "id",
-                "id": CARTESIA_VOICE_ID,
-            },
-            language="hi",
-            output_format={
-                "container": "wav",
-                "sample_rate": 44100,
-                "encoding": "pcm_f32le",
-            },
-        )
-        audio_bytes = b''.join(audio_gen)
-        audio_b64 = base64.b64encode(audio_bytes).decode()
+        audio_b64 = await get_audio_b64(text, fmt)
         return {"audio_b64": audio_b64}
     except Exception as e:
         # Return empty response on error - frontend will fallback to browser TTS
-        print(f"Cartesia TTS error: {e}")
+        log.error("cartesia tts failed", extra={"error": str(e)})
         return {"audio_b64": None, "error": str(e)}
+
+
+@router.get("/cartesia/tts/stream")
+async def cartesia_tts_stream(text: str, format: str = TTS_STREAM_FORMAT):
+    """Audio for text, forwarded chunk by chunk as Cartesia synthesizes it.
+
+    Usable directly as an <audio> src, so playback starts on the first chunk.
+    """
+    if format not in TTS_FORMATS:
+        return JSONResponse({"error": f"unknown format {format}", "formats": list(TTS_FORMATS)}, status_code=400)
+    media_type = TTS_FORMATS[format][1]
+    cache = cache_for(text)
+    key = audio_key(text, format)
+    started = time.perf_counter()
+
+    audio_b64 = await cached_audio_b64(cache, key)
+    if audio_b64 is not None:
+        record_ttfb(format, "cache", started)
+        return Response(base64.b64decode(audio_b64), media_type=media_type)
+
+    # Pull the first chunk before answering so Cartesia errors still produce an error status
+    try:
+        async with span("tts_first_byte"):
+            chunks, first = await asyncio.to_thread(open_stream, text, format)
+    except Exception as e:
+        log.error("cartesia tts stream failed", extra={"format": format, "error": str(e)})
+        return JSONResponse({"error": str(e)}, status_code=502)
+    ttfb_ms = record_ttfb(format, "cartesia", started)
+
+    async def relay():
+        audio = [first]
+        queue = asyncio.Queue()
+        stop = threading.Event()
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(None, pump, chunks, loop, queue, stop)
+        try:
+            yield first
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                audio.append(chunk)
+                yield chunk
+        finally:
+            # If the client went away mid-stream, the pump thread closes the Cartesia
+            # stream (releasing its connection) once its current read returns
+            stop.set()
+        audio_bytes = b''.join(audio)
+        log.info("tts streamed", extra={"format": format, "ttfb_ms": round(ttfb_ms), "bytes": len(audio_bytes)})
+        await asyncio.to_thread(cache.set, key, base64.b64encode(audio_bytes).decode())
+
+    return StreamingResponse(relay(), media_type=media_type)
+
+
+@router.get("/cartesia/tts/stats")
+def tts_stream_stats():
+    stats = {}
+    for (fmt, source), samples in ttfb_samples.items():
+        ordered = sorted(samples)
+        stats.setdefault(fmt, {})[source] = {
+            "count": len(ordered),
+            "ttfb_p50_ms": round(ordered[len(ordered) // 2], 1),
+            "ttfb_p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+            "ttfb_max_ms": round(ordered[-1], 1),
+        }
+    return stats
+
+
+@router.get("/cartesia/tts/cache")
+def tts_cache_stats():
+    disk = tts_cache.persistent
+    return {**tts_cache.stats(), "disk_files": disk.count if disk else None, "adhoc": adhoc_cache.stats()}
+
+
+if __name__ == "__main__":
+    # python -m backend.cartesia_tts  -> pre-render all static prompts into TTS_CACHE_DIR
+    asyncio.run(warm_up())
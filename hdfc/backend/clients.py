@@ -0,0 +1,29 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+# The one Supabase client of this process, created on first use (or at startup by the
+# app lifespan) rather than at import, so importing the app stays cheap and every
+# module shares the same connection pool.
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_API_KEY = os.getenv("SUPABASE_API_KEY")
+
+_supabase = None
+_lock = threading.Lock()
+
+
+def get_supabase():
+    global _supabase
+    if _supabase is None:
+        with _lock:
+            if _supabase is None:
+                from supabase import create_client
+                _supabase = create_client(SUPABASE_URL, SUPABASE_API_KEY)
+    return _supabase
+
+
+def supabase_ready():
+    return _supabase is not None
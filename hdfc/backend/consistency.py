@@ -0,0 +1,283 @@
+import os
+import logging
+import re
+import csv
+import argparse
+from functools import lru_cache
+from collections import Counter
+from fastapi import APIRouter
+
+from backend import kyc_repository
+from backend.clients import get_supabase
+from backend.logs import configure_logging
+
+# Cross-document consistency: the Aadhaar and PAN extractions of a session are compared
+# locally (name, date of birth, gender) and folded into one risk score. Sessions that
+# clearly agree need no further checks; ambiguous ones and mismatches set
+# kyc_face_checks.risk_flag so only they are escalated to paid or manual review.
+#
+# Names are normalized (case, punctuation, honorifics) and folded for common
+# romanization variants of Indian names (bh/b, ph/f, ee/i, w/v, doubled letters, ...),
+# then compared as hashed character trigram vectors, so a whole batch of sessions is
+# scored with a few numpy array operations.
+#
+#   python -m backend.consistency backtest [--page-size 1000] [--csv out.csv]
+# scores every stored session and reports how many would be flagged.
+
+KYC_RISK_REVIEW = float(os.getenv("KYC_RISK_REVIEW", "0.15"))
+KYC_RISK_MISMATCH = float(os.getenv("KYC_RISK_MISMATCH", "0.45"))
+# Weight of each signal in the risk score (a full mismatch of all three scores 1.0)
+RISK_WEIGHTS = {"name": 0.6, "dob": 0.3, "gender": 0.1}
+# Penalty per date of birth outcome
+DOB_PENALTIES = {"match": 0.0, "year_match": 0.3, "missing": 0.3, "mismatch": 1.0}
+NGRAM_BITS = 9
+NGRAM_DIM = 1 << NGRAM_BITS
+NGRAM_CHUNK = 2048
+# A name that only differs by initials ("R KUMAR" / "RAJESH KUMAR") scores this much
+INITIALS_SIMILARITY = 0.75
+# Names whose consonants agree but vowels differ (MOHAMMED SHAIKH / MOHAMMAD SHEIKH)
+# score at most this much
+SKELETON_SIMILARITY = 0.9
+
+HONORIFICS = {"MR", "MRS", "MS", "MISS", "SHRI", "SRI", "SMT", "KUM", "KUMARI", "DR", "LATE"}
+# Applied in order to each name token
+FOLDS = [("PH", "F"), ("BH", "B"), ("DH", "D"), ("GH", "G"), ("JH", "J"), ("KH", "K"), ("TH", "T"),
+         ("SH", "S"), ("W", "V"), ("Z", "J"), ("Q", "K"), ("X", "KS"), ("EE", "I"), ("OO", "U"), ("AI", "E"), ("EI", "E"), ("Y", "I")]
+NON_LETTERS = re.compile(r"[^A-Z ]")
+REPEATS = re.compile(r"(.)\1+")
+VOWELS = re.compile(r"[AEIOU]")
+# DD/MM/YYYY (also - or .), YYYY-MM-DD (also /), or a bare year of birth
+DOB_DAY_FIRST = re.compile(r"(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})")
+DOB_YEAR_FIRST = re.compile(r"(\d{4})[/-](\d{1,2})[/-](\d{1,2})")
+DOB_YEAR = re.compile(r"\d{4}")
+
+log = logging.getLogger(__name__)
+router = APIRouter()
+
+consistency_stats = Counter()
+
+
+@lru_cache(maxsize=65536)
+def fold_token(token):
+    for old, new in FOLDS:
+        token = token.replace(old, new)
+    token = REPEATS.sub(r"\1", token)
+    # Trailing schwa is written inconsistently (RAMA / RAM)
+    if len(token) > 3 and token.endswith("A"):
+        token = token[:-1]
+    return token
+
+
+def name_tokens(name):
+    """Upper-case, punctuation-free, folded tokens without honorifics."""
+    if not name or name == "N/A":
+        return []
+    return [fold_token(token) for token in NON_LETTERS.sub(" ", name.upper()).split() if token not in HONORIFICS]
+
+
+def skeleton(tokens):
+    """Tokens without their vowels after the first letter."""
+    return [token[0] + VOWELS.sub("", token[1:]) for token in tokens]
+
+
+def ngram_vectors(names):
+    """Hashed character trigram counts, one L2-normalized row per name (n x NGRAM_DIM)."""
+    import numpy as np
+    # Sorted tokens make the comparison independent of name order
+    texts = [(" " + " ".join(sorted(tokens)) + " ").encode() for tokens in names]
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    width = max(int(lengths.max(initial=0)), 3)
+    chars = np.frombuffer(b"".join(t.ljust(width, b"\0") for t in texts), dtype=np.uint8)
+    chars = chars.reshape(len(texts), width).astype(np.uint32)
+    grams = (chars[:, :-2] << 16) | (chars[:, 1:-1] << 8) | chars[:, 2:]
+    # Multiplicative hash of each trigram; the top bits pick the bucket
+    buckets = ((grams * np.uint32(2654435761)) >> np.uint32(32 - NGRAM_BITS)).astype(np.int64)
+    valid = np.arange(width - 2) < (lengths[:, None] - 2)
+    cells = (np.arange(len(texts))[:, None] * NGRAM_DIM + buckets)[valid]
+    counts = np.bincount(cells, minlength=len(names) * NGRAM_DIM)
+    vectors = counts.reshape(len(names), NGRAM_DIM).astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def cosine_rows(left, right):
+    """Cosine similarity of each left name with the right name at the same index."""
+    import numpy as np
+    # In chunks, so a large backtest never holds more than a few MB of vectors
+    return np.concatenate([np.einsum("ij,ij->i", ngram_vectors(left[i:i + NGRAM_CHUNK]),
+                                     ngram_vectors(right[i:i + NGRAM_CHUNK]))
+                           for i in range(0, len(left), NGRAM_CHUNK)] or [np.zeros(0)])
+
+
+def initials_match(a, b):
+    """Every token of the shorter name equals, or is the initial of, a token of the other."""
+    short, long = sorted((a, b), key=len)
+    if not short:
+        return False
+    remaining = list(long)
+    for token in short:
+        match = next((t for t in remaining if t == token or (len(token) == 1 and t.startswith(token))
+                      or (len(t) == 1 and token.startswith(t))), None)
+        if match is None:
+            return False
+        remaining.remove(match)
+    return True
+
+
+def name_similarities(pairs):
+    """Similarity in [0, 1] per (name, name) pair; None where either name is missing."""
+    import numpy as np
+    left = [name_tokens(a) for a, _ in pairs]
+    right = [name_tokens(b) for _, b in pairs]
+    scores = np.maximum(cosine_rows(left, right),
+                        SKELETON_SIMILARITY * cosine_rows([skeleton(t) for t in left], [skeleton(t) for t in right]))
+    result = []
+    for a, b, score in zip(left, right, scores.tolist()):
+        if not a or not b:
+            result.append(None)
+        elif initials_match(a, b):
+            result.append(round(max(score, INITIALS_SIMILARITY), 3))
+        else:
+            result.append(round(score, 3))
+    return result
+
+
+@lru_cache(maxsize=65536)
+def parse_dob(value):
+    """(year, month, day) with month/day None for a bare year; None if unparseable."""
+    if not value or value == "N/A":
+        return None
+    value = value.strip()
+    if DOB_YEAR.fullmatch(value):
+        return int(value), None, None
+    match = DOB_DAY_FIRST.fullmatch(value)
+    if match:
+        day, month, year = map(int, match.groups())
+    else:
+        match = DOB_YEAR_FIRST.fullmatch(value)
+        if not match:
+            return None
+        year, month, day = map(int, match.groups())
+    return (year, month, day) if 1 <= month <= 12 and 1 <= day <= 31 else None
+
+
+def compare_dob(a, b):
+    a, b = parse_dob(a), parse_dob(b)
+    if a is None or b is None:
+        return "missing"
+    if a[0] != b[0]:
+        return "mismatch"
+    if None in a or None in b:
+        return "year_match"
+    return "match" if a == b else "mismatch"
+
+
+def compare_gender(a, b):
+    a, b = ((v or "").strip().upper()[:1] for v in (a, b))
+    if a not in ("M", "F", "T") or b not in ("M", "F", "T"):
+        return "missing"
+    return "match" if a == b else "mismatch"
+
+
+def assess_many(sessions):
+    """Score a list of {doc_type: {full_name, dob, gender}} mappings in one pass."""
+    pairs = [((s.get("aadhaar") or {}).get("full_name"), (s.get("pan") or {}).get("full_name")) for s in sessions]
+    similarities = name_similarities(pairs) if sessions else []
+    results = []
+    for identity, similarity in zip(sessions, similarities):
+        aadhaar, pan = identity.get("aadhaar") or {}, identity.get("pan") or {}
+        dob = compare_dob(aadhaar.get("dob"), pan.get("dob"))
+        gender = compare_gender(aadhaar.get("gender"), pan.get("gender"))
+        # A missing name cannot confirm the identity, so it counts as half a mismatch
+        name_penalty = 0.5 if similarity is None else 1.0 - similarity
+        score = (RISK_WEIGHTS["name"] * name_penalty + RISK_WEIGHTS["dob"] * DOB_PENALTIES[dob]
+                 + RISK_WEIGHTS["gender"] * (1.0 if gender == "mismatch" else 0.0))
+        band = "clear" if score < KYC_RISK_REVIEW else "review" if score < KYC_RISK_MISMATCH else "mismatch"
+        results.append({"score": round(score, 3), "band": band, "risk_flag": band != "clear",
+                        "name_similarity": similarity, "dob": dob, "gender": gender})
+    return results
+
+
+def assess(identity):
+    return assess_many([identity])[0]
+
+
+async def assess_session(session_id, documents=()):
+    """Score a session; ``documents`` are rows not stored yet, which take precedence."""
+    fresh = {doc["doc_type"]: {field: doc["extracted_data"].get(field) for field in kyc_repository.IDENTITY_FIELDS}
+             for doc in documents}
+    if not all(doc_type in fresh for doc_type in ("aadhaar", "pan")):
+        fresh = {**await kyc_repository.identity(session_id), **fresh}
+    result = assess(fresh)
+    consistency_stats[result["band"]] += 1
+    return result
+
+
+async def refresh_risk_flag(session_id):
+    """Re-score a session whose face check was written before all its documents were stored."""
+    if not (await kyc_repository.recall(session_id)).get("face_checked"):
+        return
+    try:
+        result = await assess_session(session_id)
+        await kyc_repository.set_risk_flag(session_id, result["risk_flag"])
+    except Exception as e:
+        log.warning("risk flag refresh failed", extra={"session_id": session_id, "error": str(e)})
+
+
+def load_identities(page_size=1000):
+    """session_id -> {doc_type: identity fields} for every stored document, paged by id."""
+    supabase = get_supabase()
+    sessions = {}
+    last_id = None
+    while True:
+        query = supabase.table('kyc_documents').select(
+            'id, session_id, ' + kyc_repository.IDENTITY_SELECT).order('id').limit(page_size)
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        rows = query.execute().data
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+        for row in rows:
+            # Later rows (retakes) replace earlier ones
+            sessions.setdefault(row['session_id'], {})[row['doc_type']] = {
+                field: row.get(field) for field in kyc_repository.IDENTITY_FIELDS}
+        print(f"Loaded {len(sessions)} sessions so far")
+    return sessions
+
+
+def backtest(page_size=1000, csv_path=None):
+    """Score every stored session and report the risk bands."""
+    sessions = load_identities(page_size)
+    session_ids = list(sessions)
+    results = assess_many([sessions[s] for s in session_ids])
+    bands = Counter(result["band"] for result in results)
+    print(f"{len(results)} sessions: " + ", ".join(f"{band} {bands[band]}" for band in ("clear", "review", "mismatch")))
+    for signal in ("dob", "gender"):
+        print(f"  {signal}: " + ", ".join(f"{k} {v}" for k, v in Counter(r[signal] for r in results).most_common()))
+    if csv_path:
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, ["session_id", "score", "band", "risk_flag", "name_similarity", "dob", "gender"])
+            writer.writeheader()
+            for session_id, result in zip(session_ids, results):
+                writer.writerow({"session_id": session_id, **result})
+        print(f"Wrote {csv_path}")
+    return bands
+
+
+@router.get("/kyc/consistency/stats")
+def get_consistency_stats():
+    return {"bands": dict(consistency_stats), "review_threshold": KYC_RISK_REVIEW,
+            "mismatch_threshold": KYC_RISK_MISMATCH}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m backend.consistency")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backtest_parser = commands.add_parser("backtest", help=backtest.__doc__)
+    backtest_parser.add_argument("--page-size", type=int, default=1000)
+    backtest_parser.add_argument("--csv", dest="csv_path")
+    args = parser.parse_args()
+    configure_logging()
+    if args.command == "backtest":
+        backtest(args.page_size, args.csv_path)
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from fastapi import APIRouter
+
+from backend import shared_state
+
+# Content-addressed caches: identical image bytes map to the same storage object
+# and the same IDfy extraction output. A bounded LRU/TTL tier lives in memory and
+# an optional SQLite tier (KYC_CACHE_DB) survives restarts. With a shared state backend
+# (KYC_SHARED_STATE) that backend is the persistent tier, so all workers share hits.
+
+KYC_CACHE_SIZE = int(os.getenv("KYC_CACHE_SIZE", "2048"))
+KYC_CACHE_TTL = float(os.getenv("KYC_CACHE_TTL", "3600"))
+KYC_CACHE_DB = os.getenv("KYC_CACHE_DB", "")
+KYC_CACHE_DB_TTL = float(os.getenv("KYC_CACHE_DB_TTL", "86400"))
+
+router = APIRouter()
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize=KYC_CACHE_SIZE, ttl=KYC_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def shared_cache(name, maxsize=KYC_CACHE_SIZE, ttl=KYC_CACHE_TTL):
+    """A TTLCache in this process, or a namespace of the shared state when workers share one."""
+    if shared_state.state.shared:
+        return shared_state.namespace(name, ttl)
+    return TTLCache(maxsize=maxsize, ttl=ttl)
+
+
+class SQLiteStore:
+    """Persistent key/value tier with per-entry expiry, shared by all caches."""
+
+    def __init__(self, path, ttl=KYC_CACHE_DB_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self.conn.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + self.ttl))
+            self.conn.commit()
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.conn.commit()
+
+
+class ContentCache:
+    """Two-tier cache (memory, then optional persistent store) with hit/miss counters."""
+
+    def __init__(self, name, memory=None, persistent=None):
+        self.name = name
+        self.memory = memory or TTLCache()
+        self.persistent = persistent
+        self.counters = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "sets": 0}
+
+    def _key(self, key):
+        return f"{self.name}:{key}"
+
+    def get_memory(self, key):
+        """Memory-tier lookup only, safe to call on the event loop; misses are counted by get()."""
+        value = self.memory.get(key)
+        if value is not None:
+            self.counters["memory_hits"] += 1
+        return value
+
+    def get(self, key):
+        value = self.get_memory(key)
+        if value is not None:
+            return value
+        if self.persistent is not None:
+            value = self.persistent.get(self._key(key))
+            if value is not None:
+                self.counters["persistent_hits"] += 1
+                self.memory.set(key, value)
+                return value
+        self.counters["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        self.counters["sets"] += 1
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            self.persistent.set(self._key(key), value)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.persistent is not None:
+            self.persistent.delete(self._key(key))
+
+    def stats(self):
+        lookups = self.counters["memory_hits"] + self.counters["persistent_hits"] + self.counters["misses"]
+        hits = lookups - self.counters["misses"]
+        return {**self.counters, "entries": len(self.memory),
+                "hit_ratio": round(hits / lookups, 3) if lookups else None}
+
+
+if KYC_CACHE_DB:
+    persistent_store = SQLiteStore(KYC_CACHE_DB)
+elif shared_state.state.shared:
+    persistent_store = shared_state.namespace("cache", KYC_CACHE_DB_TTL)
+else:
+    persistent_store = None
+
+# sha256 + doc type -> public storage URL
+upload_cache = ContentCache("upload", persistent=persistent_store)
+# sha256 + IDfy task path -> completed IDfy task result
+extraction_cache = ContentCache("extraction", persistent=persistent_store)
+
+
+@router.get("/cache/stats")
+def cache_stats():
+    return {
+        "upload": upload_cache.stats(),
+        "extraction": extraction_cache.stats(),
+        "persistent": bool(persistent_store),
+    }
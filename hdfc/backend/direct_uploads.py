@@ -0,0 +1,164 @@
+import os
+import logging
+import asyncio
+from uuid import uuid4
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from backend import shared_state
+from backend.shared_state import offload
+from backend.clients import get_supabase
+from backend.metrics import span
+from backend.idempotency import run_once
+from backend.kyc_jobs import enqueue_step
+from backend.kyc_pipeline import verify_aadhaar, verify_pan, verify_face, upload_aadhaar_face
+from backend.image_prep import KYC_IMAGE_MAX_SIDE
+from backend.recording_uploads import record_recording, RECORDING_CONTENT_TYPES
+
+# Direct-to-storage uploads: the browser PUTs captures and the recording straight to
+# Supabase storage with a short-lived signed URL, and the API only handles two small
+# control messages:
+#   POST /upload/sign              {kind, ext, session_id?} -> {upload_id, signed_url, ...}
+#   PUT  <signed_url>              raw bytes, sent by the browser to storage
+#   POST /upload/complete/{id}     {session_id?, mode?} -> step result, job, or recording URL
+# Completing an image upload runs the same IDfy extraction as /kyc/process-*, reading
+# the stored object by URL. These captures skip the server-side quality gate,
+# normalization and content-hash reuse, which need the bytes before upload, so the
+# frontend keeps proxied uploads as its default (DIRECT_UPLOADS in frontend/app.js).
+# The Aadhaar face crop is cut from a downscaled rendition served by storage's image
+# transformation, so the full capture never comes back to the API.
+
+KYC_SIGNED_UPLOAD_TTL = float(os.getenv("KYC_SIGNED_UPLOAD_TTL", "600"))
+
+# kind -> (bucket, allowed extensions)
+UPLOAD_KINDS = {
+    "aadhaar": ("kyc_document", {"png", "jpg", "jpeg", "webp"}),
+    "pan": ("kyc_document", {"png", "jpg", "jpeg", "webp"}),
+    "face": ("kyc_document", {"png", "jpg", "jpeg", "webp"}),
+    "recording": ("kyc_recording", set(RECORDING_CONTENT_TYPES)),
+}
+IMAGE_CONTENT_TYPES = {"png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+log = logging.getLogger(__name__)
+router = APIRouter()
+
+uploads = shared_state.namespace("direct-upload", KYC_SIGNED_UPLOAD_TTL)
+direct_stats = {"signed": 0, "completed": 0, "missing_object": 0, "expired": 0}
+
+
+def sign_upload(bucket, path):
+    supabase = get_supabase()
+    with span("storage_sign"):
+        return supabase.storage.from_(bucket).create_signed_upload_url(path)
+
+
+def object_exists(bucket, path):
+    supabase = get_supabase()
+    with span("storage_head"):
+        return supabase.storage.from_(bucket).exists(path)
+
+
+def public_url(bucket, path):
+    return get_supabase().storage.from_(bucket).get_public_url(path)
+
+
+def download_rendition(bucket, path, max_side=KYC_IMAGE_MAX_SIDE):
+    """The stored image scaled down by storage to fit max_side (no full-size download)."""
+    supabase = get_supabase()
+    transform = {"width": max_side, "height": max_side, "resize": "contain"}
+    with span("storage_download"):
+        return supabase.storage.from_(bucket).download(path, {"transform": transform})
+
+
+@router.post("/upload/sign")
+async def create_upload(request: Request):
+    data = await request.json()
+    kind = data.get("kind")
+    ext = (data.get("ext") or "").lower().lstrip(".")
+    if kind not in UPLOAD_KINDS:
+        return JSONResponse({"error": f"kind must be one of {sorted(UPLOAD_KINDS)}"}, status_code=400)
+    bucket, extensions = UPLOAD_KINDS[kind]
+    if ext not in extensions:
+        return JSONResponse({"error": f"ext must be one of {sorted(extensions)}"}, status_code=400)
+
+    upload_id = str(uuid4())
+    session_id = data.get("session_id") or (str(uuid4()) if kind == "aadhaar" else None)
+    path = f"kyc_recording/{upload_id}.{ext}" if kind == "recording" else f"direct/{upload_id}_{kind}.{ext}"
+    try:
+        signed = await asyncio.to_thread(sign_upload, bucket, path)
+    except Exception as e:
+        log.error("signing upload url failed", extra={"kind": kind, "error": str(e)})
+        return JSONResponse({"error": "could not sign upload"}, status_code=502)
+
+    await offload(uploads.set, upload_id,
+                  {"kind": kind, "bucket": bucket, "path": path, "ext": ext, "session_id": session_id})
+    direct_stats["signed"] += 1
+    return {
+        "upload_id": upload_id,
+        "session_id": session_id,
+        "signed_url": signed["signed_url"],
+        "token": signed["token"],
+        "content_type": IMAGE_CONTENT_TYPES.get(ext) or RECORDING_CONTENT_TYPES.get(ext),
+        "expires_in": KYC_SIGNED_UPLOAD_TTL,
+        "complete_url": f"/upload/complete/{upload_id}",
+    }
+
+
+async def crop_stored_aadhaar(upload, upload_id):
+    try:
+        data = await asyncio.to_thread(download_rendition, upload["bucket"], upload["path"])
+    except Exception as e:
+        # e.g. image transformation not enabled for the project: face match uses the full card
+        log.warning("aadhaar face crop skipped, download failed", extra={"upload_id": upload_id, "error": str(e)})
+        return None
+    return await upload_aadhaar_face(data, upload_id)
+
+
+async def run_stored_step(upload, session_id, url, upload_id):
+    # The upload id stands in for the content hash: each signed upload is its own object
+    kind = upload["kind"]
+    if kind == "aadhaar":
+        face_crop = asyncio.create_task(crop_stored_aadhaar(upload, upload_id))
+        return await verify_aadhaar(session_id, url, upload_id, face_crop)
+    if kind == "pan":
+        return await verify_pan(session_id, url, upload_id)
+    return await verify_face(session_id, url)
+
+
+@router.post("/upload/complete/{upload_id}")
+async def complete_upload(upload_id: str, request: Request):
+    data = await request.json() if await request.body() else {}
+    upload = await offload(uploads.get, upload_id)
+    if upload is None:
+        direct_stats["expired"] += 1
+        return JSONResponse({"error": "upload not found or expired"}, status_code=404)
+    session_id = upload["session_id"] or data.get("session_id")
+    if not session_id:
+        return JSONResponse({"error": "session_id is required"}, status_code=400)
+    mode = data.get("mode") or request.query_params.get("mode")
+    # Checked before the idempotent part so a completion sent too early can be retried
+    if not await asyncio.to_thread(object_exists, upload["bucket"], upload["path"]):
+        direct_stats["missing_object"] += 1
+        return JSONResponse({"upload_id": upload_id, "error": "object not uploaded"}, status_code=409)
+
+    async def compute():
+        url = public_url(upload["bucket"], upload["path"])
+        direct_stats["completed"] += 1
+        if upload["kind"] == "recording":
+            await asyncio.to_thread(record_recording, session_id, data.get("recording_type", "full_process"), url)
+            return JSONResponse({"session_id": session_id, "url": url})
+        if mode == "job":
+            return await enqueue_step(upload["kind"], session_id, run_stored_step, upload, session_id, url,
+                                      upload_id, callback_url=data.get("callback_url"),
+                                      after_kind="aadhaar" if upload["kind"] == "face" else None)
+        body, status_code = await run_stored_step(upload, session_id, url, upload_id)
+        return JSONResponse(body, status_code=status_code)
+
+    # A repeated completion (client retry) replays the first one instead of re-running IDfy
+    key = f"complete:{upload_id}:{mode or 'sync'}"
+    return await run_once(key, f"{upload_id}:{session_id}", compute)
+
+
+@router.get("/upload/direct/stats")
+def get_direct_stats():
+    return direct_stats
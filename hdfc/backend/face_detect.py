@@ -0,0 +1,125 @@
+import os
+import math
+import base64
+import asyncio
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, Response
+
+from backend.image_prep import decode, downscale, expand_box
+from backend.request_images import read_kyc_request, BadImageRequest
+from backend.workers import run_in_process
+
+# Face extraction service (promoted from test_face_extract.py): one Haar detector per
+# process, detection on a downscaled pyramid with boxes mapped back to full resolution,
+# and largest-face selection.
+
+# Long-side sizes tried in order; full resolution is only used if these find nothing
+FACE_PYRAMID_SIDES = tuple(int(s) for s in os.getenv("FACE_PYRAMID_SIDES", "480,960").split(","))
+FACE_CROP_MARGIN = float(os.getenv("FACE_CROP_MARGIN", "0.2"))
+
+router = APIRouter()
+
+_detector = None
+
+
+def get_detector():
+    global _detector
+    import cv2
+    if _detector is None:
+        _detector = cv2.CascadeClassifier(
+            cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        )
+    return _detector
+
+
+def detect_largest_face(img):
+    """Return (x, y, w, h) of the largest face in full-resolution coordinates, or None."""
+    import cv2
+    full_side = max(img.shape[:2])
+    for side in [s for s in FACE_PYRAMID_SIDES if s < full_side] + [full_side]:
+        small, scale = downscale(img, side)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        faces = get_detector().detectMultiScale(
+            gray, scaleFactor=1.1, minNeighbors=5, minSize=(24, 24)
+        )
+        if len(faces) > 0:
+            largest = max(faces, key=lambda f: f[2] * f[3])
+            return tuple(int(round(v / scale)) for v in largest)
+    return None
+
+
+def crop_largest_face(img_bytes, margin=0.0, ext="png"):
+    import cv2
+    img = decode(img_bytes)
+    box = detect_largest_face(img)
+    if box is None:
+        raise ValueError("No face detected in image")
+    x, y, w, h = expand_box(box, margin, img.shape)
+    success, encoded = cv2.imencode(f".{ext}", img[y:y + h, x:x + w])
+    if not success:
+        raise ValueError("Failed to encode cropped face")
+    return encoded.tobytes()
+
+
+def detect_face_from_bytes(img_bytes: bytes):
+    """Extract the largest face from image bytes as PNG bytes"""
+    return crop_largest_face(img_bytes)
+
+
+def face_or_none(img_bytes, margin=FACE_CROP_MARGIN, ext="png"):
+    try:
+        return crop_largest_face(img_bytes, margin, ext)
+    except ValueError:
+        return None
+
+
+async def extract_face(img_bytes, margin=FACE_CROP_MARGIN, ext="png"):
+    """Crop the largest face in the worker pool; None if there is no face."""
+    return await run_in_process(face_or_none, img_bytes, margin, ext)
+
+
+async def extract_faces(images, margin=FACE_CROP_MARGIN, ext="png"):
+    """Batch version of extract_face, spread over the worker pool."""
+    return await asyncio.gather(*(extract_face(img_bytes, margin, ext) for img_bytes in images))
+
+
+def parse_margin(value):
+    """Crop margin from a request field, clamped to 0-1; BadImageRequest (400) if not a number."""
+    if value is None or value == "":
+        return FACE_CROP_MARGIN
+    try:
+        margin = float(value)
+    except (TypeError, ValueError):
+        raise BadImageRequest(f"invalid margin {value!r}")
+    if not math.isfinite(margin):
+        raise BadImageRequest(f"invalid margin {value!r}")
+    return min(max(margin, 0.0), 1.0)
+
+
+@router.post("/face/extract")
+async def face_extract(request: Request):
+    fields, images = await read_kyc_request(request, ["image"])
+    if not images:
+        return JSONResponse({"error": "no image provided"}, status_code=400)
+    margin = parse_margin(fields.get("margin"))
+    face = await extract_face(images["image"], margin, "jpg")
+    if face is None:
+        return JSONResponse({"error": "No face detected in image"}, status_code=422)
+    return Response(face, media_type="image/jpeg")
+
+
+@router.post("/face/extract-batch")
+async def face_extract_batch(request: Request):
+    form = await request.form()
+    try:
+        margin = parse_margin(form.get("margin"))
+        uploads = [value for key, value in form.multi_items() if key == "images" and hasattr(value, "read")]
+        faces = await extract_faces([await upload.read() for upload in uploads], margin, "jpg")
+    finally:
+        await form.close()
+    return {"faces": [
+        {"filename": upload.filename,
+         "face_b64": base64.b64encode(face).decode() if face else None,
+         "error": None if face else "No face detected in image"}
+        for upload, face in zip(uploads, faces)
+    ]}
@@ -0,0 +1,37 @@
+import logging
+import asyncio
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from backend import shared_state
+from backend.clients import supabase_ready
+from backend.idfy_governor import governor
+
+# Probes for running several workers behind a process manager or load balancer:
+#   /healthz  liveness: the worker's event loop answers
+#   /readyz   readiness: startup finished, the shared state answers and the Supabase
+#             client exists; 503 until then, and again while shutting down
+
+log = logging.getLogger(__name__)
+router = APIRouter()
+
+
+@router.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@router.get("/readyz")
+async def readyz(request: Request):
+    checks = {"startup": getattr(request.app.state, "ready", False), "supabase": supabase_ready()}
+    try:
+        checks["shared_state"] = await asyncio.to_thread(shared_state.state.ping)
+    except Exception as e:
+        log.warning("shared state ping failed", extra={"error": str(e)})
+        checks["shared_state"] = False
+    ready = all(checks.values())
+    # An open IDfy breaker is reported but does not take the worker out of rotation:
+    # every worker shares the dependency, and the breaker already answers fast
+    return JSONResponse({"status": "ready" if ready else "not_ready", "checks": checks,
+                         "shared_state": shared_state.describe(), "idfy_breaker": governor.breaker.state},
+                        status_code=200 if ready else 503)
@@ -0,0 +1,129 @@
+import os
+import time
+import base64
+import asyncio
+import hashlib
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, Response
+
+from backend import shared_state
+from backend.shared_state import offload
+from backend.content_cache import content_hash, shared_cache
+
+# Idempotent /kyc/process-* requests. The key is the Idempotency-Key header, or when it
+# is absent a hash of the step, the client's session_id and the image bytes, so a retried
+# upload of the same capture is recognised either way.
+#   - concurrent requests with the same key share one in-flight computation
+#   - completed responses are replayed for KYC_IDEMPOTENCY_TTL seconds
+#   - reusing a key for a different payload gets 409
+# Only deterministic outcomes (2xx and the 422 retake) are stored: a 5xx or an IDfy
+# failure / timeout is not, so a retry of the same capture runs the step again.
+# With a shared state backend the stored responses are seen by every worker, and a
+# claim in the shared state makes a duplicate on another worker wait for the result.
+
+KYC_IDEMPOTENCY_TTL = float(os.getenv("KYC_IDEMPOTENCY_TTL", "3600"))
+KYC_IDEMPOTENCY_SIZE = int(os.getenv("KYC_IDEMPOTENCY_SIZE", "10000"))
+# How long a claim by another worker is honoured before this one runs the step itself
+KYC_IDEMPOTENCY_CLAIM_TTL = float(os.getenv("KYC_IDEMPOTENCY_CLAIM_TTL", "300"))
+CLAIM_POLL_INTERVAL = 0.25
+STORED_STATUS_CODES = {422}
+
+router = APIRouter()
+
+completed = shared_cache("idempotency", maxsize=KYC_IDEMPOTENCY_SIZE, ttl=KYC_IDEMPOTENCY_TTL)
+claims = shared_state.namespace("idempotency-claim", KYC_IDEMPOTENCY_CLAIM_TTL) if shared_state.state.shared else None
+inflight = {}
+idempotency_stats = {"executed": 0, "coalesced": 0, "replayed": 0, "conflicts": 0}
+
+
+def request_fingerprint(kind, fields, images):
+    parts = [kind, fields.get("session_id") or ""]
+    parts += [f"{name}={content_hash(img_bytes)}" for name, img_bytes in sorted(images.items())]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def idempotency_key(request, kind, fingerprint):
+    header = request.headers.get("idempotency-key")
+    return f"{kind}:key:{header}" if header else f"{kind}:hash:{fingerprint}"
+
+
+def replayable(status_code):
+    return 200 <= status_code < 300 or status_code in STORED_STATUS_CODES
+
+
+def replay(stored, how):
+    return Response(base64.b64decode(stored["body"]), status_code=stored["status_code"],
+                    media_type=stored["media_type"], headers={"Idempotent-Replayed": how})
+
+
+def conflict():
+    idempotency_stats["conflicts"] += 1
+    return JSONResponse({"status": "idempotency_conflict",
+                         "error": "Idempotency-Key was already used with a different request"}, status_code=409)
+
+
+async def run_once(key, fingerprint, compute):
+    """Return compute()'s response, or the stored / in-flight one for the same key."""
+    stored = await offload(completed.get, key)
+    if stored is not None:
+        if stored["fingerprint"] != fingerprint:
+            return conflict()
+        idempotency_stats["replayed"] += 1
+        return replay(stored, "true")
+    if claims is not None and key not in inflight and not await offload(claims.add, key, fingerprint):
+        response = await wait_for_claim(key, fingerprint)
+        if response is not None:
+            return response
+
+    running = inflight.get(key)
+    if running is not None:
+        if running[0] != fingerprint:
+            return conflict()
+        idempotency_stats["coalesced"] += 1
+        # Shielded so a disconnecting duplicate does not cancel the shared work
+        return replay(await asyncio.shield(running[1]), "coalesced")
+
+    async def execute():
+        try:
+            response = await compute()
+            result = {"fingerprint": fingerprint, "body": base64.b64encode(response.body).decode(),
+                      "status_code": response.status_code, "media_type": response.media_type}
+            if replayable(response.status_code):
+                await offload(completed.set, key, result)
+            return result
+        finally:
+            if claims is not None:
+                await offload(claims.delete, key)
+
+    idempotency_stats["executed"] += 1
+    task = asyncio.ensure_future(execute())
+    inflight[key] = (fingerprint, task)
+    task.add_done_callback(lambda _: inflight.pop(key, None))
+    result = await asyncio.shield(task)
+    return Response(base64.b64decode(result["body"]), status_code=result["status_code"],
+                    media_type=result["media_type"])
+
+
+async def wait_for_claim(key, fingerprint):
+    """Wait for the worker holding the claim on key; None if it gave up without a result."""
+    deadline = time.monotonic() + KYC_IDEMPOTENCY_CLAIM_TTL
+    while time.monotonic() < deadline:
+        claimed = await offload(claims.get, key)
+        if claimed is not None and claimed != fingerprint:
+            return conflict()
+        stored = await offload(completed.get, key)
+        if stored is not None:
+            if stored["fingerprint"] != fingerprint:
+                return conflict()
+            idempotency_stats["coalesced"] += 1
+            return replay(stored, "coalesced")
+        # Released without a stored result (a failure) or expired: take the claim and run
+        if claimed is None and await offload(claims.add, key, fingerprint):
+            return None
+        await asyncio.sleep(CLAIM_POLL_INTERVAL)
+    return None
+
+
+@router.get("/kyc/idempotency/stats")
+def get_idempotency_stats():
+    return {**idempotency_stats, "inflight": len(inflight), "shared": claims is not None}
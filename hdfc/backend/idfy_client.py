@@ -0,0 +1,145 @@
+import os
+import time
+import asyncio
+import logging
+import httpx
+
+from backend.metrics import span, payload_bytes, idfy_polls
+from backend.idfy_governor import governor, PRIORITY_IN_PROGRESS, PRIORITY_NEW_SESSION
+
+log = logging.getLogger(__name__)
+
+# Shared async IDfy client: one pooled keep-alive connection pool per worker,
+# async task submit, and polling with exponential backoff until a terminal status.
+# Every call goes through the governor (rate limit, retries, circuit breaker).
+
+IDFY_BASE_URL = os.getenv("IDFY_BASE_URL", "https://eve.idfy.com")
+
+AADHAAR_EXTRACT = "/v3/tasks/async/extract/ind_aadhaar_plus"
+PAN_EXTRACT = "/v3/tasks/async/extract/ind_pan"
+FACE_LIVENESS = "/v3/tasks/async/check_photo_liveness/face"
+FACE_COMPARE = "/v3/tasks/async/compare/face"
+
+# path -> governor in-flight cap name
+ENDPOINTS = {AADHAAR_EXTRACT: "aadhaar", PAN_EXTRACT: "pan", FACE_LIVENESS: "liveness", FACE_COMPARE: "face_compare"}
+# Aadhaar starts a session; everything else belongs to a session already under way
+PRIORITIES = {AADHAAR_EXTRACT: PRIORITY_NEW_SESSION}
+
+TERMINAL_STATUSES = {"completed", "failed"}
+
+IDFY_MAX_CONNECTIONS = int(os.getenv("IDFY_MAX_CONNECTIONS", "100"))
+IDFY_POLL_INITIAL_DELAY = float(os.getenv("IDFY_POLL_INITIAL_DELAY", "1.0"))
+IDFY_POLL_MAX_DELAY = float(os.getenv("IDFY_POLL_MAX_DELAY", "4.0"))
+IDFY_POLL_BACKOFF = float(os.getenv("IDFY_POLL_BACKOFF", "1.5"))
+IDFY_POLL_DEADLINE = float(os.getenv("IDFY_POLL_DEADLINE", "30"))
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=IDFY_BASE_URL,
+            limits=httpx.Limits(
+                max_connections=IDFY_MAX_CONNECTIONS,
+                max_keepalive_connections=IDFY_MAX_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(15.0, connect=5.0),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def idfy_headers():
+    return {
+        'Content-Type': 'application/json',
+        'account-id': os.getenv("IDFY_ACCOUNT_ID", ""),
+        'api-key': os.getenv("IDFY_API_KEY", "")
+    }
+
+
+def failed_task(request_id, result, error, message):
+    """A terminal failed task, keeping any error details IDfy did send."""
+    result = result if isinstance(result, dict) else {}
+    return {
+        **result,
+        "request_id": request_id,
+        "status": "failed",
+        "error": result.get('error') or error,
+        "message": result.get('message') or message,
+    }
+
+
+def task_body(response, request_id=None):
+    """The JSON body of an IDfy response, or a failed task for error and non-JSON responses."""
+    body = None
+    if "json" in response.headers.get("content-type", ""):
+        try:
+            body = response.json()
+        except ValueError:
+            pass
+    if response.is_success and body is not None:
+        return body
+    if not response.is_success:
+        return failed_task(request_id, body, "IDFY_HTTP_ERROR", f"IDfy returned HTTP {response.status_code}")
+    return failed_task(request_id, body, "IDFY_BAD_RESPONSE", "IDfy returned a response that is not JSON")
+
+
+async def submit_task(path, task_id, group_id, data):
+    """Submit an async IDfy task and return the raw submit response."""
+    async with span("idfy_submit"):
+        response = await governor.call(lambda: get_client().post(
+            path,
+            json={"task_id": task_id, "group_id": group_id, "data": data},
+            headers=idfy_headers(),
+        ), PRIORITIES.get(path, PRIORITY_IN_PROGRESS), idempotent=False)
+    payload_bytes.observe(len(response.request.content), kind="idfy_submit")
+    return task_body(response)
+
+
+async def fetch_task(request_id):
+    """Fetch the current state of a task by request_id."""
+    async with span("idfy_poll"):
+        response = await governor.call(lambda: get_client().get(
+            "/v3/tasks", params={"request_id": request_id}, headers=idfy_headers()))
+    body = task_body(response, request_id)
+    return body[0] if isinstance(body, list) and len(body) > 0 else body
+
+
+async def wait_for_task(request_id, deadline=IDFY_POLL_DEADLINE):
+    """Poll a task with exponential backoff until it completes, fails or the deadline passes."""
+    delay = IDFY_POLL_INITIAL_DELAY
+    end = time.monotonic() + deadline
+    result = {}
+    polls = 0
+    while True:
+        await asyncio.sleep(max(0.0, min(delay, end - time.monotonic())))
+        result = await fetch_task(request_id)
+        polls += 1
+        if isinstance(result, dict) and result.get('status') in TERMINAL_STATUSES:
+            idfy_polls.observe(polls, outcome=result['status'])
+            return result
+        if time.monotonic() >= end:
+            break
+        delay = min(delay * IDFY_POLL_BACKOFF, IDFY_POLL_MAX_DELAY)
+
+    idfy_polls.observe(polls, outcome="timeout")
+    return failed_task(request_id, result, "IDFY_TIMEOUT", f"Task not finished after {deadline:.0f}s")
+
+
+async def run_task(path, task_id, group_id, data, deadline=IDFY_POLL_DEADLINE):
+    """Submit a task and wait for its terminal result, within the endpoint's in-flight cap."""
+    async with governor.task_slot(ENDPOINTS.get(path), PRIORITIES.get(path, PRIORITY_IN_PROGRESS)):
+        task = await submit_task(path, task_id, group_id, data)
+        request_id = task.get('request_id')
+        log.debug("idfy task submitted", extra={"endpoint": ENDPOINTS.get(path, path), "idfy_request_id": request_id})
+        if not request_id:
+            return task
+        return await wait_for_task(request_id, deadline=deadline)
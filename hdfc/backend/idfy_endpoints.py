@@ -1,22 +1,14 @@
 import os
-import requests
 from fastapi import APIRouter, Form
-from supabase import create_client, Client
+from backend import idfy_client
 
 router = APIRouter()
 
-IDFY_API_KEY = os.getenv("IDFY_API_KEY")
-IDFY_ACCOUNT_ID = os.getenv("IDFY_ACCOUNT_ID")
 IDFY_GROUP_ID = os.getenv("IDFY_GROUP_ID", "test_group")
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_API_KEY = os.getenv("SUPABASE_API_KEY")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_API_KEY)
 
 # Aadhaar OCR
 @router.post("/idfy/aadhaar")
-def idfy_aadhaar(session_id: str = Form(...), image_url: str = Form(...)):
-    url = "https://eve.idfy.com/v3/tasks/async/extract/ind_aadhaar_plus"
+async def idfy_aadhaar(session_id: str = Form(...), image_url: str = Form(...)):
     payload = {
         "task_id": session_id,
         "group_id": "aadhaar_ocr_plus",
@@ -29,18 +21,11 @@ def idfy_aadhaar(session_id: str = Form(...), image_url: str = Form(...)):
             }
         }
     }
-    headers = {
-        'Content-Type': 'application/json',
-        'account-id': IDFY_ACCOUNT_ID,
-        'api-key': IDFY_API_KEY
-    }
-    response = requests.post(url, json=payload, headers=headers)
-    return response.json()
+    return await idfy_client.submit_task(idfy_client.AADHAAR_EXTRACT, **payload)
 
 # PAN OCR
 @router.post("/idfy/pan")
-def idfy_pan(session_id: str = Form(...), image_url: str = Form(...)):
-    url = "https://eve.idfy.com/v3/tasks/async/extract/ind_pan"
+async def idfy_pan(session_id: str = Form(...), image_url: str = Form(...)):
     payload = {
         "task_id": session_id,
         "group_id": IDFY_GROUP_ID,
@@ -48,18 +33,11 @@ def idfy_pan(session_id: str = Form(...), image_url: str = Form(...)):
             "document1": image_url
         }
     }
-    headers = {
-        'Content-Type': 'application/json',
-        'account-id': IDFY_ACCOUNT_ID,
-        'api-key': IDFY_API_KEY
-    }
-    response = requests.post(url, json=payload, headers=headers)
-    return response.json()
+    return await idfy_client.submit_task(idfy_client.PAN_EXTRACT, **payload)
 
 # Liveness
 @router.post("/idfy/liveness")
-def idfy_liveness(session_id: str = Form(...), image_url: str = Form(...)):
-    url = "https://eve.idfy.com/v3/tasks/async/check_photo_liveness/face"
+async def idfy_liveness(session_id: str = Form(...), image_url: str = Form(...)):
     payload = {
         "task_id": session_id,
         "group_id": IDFY_GROUP_ID,
@@ -70,18 +48,11 @@ def idfy_liveness(session_id: str = Form(...), image_url: str = Form(...)):
             "detect_nsfw": True
         }
     }
-    headers = {
-        'Content-Type': 'application/json',
-        'account-id': IDFY_ACCOUNT_ID,
-        'api-key': IDFY_API_KEY
-    }
-    response = requests.post(url, json=payload, headers=headers)
-    return response.json()
+    return await idfy_client.submit_task(idfy_client.FACE_LIVENESS, **payload)
 
 # Face Match
 @router.post("/idfy/face_match")
-def idfy_face_match(session_id: str = Form(...), image1_url: str = Form(...), image2_url: str = Form(...)):
-    url = "https://eve.idfy.com/v3/tasks/async/compare/face"
+async def idfy_face_match(session_id: str = Form(...), image1_url: str = Form(...), image2_url: str = Form(...)):
     payload = {
         "task_id": session_id,
         "group_id": IDFY_GROUP_ID,
@@ -90,12 +61,6 @@ def idfy_face_match(session_id: str = Form(...), image1_url: str = Form(...), im
             "document2": image2_url
         }
     }
-    headers = {
-        'Content-Type': 'application/json',
-        'account-id': IDFY_ACCOUNT_ID,
-        'api-key': IDFY_API_KEY
-    }
-    response = requests.post(url, json=payload, headers=headers)
-    return response.json()
+    return await idfy_client.submit_task(idfy_client.FACE_COMPARE, **payload)
 
 # ...existing code...
@@ -0,0 +1,287 @@
+import os
+import logging
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import httpx
+from fastapi import APIRouter
+
+from backend.metrics import retries_total
+
+# Shared governor for outbound IDfy traffic, used by backend.idfy_client:
+#   - a token bucket (IDFY_RATE_PER_SEC, IDFY_BURST) over every submit and poll call
+#   - per-endpoint caps on tasks in flight (IDFY_MAX_INFLIGHT_<ENDPOINT>)
+#   - priority ordering for both, so steps of sessions already under way (PAN, face)
+#     go ahead of new sessions (Aadhaar)
+#   - retries with full jitter, honouring Retry-After: polls on 429, 5xx and transport
+#     errors; submits (which create a billed task) only on 429 and connection failures
+#   - a circuit breaker that fails fast with IdfyDegraded after repeated failures
+
+IDFY_RATE_PER_SEC = float(os.getenv("IDFY_RATE_PER_SEC", "20"))
+IDFY_BURST = float(os.getenv("IDFY_BURST", "40"))
+IDFY_RETRY_ATTEMPTS = int(os.getenv("IDFY_RETRY_ATTEMPTS", "3"))
+IDFY_RETRY_BASE_DELAY = float(os.getenv("IDFY_RETRY_BASE_DELAY", "0.5"))
+IDFY_RETRY_MAX_DELAY = float(os.getenv("IDFY_RETRY_MAX_DELAY", "8"))
+IDFY_BREAKER_THRESHOLD = int(os.getenv("IDFY_BREAKER_THRESHOLD", "5"))
+IDFY_BREAKER_COOLDOWN = float(os.getenv("IDFY_BREAKER_COOLDOWN", "30"))
+
+# Lower runs first
+PRIORITY_IN_PROGRESS = 0
+PRIORITY_NEW_SESSION = 1
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# A submit that hit a 5xx or timed out mid-request may already have created the task
+SUBMIT_RETRY_STATUSES = {429}
+# Failures where the request never reached IDfy
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+log = logging.getLogger(__name__)
+router = APIRouter()
+
+
+class IdfyDegraded(Exception):
+    """IDfy is failing; raised without calling it until the breaker cools down."""
+
+    status_code = 503
+
+    def __init__(self, retry_after):
+        super().__init__(f"IDfy is degraded, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class RetryableResponse(Exception):
+    def __init__(self, response):
+        super().__init__(f"IDfy returned HTTP {response.status_code}")
+        self.response = response
+
+
+class PriorityGate:
+    """Hands out permits to the lowest (priority, arrival) waiter first."""
+
+    def __init__(self):
+        self.waiters = []
+        self.seq = itertools.count()
+
+    def _wait(self, priority):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.seq), future))
+        return future
+
+    def _grant_next(self):
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return True
+        return False
+
+
+class PrioritySemaphore(PriorityGate):
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+        self.in_use = 0
+
+    async def acquire(self, priority):
+        if self.in_use < self.limit and not self.waiters:
+            self.in_use += 1
+            return
+        future = self._wait(priority)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled; pass the permit on
+                self.release()
+            raise
+
+    def release(self):
+        # The permit moves straight to the next waiter, else goes back to the pool
+        if not self._grant_next():
+            self.in_use -= 1
+
+
+class TokenBucket(PriorityGate):
+    def __init__(self, rate, burst):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._timer = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, priority):
+        self._refill()
+        if self.tokens >= 1 and not self.waiters:
+            self.tokens -= 1
+            return
+        future = self._wait(priority)
+        if self._timer is None:
+            self._dispatch()
+        await future
+
+    def _dispatch(self):
+        self._timer = None
+        self._refill()
+        while self.waiters and self.tokens >= 1:
+            if self._grant_next():
+                self.tokens -= 1
+        if self.waiters and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later((1 - self.tokens) / self.rate, self._dispatch)
+
+
+class CircuitBreaker:
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = None  # token of the call running the half-open trial
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() - self.opened_at < self.cooldown else "half_open"
+
+    def check(self):
+        """Raise IdfyDegraded if the call may not go out; returns a token if it is the trial."""
+        state = self.state
+        if state == "open" or (state == "half_open" and self.trial is not None):
+            raise IdfyDegraded(max(1.0, self.cooldown - (time.monotonic() - self.opened_at)))
+        if state == "half_open":
+            # One trial call decides whether to close again
+            self.trial = object()
+            return self.trial
+        return None
+
+    def release(self, trial):
+        """End the trial started by check(); a no-op for any other call."""
+        if trial is not None and self.trial is trial:
+            self.trial = None
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold or self.opened_at is not None:
+            if self.opened_at is None:
+                log.warning("idfy circuit opened", extra={"failures": self.failures})
+            self.opened_at = time.monotonic()
+
+
+def retry_delay(attempt, response=None):
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), IDFY_RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    # Full jitter: spreads retries from many sessions instead of synchronising them
+    return random.uniform(0, min(IDFY_RETRY_MAX_DELAY, IDFY_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class Governor:
+    def __init__(self, rate, burst, inflight_limits):
+        self.bucket = TokenBucket(rate, burst)
+        self.inflight = {name: PrioritySemaphore(limit) for name, limit in inflight_limits.items()}
+        self.breaker = CircuitBreaker(IDFY_BREAKER_THRESHOLD, IDFY_BREAKER_COOLDOWN)
+        self.stats = {"calls": 0, "retries": 0, "failures": 0, "rejected": 0}
+
+    async def call(self, send, priority=PRIORITY_IN_PROGRESS, idempotent=True):
+        """Run one IDfy HTTP call (``send`` returns an httpx.Response) under the governor.
+
+        Pass ``idempotent=False`` for calls that must not be repeated once IDfy may have
+        received them; those are retried only on 429 and connection failures.
+        """
+        retry_statuses = RETRY_STATUSES if idempotent else SUBMIT_RETRY_STATUSES
+        retry_errors = httpx.TransportError if idempotent else UNSENT_ERRORS
+        for attempt in range(IDFY_RETRY_ATTEMPTS + 1):
+            try:
+                trial = self.breaker.check()
+            except IdfyDegraded:
+                self.stats["rejected"] += 1
+                raise
+            response = None
+            try:
+                await self.bucket.acquire(priority)
+                self.stats["calls"] += 1
+                response = await send()
+                if response.status_code in RETRY_STATUSES:
+                    raise RetryableResponse(response)
+                self.breaker.success()
+                return response
+            except (RetryableResponse, httpx.TransportError) as e:
+                self.breaker.failure()
+                if response is not None:
+                    retryable = response.status_code in retry_statuses
+                else:
+                    retryable = isinstance(e, retry_errors)
+                if attempt == IDFY_RETRY_ATTEMPTS or not retryable:
+                    self.stats["failures"] += 1
+                    if response is not None:
+                        # Out of retries (or not safe to retry); hand the error response back
+                        return response
+                    raise
+                self.stats["retries"] += 1
+                retries_total.inc(dependency="idfy")
+                delay = retry_delay(attempt, response)
+                log.info("idfy call retried", extra={"attempt": attempt + 1, "attempts": IDFY_RETRY_ATTEMPTS,
+                                                     "delay_s": round(delay, 2), "error": str(e)})
+                await asyncio.sleep(delay)
+            finally:
+                # Also on cancellation (even while waiting for a token), so a trial never hangs
+                self.breaker.release(trial)
+
+    def task_slot(self, endpoint, priority):
+        return TaskSlot(self.inflight.get(endpoint), priority)
+
+    def snapshot(self):
+        self.bucket._refill()
+        return {
+            **self.stats,
+            "breaker": self.breaker.state,
+            "tokens": round(self.bucket.tokens, 2),
+            "waiting_for_tokens": len(self.bucket.waiters),
+            "inflight": {name: {"in_use": s.in_use, "limit": s.limit, "waiting": len(s.waiters)}
+                         for name, s in self.inflight.items()},
+        }
+
+
+class TaskSlot:
+    """``async with`` holding one in-flight permit for an endpoint (no-op for unknown ones)."""
+
+    def __init__(self, semaphore, priority):
+        self.semaphore = semaphore
+        self.priority = priority
+
+    async def __aenter__(self):
+        if self.semaphore is not None:
+            await self.semaphore.acquire(self.priority)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.semaphore is not None:
+            self.semaphore.release()
+        return False
+
+
+governor = Governor(IDFY_RATE_PER_SEC, IDFY_BURST, {
+    "aadhaar": int(os.getenv("IDFY_MAX_INFLIGHT_AADHAAR", "20")),
+    "pan": int(os.getenv("IDFY_MAX_INFLIGHT_PAN", "20")),
+    "face_compare": int(os.getenv("IDFY_MAX_INFLIGHT_FACE_COMPARE", "20")),
+    "liveness": int(os.getenv("IDFY_MAX_INFLIGHT_LIVENESS", "20")),
+})
+
+
+@router.get("/idfy/governor")
+def governor_stats():
+    return governor.snapshot()
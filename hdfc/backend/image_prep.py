@@ -0,0 +1,94 @@
+import os
+
+# Image normalization before upload: decode once, auto-orient, optionally crop to the
+# document or face region, downscale to what IDfy needs and recompress.
+# Runs inside the worker process pool (see backend.workers). OpenCV and numpy are
+# imported inside the functions, so the API process, which only dispatches work to the
+# pool, never pays for loading them.
+
+KYC_IMAGE_MAX_SIDE = int(os.getenv("KYC_IMAGE_MAX_SIDE", "1600"))
+KYC_FACE_MAX_SIDE = int(os.getenv("KYC_FACE_MAX_SIDE", "800"))
+KYC_IMAGE_FORMAT = os.getenv("KYC_IMAGE_FORMAT", "jpeg")
+KYC_IMAGE_QUALITY = int(os.getenv("KYC_IMAGE_QUALITY", "85"))
+KYC_IMAGE_CROP = os.getenv("KYC_IMAGE_CROP", "false").lower() in ("1", "true", "yes")
+
+# format -> (extension, content type, name of the cv2 quality flag)
+FORMATS = {
+    "jpeg": ("jpg", "image/jpeg", "IMWRITE_JPEG_QUALITY"),
+    "webp": ("webp", "image/webp", "IMWRITE_WEBP_QUALITY"),
+    "png": ("png", "image/png", None),
+}
+
+
+def decode(img_bytes):
+    import cv2
+    import numpy as np
+    # IMREAD_COLOR applies the EXIF orientation tag, so phone photos come out upright
+    img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Invalid image data")
+    return img
+
+
+def downscale(img, max_side):
+    import cv2
+    h, w = img.shape[:2]
+    scale = max_side / max(h, w)
+    if scale >= 1:
+        return img, 1.0
+    return cv2.resize(img, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA), scale
+
+
+def expand_box(box, margin, shape):
+    x, y, w, h = box
+    dx, dy = int(w * margin), int(h * margin)
+    x0, y0 = max(0, x - dx), max(0, y - dy)
+    x1, y1 = min(shape[1], x + w + dx), min(shape[0], y + h + dy)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def crop_document(img, min_area_ratio=0.2):
+    """Crop to the largest card-like contour; returns the image unchanged if none is found."""
+    import cv2
+    small, scale = downscale(img, 640)
+    gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+    edges = cv2.dilate(cv2.Canny(gray, 50, 150), None, iterations=2)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return img
+    largest = max(contours, key=cv2.contourArea)
+    x, y, w, h = cv2.boundingRect(largest)
+    if w * h < min_area_ratio * small.shape[0] * small.shape[1]:
+        return img
+    box = tuple(int(v / scale) for v in (x, y, w, h))
+    x, y, w, h = expand_box(box, 0.03, img.shape)
+    return img[y:y + h, x:x + w]
+
+
+def crop_face(img, margin=0.5):
+    """Crop to the largest face plus a margin (liveness checks need some context)."""
+    from backend.face_detect import detect_largest_face
+    box = detect_largest_face(img)
+    if box is None:
+        return img
+    x, y, w, h = expand_box(box, margin, img.shape)
+    return img[y:y + h, x:x + w]
+
+
+def normalize_image(img_bytes, doc_type, max_side=None, fmt=KYC_IMAGE_FORMAT,
+                    quality=KYC_IMAGE_QUALITY, crop=KYC_IMAGE_CROP):
+    """Return (bytes, content_type, extension) of the normalized image."""
+    import cv2
+    img = decode(img_bytes)
+    if crop:
+        img = crop_face(img) if doc_type == "face" else crop_document(img)
+    if max_side is None:
+        max_side = KYC_FACE_MAX_SIDE if doc_type == "face" else KYC_IMAGE_MAX_SIDE
+    img, _ = downscale(img, max_side)
+
+    ext, content_type, quality_flag = FORMATS[fmt]
+    params = [getattr(cv2, quality_flag), quality] if quality_flag is not None else []
+    success, encoded = cv2.imencode(f".{ext}", img, params)
+    if not success:
+        raise ValueError(f"Failed to encode image as {fmt}")
+    return encoded.tobytes(), content_type, ext
@@ -0,0 +1,301 @@
+import os
+import logging
+import json
+import time
+import asyncio
+from uuid import uuid4
+
+import httpx
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from backend import shared_state
+from backend.shared_state import offload
+from backend.metrics import detach_request
+from backend.logs import request_id_var, session_id_var
+
+# In-process KYC job queue: endpoints enqueue a step and return a job id at once,
+# a bounded worker pool runs the steps, and clients follow progress via
+# GET /kyc/jobs/{id}, a server-sent-events stream, or an optional webhook.
+# With a shared state backend (KYC_SHARED_STATE) job records are visible to every
+# worker: a job runs where it was submitted, and other workers poll its record.
+
+KYC_JOB_WORKERS = int(os.getenv("KYC_JOB_WORKERS", "16"))
+KYC_JOB_QUEUE_SIZE = int(os.getenv("KYC_JOB_QUEUE_SIZE", "1000"))
+KYC_JOB_TTL = float(os.getenv("KYC_JOB_TTL", "3600"))
+SSE_KEEPALIVE = 15.0
+SHARED_POLL_INTERVAL = 0.5
+
+TERMINAL_JOB_STATUSES = {"completed", "failed"}
+
+log = logging.getLogger(__name__)
+router = APIRouter()
+
+
+class QueueFull(Exception):
+    pass
+
+
+class InMemoryJobStore:
+    """Job records kept in a dict, for a single worker process."""
+
+    shared = False
+
+    def __init__(self, ttl=KYC_JOB_TTL):
+        self.ttl = ttl
+        self.jobs = {}
+
+    def put(self, job):
+        self.jobs[job["job_id"]] = job
+        self._expire()
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None and self._expired(job, time.time() - self.ttl):
+            del self.jobs[job_id]
+            return None
+        return job
+
+    def session_job(self, session_id, kind):
+        return None
+
+    @staticmethod
+    def _expired(job, cutoff):
+        return job["status"] in TERMINAL_JOB_STATUSES and job["finished_at"] < cutoff
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [j for j, job in self.jobs.items() if self._expired(job, cutoff)]:
+            del self.jobs[job_id]
+
+
+class SharedJobStore:
+    """Job records in the shared state, so any worker can report on any job."""
+
+    shared = True
+    blocking = True
+
+    def __init__(self, ttl=KYC_JOB_TTL):
+        self.jobs = shared_state.namespace("job", ttl)
+        self.sessions = shared_state.namespace("session-job", ttl)
+
+    def put(self, job):
+        self.jobs.set(job["job_id"], job)
+        if job["status"] not in TERMINAL_JOB_STATUSES:
+            self.sessions.set(f"{job['session_id']}:{job['kind']}", job["job_id"])
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def session_job(self, session_id, kind):
+        """Id of the session's latest job of this kind, submitted on any worker."""
+        return self.sessions.get(f"{session_id}:{kind}")
+
+
+class JobQueue:
+    def __init__(self, workers=KYC_JOB_WORKERS, maxsize=KYC_JOB_QUEUE_SIZE, store=None):
+        self.workers = workers
+        self.maxsize = maxsize
+        self.store = store or (SharedJobStore() if shared_state.state.shared else InMemoryJobStore())
+        self.queue = None
+        self.tasks = []
+        self.subscribers = {}
+        self.pending = {}
+        self.session_jobs = {}
+        # job id -> webhook URL of every job submitted here and not yet finished
+        self.active = {}
+
+    def _ensure_started(self):
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.maxsize)
+            self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stop the workers and fail every job that was still queued or running."""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.queue = None
+        notify = []
+        for job_id, callback_url in list(self.active.items()):
+            job = await self.get(job_id)
+            if job is not None and job["status"] not in TERMINAL_JOB_STATUSES:
+                # Subscribers hear of it through _update, webhooks below
+                job = await self._update(job, status="failed", status_code=503,
+                                         error="server shut down before the job finished", finished_at=time.time())
+                if callback_url:
+                    notify.append(self._notify(callback_url, job))
+        self.active.clear()
+        await asyncio.gather(*notify)
+        # Anything still waiting on a job of this process would otherwise wait forever
+        for event in self.pending.values():
+            event.set()
+        self.pending.clear()
+
+    async def submit(self, kind, session_id, step, *args, callback_url=None, after=None):
+        """Enqueue step(*args) and return the new job record; raises QueueFull when saturated.
+
+        ``after`` is an optional job id that must finish before this job starts.
+        """
+        self._ensure_started()
+        job = {
+            "job_id": str(uuid4()),
+            "kind": kind,
+            "session_id": session_id,
+            "status": "queued",
+            "status_code": None,
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        if self.queue.full():
+            raise QueueFull(f"KYC job queue is full ({self.maxsize})")
+        self.pending[job["job_id"]] = asyncio.Event()
+        self.session_jobs[(session_id, kind)] = job["job_id"]
+        self.active[job["job_id"]] = callback_url
+        # Stored before it is queued, so a worker's updates always come after this record
+        await offload(self.store.put, job)
+        # The submitting request's id follows the job into its log records
+        self.queue.put_nowait((job, step, args, callback_url, after, request_id_var.get()))
+        return job
+
+    async def get(self, job_id):
+        return await offload(self.store.get, job_id)
+
+    async def pending_job(self, session_id, kind):
+        """Id of the unfinished job of this kind for the session, if any."""
+        job_id = self.session_jobs.get((session_id, kind))
+        if job_id in self.pending:
+            return job_id
+        job_id = await offload(self.store.session_job, session_id, kind)
+        job = await self.get(job_id) if job_id else None
+        return job_id if job and job["status"] not in TERMINAL_JOB_STATUSES else None
+
+    async def wait(self, job_id):
+        event = self.pending.get(job_id)
+        if event is not None:
+            await event.wait()
+            return
+        # Submitted on another worker: follow its record in the shared store
+        while (job := await self.get(job_id)) is not None and job["status"] not in TERMINAL_JOB_STATUSES:
+            await asyncio.sleep(SHARED_POLL_INTERVAL)
+
+    async def _update(self, job, **fields):
+        job = {**job, **fields}
+        await offload(self.store.put, job)
+        for subscriber in self.subscribers.get(job["job_id"], []):
+            subscriber.put_nowait(job)
+        if job["status"] in TERMINAL_JOB_STATUSES:
+            self.pending.pop(job["job_id"]).set()
+            if self.session_jobs.get((job["session_id"], job["kind"])) == job["job_id"]:
+                del self.session_jobs[(job["session_id"], job["kind"])]
+        return job
+
+    async def _worker(self):
+        # Workers are started from whichever request submits first; don't report into it
+        detach_request()
+        while True:
+            job, step, args, callback_url, after, request_id = await self.queue.get()
+            job_id = job["job_id"]
+            request_id_var.set(request_id)
+            session_id_var.set(job["session_id"])
+            try:
+                if after:
+                    await self.wait(after)
+                job = await self._update(job, status="running", started_at=time.time())
+                body, status_code = await step(*args)
+                job = await self._update(job,
+                    status="completed" if status_code < 400 else "failed",
+                    status_code=status_code, result=body, finished_at=time.time())
+            except Exception as e:
+                log.error("kyc job failed", extra={"job_id": job_id, "error": str(e)})
+                job = await self._update(job, status="failed", status_code=getattr(e, "status_code", 500),
+                    error=str(e), finished_at=time.time())
+            finally:
+                self.queue.task_done()
+            if callback_url:
+                await self._notify(callback_url, job)
+            self.active.pop(job_id, None)
+
+    async def _notify(self, callback_url, job):
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                await client.post(callback_url, json=job)
+        except Exception as e:
+            log.warning("kyc job webhook failed", extra={"job_id": job["job_id"], "callback_url": callback_url, "error": str(e)})
+
+    async def events(self, job_id):
+        """Yield job snapshots as they change until the job reaches a terminal status."""
+        updates = asyncio.Queue()
+        self.subscribers.setdefault(job_id, []).append(updates)
+        # Jobs running on another worker only change in the shared store, so poll it
+        timeout = SSE_KEEPALIVE if job_id in self.pending or not self.store.shared else SHARED_POLL_INTERVAL
+        try:
+            job = await self.get(job_id)
+            last = None
+            while job is not None:
+                if job != last:
+                    yield job
+                    last = job
+                if job["status"] in TERMINAL_JOB_STATUSES:
+                    break
+                try:
+                    job = await asyncio.wait_for(updates.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    job = await self.get(job_id)
+                    if job == last:
+                        yield None
+        finally:
+            self.subscribers[job_id].remove(updates)
+            if not self.subscribers[job_id]:
+                del self.subscribers[job_id]
+
+
+job_queue = JobQueue()
+
+
+async def enqueue_step(kind, session_id, step, *args, callback_url=None, after_kind=None):
+    """Enqueue a KYC step and build the immediate 202 response for it.
+
+    ``after_kind`` orders the job behind the session's unfinished job of that kind
+    (face matching needs the Aadhaar image stored first).
+    """
+    after = await job_queue.pending_job(session_id, after_kind) if after_kind else None
+    try:
+        job = await job_queue.submit(kind, session_id, step, *args, callback_url=callback_url, after=after)
+    except QueueFull as e:
+        return JSONResponse({"session_id": session_id, "status": "busy", "error": str(e)}, status_code=503)
+    return JSONResponse({
+        "session_id": session_id,
+        "job_id": job["job_id"],
+        "status": "queued",
+        "status_url": f"/kyc/jobs/{job['job_id']}",
+        "events_url": f"/kyc/jobs/{job['job_id']}/events",
+    }, status_code=202)
+
+
+@router.get("/kyc/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "job not found"}, status_code=404)
+    return job
+
+
+@router.get("/kyc/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    if await job_queue.get(job_id) is None:
+        return JSONResponse({"error": "job not found"}, status_code=404)
+
+    async def stream():
+        async for job in job_queue.events(job_id):
+            if job is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: job\ndata: {json.dumps(job)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,382 @@
+import time
+import asyncio
+import logging
+
+from backend import idfy_client, kyc_repository, prefetch, consistency
+from backend.content_cache import content_hash, upload_cache, extraction_cache
+from backend.image_prep import normalize_image
+from backend.face_detect import extract_face
+from backend.workers import run_in_process
+from backend.metrics import span
+from backend.clients import get_supabase
+from backend.logs import bind
+
+log = logging.getLogger(__name__)
+
+# KYC step logic shared by the synchronous /kyc/process-* endpoints and the job queue.
+# Each step returns (response_body, status_code).
+
+
+async def prepare_image(img_bytes, doc_type):
+    """Normalize the image in the process pool; falls back to the original PNG bytes."""
+    try:
+        return await run_in_process(normalize_image, img_bytes, doc_type)
+    except Exception as e:
+        log.warning("image normalization skipped", extra={"doc_type": doc_type, "error": str(e)})
+        return img_bytes, "image/png", "png"
+
+
+def upload_object(data, file_path, content_type):
+    supabase = get_supabase()
+    with span("storage_upload", size=len(data), kind="kyc_document"):
+        supabase.storage.from_('kyc_document').upload(file_path, data, {"content-type": content_type, "upsert": "true"})
+    return supabase.storage.from_('kyc_document').get_public_url(file_path)
+
+
+async def cache_get(cache, key):
+    """Memory tier on the event loop; the persistent tier (SQLite / Redis) in a thread."""
+    if cache.persistent is None:
+        return cache.get(key)
+    value = cache.get_memory(key)
+    if value is None:
+        value = await asyncio.to_thread(cache.get, key)
+    return value
+
+
+async def cache_set(cache, key, value):
+    if cache.persistent is None:
+        cache.set(key, value)
+    else:
+        await asyncio.to_thread(cache.set, key, value)
+
+
+async def upload_image(img_bytes, doc_type, digest=None):
+    # Objects are named by the hash of the captured bytes, so re-uploads of identical
+    # captures reuse them without normalizing or uploading again
+    digest = digest or content_hash(img_bytes)
+    cache_key = f"{doc_type}:{digest}"
+    url = await cache_get(upload_cache, cache_key)
+    if url:
+        return url
+
+    data, content_type, ext = await prepare_image(img_bytes, doc_type)
+    url = await asyncio.to_thread(upload_object, data, f"{digest}_{doc_type}.{ext}", content_type)
+    await cache_set(upload_cache, cache_key, url)
+    return url
+
+
+async def upload_aadhaar_face(img_bytes, digest):
+    """Crop the photo off the Aadhaar card and upload it, so face match compares two small faces.
+
+    Returns None when no face is found; face match then falls back to the full card image.
+    """
+    url = await cache_get(upload_cache, f"aadhaar_face:{digest}")
+    if url:
+        return url
+    try:
+        face = await extract_face(img_bytes)
+        return await upload_image(face, "aadhaar_face", digest) if face else None
+    except Exception as e:
+        log.warning("aadhaar face crop skipped", extra={"error": str(e)})
+        return None
+
+
+async def cached_extraction(path, digest, task_id, data):
+    """Run an IDfy extraction, reusing the stored output for identical image bytes.
+
+    Only successful results are cached so failed extractions are retried.
+    """
+    cache_key = f"{path}:{digest}"
+    result = await cache_get(extraction_cache, cache_key)
+    if result is not None:
+        log.debug("extraction cache hit", extra={"endpoint": idfy_client.ENDPOINTS.get(path, path), "digest": digest[:12]})
+        return result
+    result = await idfy_client.run_task(path, task_id=task_id, group_id="kyc_group", data=data)
+    if not task_failed(result):
+        await cache_set(extraction_cache, cache_key, result)
+    return result
+
+
+def task_failed(result):
+    return bool(result.get('error')) or result.get('status') == 'failed'
+
+
+def extraction_output(result):
+    if result.get('result') and result['result'].get('extraction_output'):
+        return result['result']['extraction_output']
+    return {}
+
+
+def aadhaar_document(session_id, image_url, result, face_crop_url=None):
+    if task_failed(result):
+        extracted_data = {
+            "full_response": result,
+            "error": result.get('error'),
+            "error_message": result.get('message', 'Unknown error')
+        }
+    else:
+        extracted = extraction_output(result)
+        extracted_data = {
+            "full_response": result,
+            "full_name": extracted.get('name_on_card'),
+            "aadhaar_number": extracted.get('id_number'),
+            "dob": extracted.get('date_of_birth'),
+            "gender": extracted.get('gender'),
+            "address": extracted.get('address')
+        }
+    if face_crop_url:
+        extracted_data["face_crop_url"] = face_crop_url
+    return {"session_id": session_id, "doc_type": "aadhaar", "image_url": image_url,
+            "extracted_data": extracted_data}
+
+
+def pan_document(session_id, image_url, result):
+    extracted = extraction_output(result)
+    return {
+        "session_id": session_id,
+        "doc_type": "pan",
+        "image_url": image_url,
+        "extracted_data": {
+            "full_response": result,
+            "full_name": extracted.get('name_on_card'),
+            "pan_number": extracted.get('id_number'),
+            "dob": extracted.get('date_of_birth')
+        }
+    }
+
+
+def face_check(session_id, face_match_result, liveness_result=None, risk_flag=False):
+    return {
+        "session_id": session_id,
+        "liveness_result": liveness_result or {},
+        "face_match_result": face_match_result,
+        "risk_flag": risk_flag
+    }
+
+
+async def risk_flag(session_id, documents=()):
+    """Cross-document consistency flag for the face check row (False if it cannot be scored)."""
+    try:
+        return (await consistency.assess_session(session_id, documents))["risk_flag"]
+    except Exception as e:
+        log.warning("consistency check skipped", extra={"error": str(e)})
+        return False
+
+
+async def run_aadhaar_step(session_id, img_bytes):
+    digest = content_hash(img_bytes)
+    # The face crop for the later face match runs alongside upload and OCR
+    face_crop = asyncio.create_task(upload_aadhaar_face(img_bytes, digest))
+    aadhaar_url = await upload_image(img_bytes, "aadhaar", digest)
+    return await verify_aadhaar(session_id, aadhaar_url, digest, face_crop)
+
+
+async def verify_aadhaar(session_id, aadhaar_url, digest, face_crop=None):
+    """OCR an already stored Aadhaar image and record the result.
+
+    ``digest`` keys the extraction cache; ``face_crop`` is an optional task for the URL of
+    the cropped photo. The response does not wait for it: a crop still running when OCR
+    returns is finished in the background and picked up by the face step.
+    """
+    bind(session_id)
+    aadhaar_result = await cached_extraction(idfy_client.AADHAAR_EXTRACT, digest,
+        task_id=session_id + "_aadhaar", data={"document1": aadhaar_url, "consent": "yes"})
+    crop_pending = face_crop is not None and not face_crop.done()
+    face_crop_url = face_crop.result() if face_crop is not None and not crop_pending else None
+
+    log.info("aadhaar extraction finished", extra={"task_status": aadhaar_result.get("status"), "payload": aadhaar_result})
+
+    try:
+        await kyc_repository.create_session(session_id)
+    except Exception as e:
+        log.warning("session creation failed", extra={"error": str(e)})
+
+    # Store extracted fields, or the error information if IDfy failed
+    try:
+        await kyc_repository.insert_documents(
+            [aadhaar_document(session_id, aadhaar_url, aadhaar_result, face_crop_url)])
+        log.info("aadhaar stored")
+    except Exception as e:
+        log.error("storing aadhaar failed", extra={"error": str(e)})
+    await consistency.refresh_risk_flag(session_id)
+    if crop_pending:
+        # Started after the row so the crop URL replaces the full image remembered for it
+        prefetch.spawn("aadhaar_face", session_id, prefetch.finish_face_crop(session_id, face_crop))
+    await prefetch.after_document(session_id, "aadhaar")
+
+    if task_failed(aadhaar_result):
+        error_msg = aadhaar_result.get('message', 'Unknown error')
+        log.warning("aadhaar extraction failed", extra={"error": error_msg})
+        return {
+            "session_id": session_id,
+            "status": "aadhaar_failed",
+            "error": error_msg
+        }, 400
+
+    return {"session_id": session_id, "status": "aadhaar_processed"}, 200
+
+
+async def run_pan_step(session_id, img_bytes):
+    digest = content_hash(img_bytes)
+    pan_url = await upload_image(img_bytes, "pan", digest)
+    return await verify_pan(session_id, pan_url, digest)
+
+
+async def verify_pan(session_id, pan_url, digest):
+    bind(session_id)
+    pan_result = await cached_extraction(idfy_client.PAN_EXTRACT, digest,
+        task_id=session_id + "_pan", data={"document1": pan_url})
+
+    log.info("pan extraction finished", extra={"task_status": pan_result.get("status"), "payload": pan_result})
+
+    try:
+        await kyc_repository.insert_documents([pan_document(session_id, pan_url, pan_result)])
+        log.info("pan stored")
+    except Exception as e:
+        log.error("storing pan failed", extra={"error": str(e)})
+    await consistency.refresh_risk_flag(session_id)
+    await prefetch.after_document(session_id, "pan")
+
+    return {"session_id": session_id, "status": "pan_processed"}, 200
+
+
+async def run_face_step(session_id, img_bytes):
+    face_url = await upload_image(img_bytes, "face")
+    return await verify_face(session_id, face_url)
+
+
+async def verify_face(session_id, face_url):
+    bind(session_id)
+    # Aadhaar face crop (or full image) URL, remembered from the Aadhaar step
+    await prefetch.wait_for("aadhaar_face", session_id)
+    aadhaar_url = await kyc_repository.aadhaar_image(session_id)
+
+    face_match_result, flagged = await asyncio.gather(idfy_client.run_task(idfy_client.FACE_COMPARE,
+        task_id=session_id + "_face", group_id="kyc_group",
+        data={"document1": aadhaar_url, "document2": face_url}), risk_flag(session_id))
+
+    log.info("face match finished", extra={"task_status": face_match_result.get("status"), "risk_flag": flagged,
+                                           "payload": face_match_result})
+
+    try:
+        await kyc_repository.insert_face_check(face_check(session_id, face_match_result, risk_flag=flagged))
+        log.info("face check stored")
+    except Exception as e:
+        log.error("storing face check failed", extra={"error": str(e)})
+
+    return {"session_id": session_id, "status": "face_processed"}, 200
+
+
+class StageTimer:
+    """Records start/end offsets of concurrent stages so the critical path is visible."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.stages = {}
+
+    async def run(self, name, phase, awaitable):
+        start = time.perf_counter() - self.origin
+        try:
+            return await awaitable
+        finally:
+            end = time.perf_counter() - self.origin
+            self.stages[name] = {"phase": phase, "start_ms": round(start * 1000, 1),
+                                 "end_ms": round(end * 1000, 1), "duration_ms": round((end - start) * 1000, 1)}
+
+    def summary(self):
+        # The critical path is the slowest stage of each phase, in phase order
+        critical_path = []
+        for phase in dict.fromkeys(stage["phase"] for stage in self.stages.values()):
+            in_phase = {n: st for n, st in self.stages.items() if st["phase"] == phase}
+            critical_path.append(max(in_phase, key=lambda n: in_phase[n]["end_ms"]))
+        return {
+            "stages": self.stages,
+            "critical_path": critical_path,
+            "total_ms": round((time.perf_counter() - self.origin) * 1000, 1),
+        }
+
+
+async def run_session_step(session_id, images):
+    """Process any of aadhaar/pan/face images for one session with all remote work fanned out.
+
+    Uploads run concurrently, then Aadhaar OCR, PAN OCR, liveness and face match run
+    concurrently, and every row is written in a single pass at the end.
+    """
+    bind(session_id)
+    timer = StageTimer()
+
+    doc_types = [d for d in ("aadhaar", "pan", "face") if images.get(d)]
+    digests = {d: content_hash(images[d]) for d in doc_types}
+    uploads = {d: timer.run(f"upload_{d}", "upload", upload_image(images[d], d, digests[d]))
+               for d in doc_types}
+    if "aadhaar" in images:
+        uploads["aadhaar_face"] = timer.run("crop_aadhaar_face", "upload",
+                                            upload_aadhaar_face(images["aadhaar"], digests["aadhaar"]))
+    urls = dict(zip(uploads, await asyncio.gather(*uploads.values())))
+
+    aadhaar_url = urls.get("aadhaar_face") or urls.get("aadhaar")
+    if "face" in urls and not aadhaar_url:
+        # Aadhaar was sent in an earlier request; match against the stored image
+        aadhaar_url = await timer.run("lookup_aadhaar", "upload",
+                                      kyc_repository.aadhaar_image(session_id))
+
+    tasks = {}
+    if "aadhaar" in urls:
+        tasks["aadhaar"] = timer.run("idfy_aadhaar", "verify", cached_extraction(
+            idfy_client.AADHAAR_EXTRACT, digests["aadhaar"],
+            task_id=session_id + "_aadhaar", data={"document1": urls["aadhaar"], "consent": "yes"}))
+    if "pan" in urls:
+        tasks["pan"] = timer.run("idfy_pan", "verify", cached_extraction(
+            idfy_client.PAN_EXTRACT, digests["pan"],
+            task_id=session_id + "_pan", data={"document1": urls["pan"]}))
+    if "face" in urls:
+        tasks["liveness"] = timer.run("idfy_liveness", "verify", idfy_client.run_task(idfy_client.FACE_LIVENESS,
+            task_id=session_id + "_liveness", group_id="kyc_group",
+            data={"document1": urls["face"], "detect_face_mask": True,
+                  "detect_front_facing": True, "detect_nsfw": True}))
+        tasks["face_match"] = timer.run("idfy_face_match", "verify", idfy_client.run_task(idfy_client.FACE_COMPARE,
+            task_id=session_id + "_face", group_id="kyc_group",
+            data={"document1": aadhaar_url, "document2": urls["face"]}))
+    results = dict(zip(tasks, await asyncio.gather(*tasks.values())))
+
+    documents = []
+    if "aadhaar" in results:
+        documents.append(aadhaar_document(session_id, urls["aadhaar"], results["aadhaar"], urls.get("aadhaar_face")))
+    if "pan" in results:
+        documents.append(pan_document(session_id, urls["pan"], results["pan"]))
+
+    flagged = await risk_flag(session_id, documents) if "face_match" in results else False
+
+    async def persist():
+        if "aadhaar" in results:
+            try:
+                await kyc_repository.create_session(session_id)
+            except Exception as e:
+                log.warning("session creation failed", extra={"error": str(e)})
+        writes = [kyc_repository.insert_documents(documents)]
+        if "face_match" in results:
+            writes.append(kyc_repository.insert_face_check(
+                face_check(session_id, results["face_match"], results["liveness"], flagged)))
+        await asyncio.gather(*writes)
+
+    try:
+        await timer.run("persist", "persist", persist())
+        log.info("session stored", extra={"steps": list(results)})
+    except Exception as e:
+        log.error("storing session failed", extra={"error": str(e)})
+    for doc in documents:
+        await prefetch.after_document(session_id, doc["doc_type"])
+
+    statuses = {name: ("failed" if task_failed(result) else "processed") for name, result in results.items()}
+    errors = {name: result.get('message', 'Unknown error') for name, result in results.items() if task_failed(result)}
+    body = {
+        "session_id": session_id,
+        "status": "session_failed" if errors else "session_processed",
+        "steps": statuses,
+        "timings": timer.summary(),
+    }
+    if errors:
+        body["errors"] = errors
+    log.info("session processed", extra={"critical_path": body['timings']['critical_path'],
+                                         "total_ms": body['timings']['total_ms']})
+    return body, 400 if errors else 200
@@ -0,0 +1,244 @@
+import os
+import asyncio
+from fastapi import APIRouter
+
+from backend.content_cache import shared_cache
+from backend.shared_state import offload
+from backend.metrics import span, batch_rows, retries_total
+from backend.clients import get_supabase
+
+# Persistence layer for KYC rows. Supabase calls run in worker threads instead of on the
+# event loop, inserts from concurrent sessions are coalesced into one request per table
+# (flushed when KYC_DB_BATCH_SIZE rows are waiting or after KYC_DB_FLUSH_MS), and the
+# Aadhaar image URL of each session is remembered so the face step needs no lookup.
+# A compact details summary per session is kept for the review screen (/kyc/get-details).
+
+KYC_DB_BATCH_SIZE = int(os.getenv("KYC_DB_BATCH_SIZE", "50"))
+KYC_DB_FLUSH_MS = float(os.getenv("KYC_DB_FLUSH_MS", "20"))
+KYC_SESSION_CACHE_SIZE = int(os.getenv("KYC_SESSION_CACHE_SIZE", "10000"))
+KYC_SESSION_CACHE_TTL = float(os.getenv("KYC_SESSION_CACHE_TTL", str(6 * 3600)))
+KYC_DETAILS_CACHE_TTL = float(os.getenv("KYC_DETAILS_CACHE_TTL", "600"))
+
+# doc_type -> {details key: extracted_data field}
+DETAIL_FIELDS = {
+    "aadhaar": {"aadhaar_name": "full_name", "aadhaar_number": "aadhaar_number", "aadhaar_dob": "dob"},
+    "pan": {"pan_number": "pan_number", "pan_name": "full_name"},
+}
+# Only the JSON paths the summary needs, instead of the whole IDfy response
+DETAILS_SELECT = "doc_type, " + ", ".join(
+    f"{field}:extracted_data->>{field}" for field in dict.fromkeys(
+        field for fields in DETAIL_FIELDS.values() for field in fields.values()))
+# Fields compared across a session's documents (backend.consistency)
+IDENTITY_FIELDS = ("full_name", "dob", "gender")
+IDENTITY_SELECT = "doc_type, " + ", ".join(f"{field}:extracted_data->>{field}" for field in IDENTITY_FIELDS)
+
+router = APIRouter()
+
+db_stats = {"rows": 0, "batches": 0, "row_retries": 0, "queries": 0, "aadhaar_lookups_saved": 0,
+            "details_hits": 0, "details_misses": 0}
+
+
+async def execute(query):
+    """Run a prepared Supabase query builder in a worker thread."""
+    db_stats["queries"] += 1
+    async with span("db_query"):
+        return await asyncio.to_thread(query.execute)
+
+
+class BatchWriter:
+    """Coalesces single-row inserts into one multi-row request per flush.
+
+    ``add`` resolves once the row's batch is written, or raises that row's error. When a
+    batch is rejected its rows are retried one by one so a bad row only fails itself.
+    """
+
+    def __init__(self, table, on_conflict=None, max_rows=KYC_DB_BATCH_SIZE, interval=KYC_DB_FLUSH_MS / 1000):
+        self.table = table
+        self.on_conflict = on_conflict
+        self.max_rows = max_rows
+        self.interval = interval
+        self.pending = []
+        self.inflight = set()
+        self._timer = None
+
+    async def add(self, row):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((row, future))
+        if len(self.pending) >= self.max_rows:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self.flush)
+        return await future
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.create_task(self._write(batch))
+            self.inflight.add(task)
+            task.add_done_callback(self.inflight.discard)
+
+    def _execute(self, rows):
+        from postgrest import ReturnMethod
+        supabase = get_supabase()
+        table = supabase.table(self.table)
+        if self.on_conflict:
+            # Duplicates (e.g. a retried Aadhaar step) are skipped instead of failing the batch
+            query = table.upsert(rows, on_conflict=self.on_conflict, ignore_duplicates=True,
+                                 returning=ReturnMethod.minimal)
+        else:
+            query = table.insert(rows, returning=ReturnMethod.minimal)
+        batch_rows.observe(len(rows), table=self.table)
+        with span("db_insert"):
+            query.execute()
+
+    async def _write(self, batch):
+        rows = [row for row, _ in batch]
+        if self.on_conflict:
+            rows = list({row[self.on_conflict]: row for row in rows}.values())
+        db_stats["batches"] += 1
+        db_stats["rows"] += len(rows)
+        try:
+            await asyncio.to_thread(self._execute, rows)
+            results = [None] * len(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                results = [e]
+            else:
+                db_stats["row_retries"] += len(batch)
+                retries_total.inc(len(batch), dependency="db_insert")
+                results = await asyncio.gather(*(asyncio.to_thread(self._execute, [row]) for row, _ in batch),
+                                               return_exceptions=True)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(None)
+
+    async def close(self):
+        self.flush()
+        await asyncio.gather(*self.inflight, return_exceptions=True)
+
+
+writers = {
+    "kyc_sessions": BatchWriter("kyc_sessions", on_conflict="session_id"),
+    "kyc_documents": BatchWriter("kyc_documents"),
+    "kyc_face_checks": BatchWriter("kyc_face_checks"),
+}
+
+# session_id -> {"created": True, "aadhaar_image": url, "identity": {doc_type: fields}, "face_checked": True}
+session_state = shared_cache("session", maxsize=KYC_SESSION_CACHE_SIZE, ttl=KYC_SESSION_CACHE_TTL)
+# session_id -> details summary served by /kyc/get-details
+details_cache = shared_cache("details", maxsize=KYC_SESSION_CACHE_SIZE, ttl=KYC_DETAILS_CACHE_TTL)
+
+
+async def recall(session_id):
+    return await offload(session_state.get, session_id) or {}
+
+
+async def remember(session_id, **values):
+    await offload(session_state.set, session_id, {**await recall(session_id), **values})
+
+
+async def create_session(session_id):
+    if (await recall(session_id)).get("created"):
+        return
+    await writers["kyc_sessions"].add({"session_id": session_id, "status": "processing"})
+    await remember(session_id, created=True)
+
+
+async def insert_documents(documents):
+    from backend.raw_archive import slim_document
+    documents = await asyncio.gather(*(slim_document(doc) for doc in documents))
+    await asyncio.gather(*(writers["kyc_documents"].add(doc) for doc in documents))
+    for doc in documents:
+        session_id = doc["session_id"]
+        values = {}
+        if doc["doc_type"] == "aadhaar":
+            values["aadhaar_image"] = doc["extracted_data"].get("face_crop_url") or doc["image_url"]
+        identity = (await recall(session_id)).get("identity") or {}
+        values["identity"] = {
+            **identity, doc["doc_type"]: {field: doc["extracted_data"].get(field) for field in IDENTITY_FIELDS}}
+        await remember(session_id, **values)
+        # Build the summary as extraction results land so the review screen needs no query
+        cached = await offload(details_cache.get, session_id) or {}
+        await offload(details_cache.set, session_id,
+                      {**cached, **document_details(doc["doc_type"], doc["extracted_data"])})
+
+
+async def insert_face_check(row):
+    await writers["kyc_face_checks"].add(row)
+    await remember(row["session_id"], face_checked=True)
+
+
+async def set_risk_flag(session_id, risk_flag):
+    supabase = get_supabase()
+    await execute(supabase.table('kyc_face_checks').update({"risk_flag": risk_flag}).eq('session_id', session_id))
+
+
+async def identity(session_id):
+    """Identity fields per document type, from memory when both documents are known."""
+    known = (await recall(session_id)).get("identity") or {}
+    if all(doc_type in known for doc_type in DETAIL_FIELDS):
+        return known
+    supabase = get_supabase()
+    documents = await execute(supabase.table('kyc_documents').select(IDENTITY_SELECT).eq('session_id', session_id))
+    found = {doc['doc_type']: {field: doc.get(field) for field in IDENTITY_FIELDS} for doc in documents.data}
+    return {**found, **known}
+
+
+async def aadhaar_image(session_id):
+    """Aadhaar face crop URL (else full card URL) for the session, from memory when possible."""
+    url = (await recall(session_id)).get("aadhaar_image")
+    if url:
+        db_stats["aadhaar_lookups_saved"] += 1
+        return url
+    supabase = get_supabase()
+    aadhaar_doc = await execute(supabase.table('kyc_documents').select(
+        'image_url, face_crop_url:extracted_data->>face_crop_url'
+    ).eq('session_id', session_id).eq('doc_type', 'aadhaar'))
+    if not aadhaar_doc.data:
+        return None
+    url = aadhaar_doc.data[0].get('face_crop_url') or aadhaar_doc.data[0]['image_url']
+    await remember(session_id, aadhaar_image=url)
+    return url
+
+
+def document_details(doc_type, fields):
+    return {key: fields.get(field) or "N/A" for key, field in DETAIL_FIELDS.get(doc_type, {}).items()}
+
+
+async def get_details(session_id):
+    """Details summary for the review screen, from the cache or a projected query."""
+    details = await offload(details_cache.get, session_id)
+    # A partial summary may be missing a document written by another worker, so re-read it
+    if details is not None and all(key in details for fields in DETAIL_FIELDS.values() for key in fields):
+        db_stats["details_hits"] += 1
+        return details
+    db_stats["details_misses"] += 1
+    supabase = get_supabase()
+    documents = await execute(supabase.table('kyc_documents').select(DETAILS_SELECT).eq('session_id', session_id))
+    details = {}
+    for doc in documents.data:
+        details.update(document_details(doc['doc_type'], doc))
+    if details:
+        await offload(details_cache.set, session_id, details)
+    return details
+
+
+async def invalidate_details(session_id):
+    await offload(details_cache.delete, session_id)
+
+
+async def close():
+    """Flush pending rows (called from the app's shutdown hook)."""
+    await asyncio.gather(*(writer.close() for writer in writers.values()))
+
+
+@router.get("/kyc/db/stats")
+def get_db_stats():
+    return {**db_stats, "pending": {table: len(w.pending) for table, w in writers.items()}}
@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import zlib
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from uuid import uuid4
+from logging.handlers import QueueHandler, QueueListener
+from fastapi import APIRouter
+
+# Structured logging for the backend. Modules log through logging.getLogger(__name__)
+# with context as keyword fields (extra={...}); configure_logging() routes every record
+# through a bounded in-memory queue to one listener thread, which samples, redacts and
+# writes one JSON object per line to stdout. On the caller's thread a record costs the
+# stdlib LogRecord plus a queue put; message formatting, redaction, serializing and I/O
+# happen on the listener. That work still shares the GIL with the event loop, so the
+# gain over print is that a slow or blocked stdout no longer stalls requests, not lower
+# CPU (see benchmarks/log_overhead.py). When the queue is full records are dropped and
+# counted instead of blocking the event loop.
+#
+#   request_id / session_id   correlation ids added to every record (X-Request-ID is
+#                             taken from the request or generated, and echoed back)
+#   payload                   verbose field (IDfy responses, update bodies); kept for
+#                             KYC_LOG_PAYLOAD_SAMPLE of sessions, chosen per session
+#                             so a sampled session is logged in full
+#   PII                       names, ID numbers, dates of birth, addresses, ... are
+#                             masked in every field before the record is written
+
+KYC_LOG_LEVEL = os.getenv("KYC_LOG_LEVEL", "INFO").upper()
+KYC_LOG_FORMAT = os.getenv("KYC_LOG_FORMAT", "json")
+KYC_LOG_PAYLOAD_SAMPLE = float(os.getenv("KYC_LOG_PAYLOAD_SAMPLE", "0.01"))
+KYC_LOG_QUEUE_SIZE = int(os.getenv("KYC_LOG_QUEUE_SIZE", "10000"))
+
+# Field names (lower case, non-alphanumerics as "_") whose values are masked, whole
+# (a dict or list under one of these is masked without looking inside)
+PII_FIELDS = {
+    "full_name", "name", "name_on_card", "fathers_name", "father_name", "aadhaar_name", "pan_name",
+    "aadhaar_number", "id_number", "pan_number", "dob", "date_of_birth", "aadhaar_dob", "year_of_birth",
+    "gender", "address", "mobile", "phone", "email",
+    # Parts of IDfy's split_address
+    "split_address", "address_line", "house", "street", "landmark", "locality", "vtc", "po",
+    "city", "district", "subdistrict", "pincode", "pin_code",
+}
+REDACTED = "[redacted]"
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+session_id_var = contextvars.ContextVar("session_id", default=None)
+
+router = APIRouter()
+
+log_stats = {"queued": 0, "dropped": 0, "payloads_kept": 0, "payloads_sampled_out": 0}
+_listener = None
+_queue = None
+# Attributes every LogRecord has; anything else was passed as a field
+_RECORD_ATTRS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime", "taskName"}
+
+
+def bind(session_id=None):
+    """Attach a session id to everything logged from the current task from now on."""
+    if session_id:
+        session_id_var.set(session_id)
+
+
+def payload_sampled(session_id):
+    if KYC_LOG_PAYLOAD_SAMPLE >= 1:
+        return True
+    if KYC_LOG_PAYLOAD_SAMPLE <= 0:
+        return False
+    if session_id:
+        return zlib.crc32(session_id.encode()) % 10000 < KYC_LOG_PAYLOAD_SAMPLE * 10000
+    return random.random() < KYC_LOG_PAYLOAD_SAMPLE
+
+
+def field_key(key):
+    return "".join(c if c.isalnum() else "_" for c in str(key).strip().lower())
+
+
+def redact(value, key=None):
+    if key is not None and field_key(key) in PII_FIELDS:
+        return value if value in (None, "", "N/A") else REDACTED
+    if isinstance(value, dict):
+        return {k: redact(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    return value
+
+
+class PayloadSampler(logging.Filter):
+    """Drops payloads of unsampled sessions; runs on the listener thread."""
+
+    def filter(self, record):
+        if "payload" in record.__dict__:
+            if payload_sampled(record.session_id):
+                log_stats["payloads_kept"] += 1
+            else:
+                del record.payload
+                log_stats["payloads_sampled_out"] += 1
+        return True
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Caller side: stamps the correlation ids (context variables of the calling task) and
+    puts the record on the queue unformatted; drops (and counts) when the queue is full."""
+
+    def handle(self, record):
+        fields = record.__dict__
+        if fields.get("request_id") is None:
+            fields["request_id"] = request_id_var.get()
+        if fields.get("session_id") is None:
+            fields["session_id"] = session_id_var.get()
+        try:
+            self.queue.put_nowait(record)
+            log_stats["queued"] += 1
+        except queue.Full:
+            log_stats["dropped"] += 1
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = redact(value, key)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, separators=(",", ":"))
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = {key: redact(value, key) for key, value in record.__dict__.items()
+                  if key not in _RECORD_ATTRS and value is not None}
+        return f"{line} {json.dumps(fields, default=str)}" if fields else line
+
+
+def configure_logging():
+    """Route the backend's loggers through the queue and listener thread (idempotent)."""
+    global _listener, _queue
+    if _listener is not None:
+        return
+    _queue = queue.Queue(KYC_LOG_QUEUE_SIZE)
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if KYC_LOG_FORMAT == "json" else TextFormatter())
+    output.addFilter(PayloadSampler())
+    handler = BoundedQueueHandler(_queue)
+    logger = logging.getLogger("backend")
+    logger.setLevel(KYC_LOG_LEVEL)
+    logger.handlers[:] = [handler]
+    logger.propagate = False
+    _listener = QueueListener(_queue, output)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Write out queued records and stop the listener (called from the app's shutdown hook)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class CorrelationMiddleware:
+    """ASGI middleware giving each request an id, logged with its records and sent back."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode()[:64] or uuid4().hex
+        request_token = request_id_var.set(request_id)
+        session_token = session_id_var.set(None)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-request-id", request_id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            session_id_var.reset(session_token)
+            request_id_var.reset(request_token)
+
+
+@router.get("/logs/stats")
+def get_log_stats():
+    return {**log_stats, "queue_depth": _queue.qsize() if _queue is not None else 0,
+            "payload_sample": KYC_LOG_PAYLOAD_SAMPLE}
@@ -1,324 +1,236 @@
 import os
 from dotenv import load_dotenv
 load_dotenv()
-print("SUPABASE_URL:", os.getenv("SUPABASE_URL"))
 
-from fastapi import FastAPI, Request
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, APIRouter, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-import base64
-import requests
-import time
+import asyncio
 from uuid import uuid4
 
+from backend import idfy_client, kyc_repository, prefetch
+from backend.metrics import router as metrics_router, MetricsMiddleware
+from backend.workers import shutdown_process_pool, warm_process_pool
+from backend.kyc_pipeline import run_aadhaar_step, run_pan_step, run_face_step, run_session_step
+from backend.request_images import read_kyc_request, PayloadTooLarge, BadImageRequest
+from backend.idfy_governor import router as governor_router, IdfyDegraded
+from backend.idempotency import router as idempotency_router, request_fingerprint, idempotency_key, run_once
+from backend.kyc_jobs import router as jobs_router, job_queue, enqueue_step
+from backend.kyc_repository import router as db_router
+from backend.raw_archive import router as audit_router
+from backend.content_cache import router as cache_router
+from backend.face_detect import router as face_router
+from backend.quality_gate import router as quality_router, check_capture
 from backend.idfy_endpoints import router as idfy_router
 from backend.supabase_uploads import router as supabase_router
-from backend.cartesia_tts import router as cartesia_router
+from backend.recording_uploads import router as recording_router
+from backend.direct_uploads import router as direct_router
+from backend.capture_stream import router as capture_router
+from backend.cartesia_tts import router as cartesia_router, start_warm_up
+from backend.health import router as health_router
+from backend.prefetch import router as prefetch_router
+from backend.consistency import router as consistency_router
+from backend.clients import get_supabase
+from backend.logs import router as logs_router, configure_logging, stop_logging, bind, CorrelationMiddleware
 
-app = FastAPI()
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Application factory. Run one worker with `uvicorn backend.main:app`, or several per
+# node with `uvicorn backend.main:app --workers N` (or `--factory backend.main:create_app`)
+# and KYC_SHARED_STATE pointing at a store they share (see backend.shared_state).
+# Heavy dependencies (Supabase, OpenCV, Cartesia) load lazily, so a worker starts
+# answering /healthz quickly; /readyz turns 200 once the lifespan startup is done.
 
-@app.get("/")
+router = APIRouter()
+log = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app):
+    log.info("backend starting", extra={"supabase_url": os.getenv("SUPABASE_URL")})
+    # Create the shared Supabase client off the event loop, before taking traffic
+    await asyncio.to_thread(get_supabase)
+    start_warm_up()
+    asyncio.create_task(warm_process_pool())
+    app.state.ready = True
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        await job_queue.stop()
+        await kyc_repository.close()
+        await idfy_client.close_client()
+        await asyncio.to_thread(shutdown_process_pool)
+        stop_logging()
+
+def create_app():
+    configure_logging()
+    app = FastAPI(lifespan=lifespan)
+    app.state.ready = False
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["Server-Timing", "Retry-After", "Idempotent-Replayed", "X-Request-ID"],
+    )
+    app.add_middleware(MetricsMiddleware)
+    app.add_middleware(CorrelationMiddleware)
+    app.add_exception_handler(PayloadTooLarge, payload_too_large)
+    app.add_exception_handler(BadImageRequest, bad_image_request)
+    app.add_exception_handler(IdfyDegraded, idfy_degraded)
+
+    app.include_router(router)
+    app.include_router(health_router)
+    app.include_router(idfy_router)
+    app.include_router(governor_router)
+    app.include_router(idempotency_router)
+    app.include_router(cartesia_router)
+    app.include_router(supabase_router)
+    app.include_router(recording_router)
+    app.include_router(direct_router)
+    app.include_router(capture_router)
+    app.include_router(jobs_router)
+    app.include_router(db_router)
+    app.include_router(metrics_router)
+    app.include_router(audit_router)
+    app.include_router(cache_router)
+    app.include_router(face_router)
+    app.include_router(quality_router)
+    app.include_router(prefetch_router)
+    app.include_router(consistency_router)
+    app.include_router(logs_router)
+    return app
+
+@router.get("/")
 def root():
     return {"message": "HDFC KYC Voice Backend Running"}
 
+# --- KYC PROCESS ENDPOINTS ---
+# Images can be sent as base64 JSON, multipart form data or a raw binary body.
+# Send "mode": "job" to get a job id back immediately instead of waiting for IDfy.
+async def payload_too_large(request, exc):
+    return JSONResponse({"error": str(exc)}, status_code=413)
 
-from fastapi import Request
-import base64
-import tempfile
-from fastapi.responses import JSONResponse
+async def bad_image_request(request, exc):
+    return JSONResponse({"error": str(exc)}, status_code=400)
 
-app.include_router(idfy_router)
-app.include_router(cartesia_router)
-app.include_router(supabase_router)
+async def idfy_degraded(request, exc):
+    return JSONResponse({"status": "idfy_degraded", "error": str(exc), "retry_after": round(exc.retry_after)},
+                        status_code=503, headers={"Retry-After": str(round(exc.retry_after))})
 
-# --- KYC PROCESS ENDPOINTS ---
-@app.post("/kyc/process-aadhaar")
+async def read_step_request(request, image_fields):
+    fields, images = await read_kyc_request(request, image_fields)
+    session_id = fields.get("session_id") or str(uuid4())
+    bind(session_id)
+    return fields, session_id, images
+
+def missing_images(session_id):
+    return JSONResponse({"session_id": session_id, "error": "no images provided"}, status_code=400)
+
+async def screen_captures(session_id, images):
+    """Local quality gate; returns a 422 retake response for the first unusable image."""
+    retakes = await asyncio.gather(*(check_capture(img_bytes, doc_type) for doc_type, img_bytes in images.items()))
+    for retake in retakes:
+        if retake:
+            return JSONResponse({"session_id": session_id, **retake}, status_code=422)
+    return None
+
+def wants_job(request, fields):
+    return fields.get("mode") == "job" or request.query_params.get("mode") == "job"
+
+async def idempotent(request, kind, fields, images, compute):
+    """Run compute() once per idempotency key; duplicates share or replay its response."""
+    if wants_job(request, fields):
+        kind += ":job"
+    fingerprint = request_fingerprint(kind, fields, images)
+    return await run_once(idempotency_key(request, kind, fingerprint), fingerprint, compute)
+
+async def handle_step(request, image_field, kind, step, after_kind=None):
+    fields, session_id, images = await read_step_request(request, [image_field])
+    if not images:
+        return missing_images(session_id)
+    img_bytes = images[image_field]
+
+    async def compute():
+        retake = await screen_captures(session_id, {kind: img_bytes})
+        if retake:
+            return retake
+        if wants_job(request, fields):
+            return await enqueue_step(kind, session_id, step, session_id, img_bytes,
+                                      callback_url=fields.get("callback_url"), after_kind=after_kind)
+        body, status_code = await step(session_id, img_bytes)
+        return JSONResponse(body, status_code=status_code)
+
+    return await idempotent(request, kind, fields, images, compute)
+
+@router.post("/kyc/process-aadhaar")
 async def process_aadhaar(request: Request):
-    data = await request.json()
-    aadhaar_b64 = data.get("aadhaar_image")
-    session_id = data.get("session_id", str(uuid4()))
-    
-    def upload_image(b64, doc_type):
-        img_bytes = base64.b64decode(b64.split(",")[-1])
-        from backend.supabase_uploads import supabase
-        file_id = os.urandom(8).hex()
-        file_path = f"{file_id}_{doc_type}.png"
-        supabase.storage.from_('kyc_document').upload(file_path, img_bytes, {"content-type": "image/png"})
-        url = supabase.storage.from_('kyc_document').get_public_url(file_path)
-        return url
-    
-    aadhaar_url = upload_image(aadhaar_b64, "aadhaar")
-    
-    IDFY_API_KEY = os.getenv("IDFY_API_KEY")
-    IDFY_ACCOUNT_ID = os.getenv("IDFY_ACCOUNT_ID")
-    headers = {
-        'Content-Type': 'application/json',
-        'account-id': IDFY_ACCOUNT_ID,
-        'api-key': IDFY_API_KEY
-    }
-    
-    aadhaar_task = requests.post("https://eve.idfy.com/v3/tasks/async/extract/ind_aadhaar_plus", 
-        json={"task_id": session_id + "_aadhaar", "group_id": "kyc_group", 
-              "data": {"document1": aadhaar_url, "consent": "yes"}}, 
-        headers=headers).json()
-    
-    print(f"\n=== AADHAAR SUBMITTED ===")
-    print("Task ID:", aadhaar_task.get('request_id'))
-    
-    time.sleep(5)
-    aadhaar_response = requests.get(f"https://eve.idfy.com/v3/tasks?request_id={aadhaar_task.get('request_id')}", headers=headers).json()
-    aadhaar_result = aadhaar_response[0] if isinstance(aadhaar_response, list) and len(aadhaar_response) > 0 else aadhaar_response
-    
-    if aadhaar_result.get('error') or aadhaar_result.get('status') == 'failed':
-        time.sleep(3)
-        aadhaar_response = requests.get(f"https://eve.idfy.com/v3/tasks?request_id={aadhaar_task.get('request_id')}", headers=headers).json()
-        aadhaar_result = aadhaar_response[0] if isinstance(aadhaar_response, list) and len(aadhaar_response) > 0 else aadhaar_response
-    
-    print("Aadhaar result:", aadhaar_result)
-    
-    from backend.supabase_uploads import supabase
-    try:
-        supabase.table('kyc_sessions').insert({
-            "session_id": session_id,
-            "status": "processing"
-        }).execute()
-    except Exception as e:
-        print(f"Session creation info: {e}")
-    
-    # Check for IDfy errors
-    if aadhaar_result.get('error') or aadhaar_result.get('status') == 'failed':
-        error_msg = aadhaar_result.get('message', 'Unknown error')
-        print(f"⚠ IDfy Error: {error_msg}")
-        
-        # Store with error information
-        try:
-            supabase.table('kyc_documents').insert({
-                "session_id": session_id,
-                "doc_type": "aadhaar",
-                "image_url": aadhaar_url,
-                "extracted_data": {
-                    "full_response": aadhaar_result,
-                    "error": aadhaar_result.get('error'),
-                    "error_message": error_msg
-                }
-            }).execute()
-        except Exception as e:
-            print(f"Error storing Aadhaar: {e}")
-        
-        return JSONResponse({
-            "session_id": session_id, 
-            "status": "aadhaar_failed",
-            "error": error_msg
-        }, status_code=400)
-    
-    try:
-        aadhaar_extracted = {}
-        if aadhaar_result.get('result') and aadhaar_result['result'].get('extraction_output'):
-            aadhaar_extracted = aadhaar_result['result']['extraction_output']
-        
-        supabase.table('kyc_documents').insert({
-            "session_id": session_id,
-            "doc_type": "aadhaar",
-            "image_url": aadhaar_url,
-            "extracted_data": {
-                "full_response": aadhaar_result,
-                "full_name": aadhaar_extracted.get('name_on_card'),
-                "aadhaar_number": aadhaar_extracted.get('id_number'),
-                "dob": aadhaar_extracted.get('date_of_birth'),
-                "gender": aadhaar_extracted.get('gender'),
-                "address": aadhaar_extracted.get('address')
-            }
-        }).execute()
-        print(f"✓ Aadhaar stored")
-    except Exception as e:
-        print(f"Error storing Aadhaar: {e}")
-    
-    return JSONResponse({"session_id": session_id, "status": "aadhaar_processed"})
+    return await handle_step(request, "aadhaar_image", "aadhaar", run_aadhaar_step)
 
-@app.post("/kyc/process-pan")
+@router.post("/kyc/process-pan")
 async def process_pan(request: Request):
-    data = await request.json()
-    pan_b64 = data.get("pan_image")
-    session_id = data.get("session_id")
-    
-    # Generate session_id if not provided
-    if not session_id:
-        session_id = str(uuid.uuid4())
-    
-    def upload_image(b64, doc_type):
-        img_bytes = base64.b64decode(b64.split(",")[-1])
-        from backend.supabase_uploads import supabase
-        file_id = os.urandom(8).hex()
-        file_path = f"{file_id}_{doc_type}.png"
-        supabase.storage.from_('kyc_document').upload(file_path, img_bytes, {"content-type": "image/png"})
-        url = supabase.storage.from_('kyc_document').get_public_url(file_path)
-        return url
-    
-    pan_url = upload_image(pan_b64, "pan")
-    
-    IDFY_API_KEY = os.getenv("IDFY_API_KEY")
-    IDFY_ACCOUNT_ID = os.getenv("IDFY_ACCOUNT_ID")
-    headers = {
-        'Content-Type': 'application/json',
-        'account-id': IDFY_ACCOUNT_ID,
-        'api-key': IDFY_API_KEY
-    }
-    
-    pan_task = requests.post("https://eve.idfy.com/v3/tasks/async/extract/ind_pan",
-        json={"task_id": session_id + "_pan", "group_id": "kyc_group",
-              "data": {"document1": pan_url}},
-        headers=headers).json()
-    
-    print(f"\n=== PAN SUBMITTED ===")
-    print("Task ID:", pan_task.get('request_id'))
-    
-    time.sleep(5)
-    pan_response = requests.get(f"https://eve.idfy.com/v3/tasks?request_id={pan_task.get('request_id')}", headers=headers).json()
-    pan_result = pan_response[0] if isinstance(pan_response, list) and len(pan_response) > 0 else pan_response
-    
-    if pan_result.get('error') or pan_result.get('status') == 'failed':
-        time.sleep(3)
-        pan_response = requests.get(f"https://eve.idfy.com/v3/tasks?request_id={pan_task.get('request_id')}", headers=headers).json()
-        pan_result = pan_response[0] if isinstance(pan_response, list) and len(pan_response) > 0 else pan_response
-    
-    print("PAN result:", pan_result)
-    
-    from backend.supabase_uploads import supabase
-    try:
-        pan_extracted = {}
-        if pan_result.get('result') and pan_result['result'].get('extraction_output'):
-            pan_extracted = pan_result['result']['extraction_output']
-        
-        supabase.table('kyc_documents').insert({
-            "session_id": session_id,
-            "doc_type": "pan",
-            "image_url": pan_url,
-            "extracted_data": {
-                "full_response": pan_result,
-                "full_name": pan_extracted.get('name_on_card'),
-                "pan_number": pan_extracted.get('id_number'),
-                "dob": pan_extracted.get('date_of_birth')
-            }
-        }).execute()
-        print(f"✓ PAN stored")
-    except Exception as e:
-        print(f"Error storing PAN: {e}")
-    
-    return JSONResponse({"session_id": session_id, "status": "pan_processed"})
+    return await handle_step(request, "pan_image", "pan", run_pan_step)
 
-@app.post("/kyc/process-face")
+@router.post("/kyc/process-face")
 async def process_face(request: Request):
-    data = await request.json()
-    face_b64 = data.get("face_image")
-    session_id = data.get("session_id")
-    
-    # Generate session_id if not provided
-    if not session_id:
-        session_id = str(uuid.uuid4())
-    
-    def upload_image(b64, doc_type):
-        img_bytes = base64.b64decode(b64.split(",")[-1])
-        from backend.supabase_uploads import supabase
-        file_id = os.urandom(8).hex()
-        file_path = f"{file_id}_{doc_type}.png"
-        supabase.storage.from_('kyc_document').upload(file_path, img_bytes, {"content-type": "image/png"})
-        url = supabase.storage.from_('kyc_document').get_public_url(file_path)
-        return url
-    
-    face_url = upload_image(face_b64, "face")
-    
-    # Get Aadhaar URL from stored documents
-    from backend.supabase_uploads import supabase
-    aadhaar_doc = supabase.table('kyc_documents').select('image_url').eq('session_id', session_id).eq('doc_type', 'aadhaar').execute()
-    aadhaar_url = aadhaar_doc.data[0]['image_url'] if aadhaar_doc.data else None
-    
-    IDFY_API_KEY = os.getenv("IDFY_API_KEY")
-    IDFY_ACCOUNT_ID = os.getenv("IDFY_ACCOUNT_ID")
-    headers = {
-        'Content-Type': 'application/json',
-        'account-id': IDFY_ACCOUNT_ID,
-        'api-key': IDFY_API_KEY
-    }
-    
-    face_match_task = requests.post("https://eve.idfy.com/v3/tasks/async/compare/face",
-        json={"task_id": session_id + "_face", "group_id": "kyc_group",
-              "data": {"document1": aadhaar_url, "document2": face_url}},
-        headers=headers).json()
-    
-    print(f"\n=== FACE COMPARISON SUBMITTED ===")
-    print("Task ID:", face_match_task.get('request_id'))
-    
-    time.sleep(5)
-    face_match_response = requests.get(f"https://eve.idfy.com/v3/tasks?request_id={face_match_task.get('request_id')}", headers=headers).json()
-    face_match_result = face_match_response[0] if isinstance(face_match_response, list) and len(face_match_response) > 0 else face_match_response
-    
-    print("Face match result:", face_match_result)
-    
-    try:
-        supabase.table('kyc_face_checks').insert({
-            "session_id": session_id,
-            "liveness_result": {},
-            "face_match_result": face_match_result,
-            "risk_flag": False
-        }).execute()
-        print(f"✓ Face comparison stored")
-    except Exception as e:
-        print(f"Error storing face comparison: {e}")
-    
-    return JSONResponse({"session_id": session_id, "status": "face_processed"})
+    return await handle_step(request, "face_image", "face", run_face_step, after_kind="aadhaar")
+
+# Combined endpoint: any of aadhaar_image / pan_image / face_image in one request,
+# with OCR, liveness and face match fanned out concurrently.
+@router.post("/kyc/process-session")
+async def process_session(request: Request):
+    fields, session_id, images = await read_step_request(
+        request, ["aadhaar_image", "pan_image", "face_image"])
+    if not images:
+        return missing_images(session_id)
+    images = {field.removesuffix("_image"): img_bytes for field, img_bytes in images.items()}
+
+    async def compute():
+        retake = await screen_captures(session_id, images)
+        if retake:
+            return retake
+        if wants_job(request, fields):
+            return await enqueue_step("session", session_id, run_session_step, session_id, images,
+                                      callback_url=fields.get("callback_url"), after_kind="aadhaar")
+        body, status_code = await run_session_step(session_id, images)
+        return JSONResponse(body, status_code=status_code)
 
-@app.get("/kyc/get-details/{session_id}")
+    return await idempotent(request, "session", fields, images, compute)
+
+@router.get("/kyc/get-details/{session_id}")
 async def get_kyc_details(session_id: str):
-    from backend.supabase_uploads import supabase
-    
     try:
-        documents = supabase.table('kyc_documents').select('*').eq('session_id', session_id).execute()
-        
-        details = {}
-        for doc in documents.data:
-            if doc['doc_type'] == 'aadhaar':
-                extracted = doc.get('extracted_data', {})
-                details['aadhaar_name'] = extracted.get('full_name', 'N/A')
-                details['aadhaar_number'] = extracted.get('aadhaar_number', 'N/A')
-                details['aadhaar_dob'] = extracted.get('dob', 'N/A')
-            elif doc['doc_type'] == 'pan':
-                extracted = doc.get('extracted_data', {})
-                details['pan_number'] = extracted.get('pan_number', 'N/A')
-                details['pan_name'] = extracted.get('full_name', 'N/A')
-        
-        print(f"\n=== FETCHED DETAILS FROM DB ===")
-        print(details)
+        # A speculative read started after the PAN step may already be on its way
+        await prefetch.wait_for("details", session_id)
+        details = await kyc_repository.get_details(session_id)
+        log.info("details served", extra={"session_id": session_id, "payload": details})
         return JSONResponse({"details": details})
     except Exception as e:
-        print(f"Error fetching details: {e}")
+        log.error("fetching details failed", extra={"session_id": session_id, "error": str(e)})
         return JSONResponse({"details": {}, "error": str(e)}, status_code=500)
 
-@app.post("/kyc/update")
+@router.post("/kyc/update")
 async def kyc_update(request: Request):
     data = await request.json()
-    print("\n=== KYC UPDATE DATA ===")
-    print(data)
-    from backend.supabase_uploads import supabase
+    log.info("kyc update received", extra={"session_id": data.get("session_id"), "payload": data})
+    supabase = get_supabase()
     try:
         # Update the session status to confirmed
         session_id = data.get("session_id", "kyc-session")
+        await kyc_repository.invalidate_details(session_id)
         
         # Only update status field (kyc_sessions doesn't have detail columns)
-        supabase.table('kyc_sessions').update({
+        await kyc_repository.execute(supabase.table('kyc_sessions').update({
             "status": "confirmed"
-        }).eq("session_id", session_id).execute()
+        }).eq("session_id", session_id))
         
         # Store updated details as metadata if needed
         # (Details are already in kyc_documents table extracted_data)
         
-        print(f"✓ Session {session_id} confirmed")
+        log.info("session confirmed", extra={"session_id": session_id})
     except Exception as e:
-        print(f"Error updating session: {e}")
+        log.error("updating session failed", extra={"session_id": data.get("session_id"), "error": str(e)})
     return {"status": "success"}
+
+app = create_app()
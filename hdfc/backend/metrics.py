@@ -0,0 +1,205 @@
+import os
+import time
+import threading
+import contextvars
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+# In-process latency instrumentation: histograms and counters rendered in Prometheus
+# text format at /metrics, span helpers for outbound calls (storage, IDfy, DB, TTS),
+# and a middleware that times each request and reports its spans in a Server-Timing
+# header.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 512 * 1024, 1024 ** 2, 5 * 1024 ** 2, 20 * 1024 ** 2)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 20)
+
+router = APIRouter()
+
+registry = []
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self.lock:
+            counts, total = self.series.get(key, ([0] * len(self.buckets), [0, 0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            total[0] += 1
+            total[1] += value
+            self.series[key] = (counts, total)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, (count, total)) in sorted(self.series.items()):
+                labels = format_labels(self.labelnames, key)
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{format_labels(self.labelnames, key, le=bound)} {bucket_count}')
+                lines.append(f'{self.name}_bucket{format_labels(self.labelnames, key, le="+Inf")} {count}')
+                lines.append(f"{self.name}_count{labels} {count}")
+                lines.append(f"{self.name}_sum{labels} {total}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.series = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.series.items()):
+                lines.append(f"{self.name}{format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+def format_labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+request_seconds = Histogram("kyc_http_request_duration_seconds", "HTTP request latency",
+                            ("method", "route", "status"))
+dependency_seconds = Histogram("kyc_dependency_duration_seconds", "Outbound call latency by dependency",
+                               ("dependency", "outcome"))
+payload_bytes = Histogram("kyc_payload_bytes", "Payload sizes sent to dependencies", ("kind",), SIZE_BUCKETS)
+batch_rows = Histogram("kyc_db_batch_rows", "Rows per coalesced DB insert", ("table",),
+                       (1, 2, 5, 10, 25, 50, 100))
+idfy_polls = Histogram("kyc_idfy_polls_per_task", "Status polls needed per IDfy task", ("outcome",), COUNT_BUCKETS)
+retries_total = Counter("kyc_dependency_retries_total", "Retried outbound calls", ("dependency",))
+
+# Spans of the request being served, reported in its Server-Timing header. Worker
+# threads started with asyncio.to_thread copy the context, so their spans land here too.
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+
+
+class span:
+    """Time a block (``with`` or ``async with``) as one dependency call."""
+
+    def __init__(self, dependency, size=None, kind=None):
+        self.dependency = dependency
+        if size is not None:
+            payload_bytes.observe(size, kind=kind or dependency)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        dependency_seconds.observe(elapsed, dependency=self.dependency, outcome="error" if exc_type else "ok")
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((self.dependency, elapsed))
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def detach_request():
+    """Stop recording spans for the current request (for tasks that outlive it)."""
+    _request_spans.set(None)
+
+
+def server_timing(spans, total):
+    # Repeated dependencies (e.g. IDfy polls) are summed into one entry with a count
+    merged = {}
+    for name, elapsed in spans:
+        count, duration = merged.get(name, (0, 0.0))
+        merged[name] = (count + 1, duration + elapsed)
+    entries = [f'{name};dur={duration * 1000:.1f};desc="{count}x"' for name, (count, duration) in merged.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def route_label(scope):
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    endpoint = scope.get("endpoint")
+    return getattr(endpoint, "__name__", "unmatched")
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency and adding the Server-Timing header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        spans = []
+        token = _request_spans.set(spans)
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(spans, time.perf_counter() - started).encode()))
+                # Lets the cross-origin frontend read the timings from the Resource Timing API
+                headers.append((b"timing-allow-origin", b"*"))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_spans.reset(token)
+            request_seconds.observe(time.perf_counter() - started, method=scope["method"],
+                                    route=route_label(scope), status=status["code"])
+
+
+def process_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is the peak, in KB on Linux; used where /proc is unavailable
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    lines += ["# HELP process_resident_memory_bytes Resident memory size in bytes.",
+              "# TYPE process_resident_memory_bytes gauge",
+              f"process_resident_memory_bytes {process_rss_bytes()}"]
+    return "\n".join(lines) + "\n"
+
+
+@router.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,114 @@
+import os
+import logging
+import asyncio
+from fastapi import APIRouter
+
+from backend import kyc_repository
+from backend.shared_state import offload
+from backend.cartesia_tts import get_audio_b64, CARTESIA_API_KEY, TTS_WARMUP_FORMATS
+
+# Speculative prefetch: while the user listens to a prompt or reviews their details the
+# backend is idle, so work a later step needs starts as soon as its inputs exist:
+#   aadhaar_face  the Aadhaar face crop used by face match, finished in the background
+#                 when OCR returns first (and, for direct uploads, cut from the stored card)
+#   tts           the confirmation lines personalized with the extracted name; these hold
+#                 the customer's name, so they are cached in memory only and expire
+#                 after TTS_ADHOC_TTL, never written to the TTS disk cache
+#   details       the review-screen summary, when it is not already complete in the cache
+# Tasks are per worker and best effort: a failed or unused prefetch only costs the work.
+
+KYC_PREFETCH = os.getenv("KYC_PREFETCH", "true").lower() in ("1", "true", "yes")
+KYC_PREFETCH_CONCURRENCY = int(os.getenv("KYC_PREFETCH_CONCURRENCY", "8"))
+# How long a step waits for an in-flight prefetch before doing without it
+KYC_PREFETCH_WAIT = float(os.getenv("KYC_PREFETCH_WAIT", "3"))
+
+log = logging.getLogger(__name__)
+router = APIRouter()
+
+pending = {}  # (kind, session_id) -> task
+prefetch_stats = {"started": 0, "completed": 0, "failed": 0, "skipped": 0, "awaited": 0, "wait_timeouts": 0}
+_semaphore = None
+
+
+def personalized_prompts(name):
+    """Lines frontend/app.js speaks with the user's name (showLegalConfirmation)."""
+    if not name or name in ("N/A", "User"):
+        return []
+    return [
+        f"{name}, please read the following statement on camera: I confirm that the information "
+        "given is correct and with my own will, I am interested in an HDFC loan.",
+        f"Thank you, {name}! Your KYC is completed.",
+    ]
+
+
+def spawn(kind, session_id, coro):
+    """Run coro in the background under the prefetch limit; one task per kind and session."""
+    global _semaphore
+    key = (kind, session_id)
+    if not KYC_PREFETCH or key in pending:
+        prefetch_stats["skipped"] += 1
+        coro.close()
+        return None
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(KYC_PREFETCH_CONCURRENCY)
+
+    async def run():
+        async with _semaphore:
+            try:
+                result = await coro
+                prefetch_stats["completed"] += 1
+                return result
+            except Exception as e:
+                prefetch_stats["failed"] += 1
+                log.warning("prefetch failed", extra={"kind": kind, "session_id": session_id, "error": str(e)})
+            finally:
+                pending.pop(key, None)
+
+    prefetch_stats["started"] += 1
+    pending[key] = task = asyncio.create_task(run())
+    return task
+
+
+async def wait_for(kind, session_id, timeout=KYC_PREFETCH_WAIT):
+    """Wait (bounded) for an in-flight prefetch of this kind; returns its result or None."""
+    task = pending.get((kind, session_id))
+    if task is None:
+        return None
+    prefetch_stats["awaited"] += 1
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+    except asyncio.TimeoutError:
+        prefetch_stats["wait_timeouts"] += 1
+        return None
+
+
+async def finish_face_crop(session_id, face_crop):
+    url = await face_crop
+    if url:
+        await kyc_repository.remember(session_id, aadhaar_image=url)
+    return url
+
+
+async def render_prompts(prompts):
+    for text in prompts:
+        for fmt in TTS_WARMUP_FORMATS:
+            await get_audio_b64(text, fmt, persist=False)
+
+
+async def after_document(session_id, doc_type):
+    """Called once an extraction is stored: warm what the review and confirmation steps use."""
+    details = await offload(kyc_repository.details_cache.get, session_id) or {}
+    # Same name the review screen pre-fills: Aadhaar name, else PAN name
+    name = details.get("aadhaar_name") or details.get("pan_name")
+    prompts = personalized_prompts(name)
+    if prompts and CARTESIA_API_KEY:
+        spawn(f"tts:{name}", session_id, render_prompts(prompts))
+    fields = [key for fields in kyc_repository.DETAIL_FIELDS.values() for key in fields]
+    if doc_type == "pan" and not all(key in details for key in fields):
+        # PAN is the last document before review; the Aadhaar one may have been stored by another worker
+        spawn("details", session_id, kyc_repository.get_details(session_id))
+
+
+@router.get("/kyc/prefetch/stats")
+def get_prefetch_stats():
+    return {**prefetch_stats, "pending": len(pending)}
@@ -0,0 +1,133 @@
+import os
+import logging
+from fastapi import APIRouter
+
+from backend.image_prep import decode, downscale
+from backend.workers import run_in_process
+
+# Local pre-screening of captures before any upload or IDfy call: blur (variance of
+# the Laplacian), exposure (brightness histogram) and face / document presence.
+# Rejected captures get an immediate "retake" response.
+
+KYC_QUALITY_GATE = os.getenv("KYC_QUALITY_GATE", "true").lower() in ("1", "true", "yes")
+KYC_MIN_SHARPNESS = float(os.getenv("KYC_MIN_SHARPNESS", "60"))
+KYC_MIN_BRIGHTNESS = float(os.getenv("KYC_MIN_BRIGHTNESS", "40"))
+KYC_MAX_BRIGHTNESS = float(os.getenv("KYC_MAX_BRIGHTNESS", "220"))
+KYC_MAX_CLIPPED = float(os.getenv("KYC_MAX_CLIPPED", "0.35"))
+KYC_MIN_EDGE_DENSITY = float(os.getenv("KYC_MIN_EDGE_DENSITY", "0.02"))
+
+RETAKE_MESSAGES = {
+    "unreadable": "We could not read that image. Please capture again.",
+    "blurry": "The image is blurry. Please hold steady and capture again.",
+    "too_dark": "The image is too dark. Please move to a brighter place and capture again.",
+    "too_bright": "The image is too bright. Please avoid glare and capture again.",
+    "no_face": "We could not see your face. Please look at the camera and capture again.",
+    "no_document": "We could not see the card. Please hold it closer to the camera and capture again.",
+}
+
+log = logging.getLogger(__name__)
+router = APIRouter()
+
+quality_stats = {}
+
+
+def measure_quality(img_bytes, doc_type):
+    """Return (reasons, metrics) for one capture; an empty reasons list means it passed."""
+    try:
+        img = decode(img_bytes)
+    except ValueError:
+        return ["unreadable"], {}
+    return measure_image(img, doc_type)
+
+
+def measure_image(img, doc_type):
+    import cv2
+    import numpy as np
+    small, _ = downscale(img, 640)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel() / gray.size
+    brightness = float(np.dot(hist, np.arange(256)))
+    clipped_dark = float(hist[:10].sum())
+    clipped_bright = float(hist[246:].sum())
+    metrics = {
+        "sharpness": round(float(cv2.Laplacian(gray, cv2.CV_64F).var()), 1),
+        "brightness": round(brightness, 1),
+        "clipped_dark": round(clipped_dark, 3),
+        "clipped_bright": round(clipped_bright, 3),
+    }
+
+    reasons = []
+    if metrics["sharpness"] < KYC_MIN_SHARPNESS:
+        reasons.append("blurry")
+    if brightness < KYC_MIN_BRIGHTNESS or clipped_dark > KYC_MAX_CLIPPED:
+        reasons.append("too_dark")
+    if brightness > KYC_MAX_BRIGHTNESS or clipped_bright > KYC_MAX_CLIPPED:
+        reasons.append("too_bright")
+
+    if doc_type == "face":
+        from backend.face_detect import detect_largest_face
+        metrics["face_found"] = detect_largest_face(small) is not None
+        if not metrics["face_found"]:
+            reasons.append("no_face")
+    else:
+        edges = cv2.Canny(gray, 50, 150)
+        metrics["edge_density"] = round(float(np.count_nonzero(edges)) / edges.size, 4)
+        if metrics["edge_density"] < KYC_MIN_EDGE_DENSITY:
+            reasons.append("no_document")
+    return reasons, metrics
+
+
+def score_preview(img_bytes, doc_type):
+    """Quality of one live preview frame plus a 16x16 grey thumbnail for motion checks.
+
+    Returns (reasons, metrics, thumbnail bytes); runs in the worker pool.
+    """
+    import cv2
+    try:
+        img = decode(img_bytes)
+    except ValueError:
+        return ["unreadable"], {}, b""
+    reasons, metrics = measure_image(img, doc_type)
+    thumb = cv2.cvtColor(cv2.resize(img, (16, 16), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    return reasons, metrics, thumb.tobytes()
+
+
+def record(doc_type, reasons):
+    stats = quality_stats.setdefault(doc_type, {"checked": 0, "rejected": 0, "reasons": {}})
+    stats["checked"] += 1
+    if reasons:
+        stats["rejected"] += 1
+        for reason in reasons:
+            stats["reasons"][reason] = stats["reasons"].get(reason, 0) + 1
+
+
+async def check_capture(img_bytes, doc_type):
+    """Run the gate in the worker pool; returns a retake response body, or None if the capture is usable."""
+    if not KYC_QUALITY_GATE:
+        return None
+    try:
+        reasons, metrics = await run_in_process(measure_quality, img_bytes, doc_type)
+    except Exception as e:
+        # Never block a capture because the gate itself failed
+        log.warning("quality gate skipped", extra={"doc_type": doc_type, "error": str(e)})
+        return None
+    record(doc_type, reasons)
+    if not reasons:
+        return None
+    log.info("capture rejected by quality gate", extra={"doc_type": doc_type, "reasons": reasons, "metrics": metrics})
+    return {
+        "status": "retake",
+        "doc_type": doc_type,
+        "reasons": reasons,
+        "message": RETAKE_MESSAGES[reasons[0]],
+        "metrics": metrics,
+    }
+
+
+@router.get("/kyc/quality/stats")
+def get_quality_stats():
+    return {
+        doc_type: {**stats, "rejection_rate": round(stats["rejected"] / stats["checked"], 3)}
+        for doc_type, stats in quality_stats.items()
+    }
@@ -0,0 +1,158 @@
+import os
+import logging
+import gzip
+import json
+import asyncio
+import argparse
+import hashlib
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from backend.logs import configure_logging
+from backend.metrics import span
+from backend.clients import get_supabase
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Cold storage for raw IDfy responses. By default ("full") kyc_documents rows keep the
+# whole IDfy response inline, as before. Opt in with KYC_PAYLOAD_MODE=slim to keep only
+# the normalized extracted fields plus a raw_ref; the full response is then written
+# compressed (zstd when the zstandard package is installed, else gzip) to KYC_RAW_BUCKET
+# under its content hash and only read back for audit. Slim mode adds an upload to every
+# document insert, and a row whose upload fails keeps the full response inline (counted
+# in /kyc/archive/stats).
+#
+#   python -m backend.raw_archive backfill [--batch-size 100] [--dry-run]
+# moves full_response out of existing rows.
+
+KYC_PAYLOAD_MODE = os.getenv("KYC_PAYLOAD_MODE", "full")
+# Storage bucket for the archived responses; must be created before enabling slim mode
+KYC_RAW_BUCKET = os.getenv("KYC_RAW_BUCKET", "kyc_raw")
+KYC_RAW_ENCODING = os.getenv("KYC_RAW_ENCODING", "zstd" if zstandard else "gzip")
+
+# encoding -> (extension, compress, decompress)
+ENCODINGS = {"gzip": (".json.gz", lambda data: gzip.compress(data, 6), gzip.decompress)}
+if zstandard:
+    ENCODINGS["zstd"] = (".json.zst", lambda data: zstandard.ZstdCompressor(level=10).compress(data),
+                         lambda data: zstandard.ZstdDecompressor().decompress(data))
+
+log = logging.getLogger(__name__)
+router = APIRouter()
+
+archive_stats = {"archived": 0, "kept_inline": 0}
+
+
+def archive_response(response):
+    """Compress and store one raw response; returns the reference kept in the hot row."""
+    supabase = get_supabase()
+    raw = json.dumps(response, sort_keys=True, separators=(",", ":")).encode()
+    ext, compress, _ = ENCODINGS[KYC_RAW_ENCODING]
+    path = hashlib.sha256(raw).hexdigest() + ext
+    compressed = compress(raw)
+    # Content-addressed, so re-archiving an identical response overwrites the same object
+    with span("archive_upload", size=len(compressed), kind="raw_archive"):
+        supabase.storage.from_(KYC_RAW_BUCKET).upload(
+            path, compressed, {"content-type": "application/octet-stream", "upsert": "true"})
+    return {"bucket": KYC_RAW_BUCKET, "path": path, "encoding": KYC_RAW_ENCODING, "bytes": len(raw)}
+
+
+def load_response(raw_ref):
+    supabase = get_supabase()
+    data = supabase.storage.from_(raw_ref["bucket"]).download(raw_ref["path"])
+    return json.loads(ENCODINGS[raw_ref["encoding"]][2](data))
+
+
+def slim_extracted_data(extracted_data):
+    """Move full_response to the archive; keeps it inline if archiving fails."""
+    if "full_response" not in extracted_data:
+        return extracted_data
+    try:
+        raw_ref = archive_response(extracted_data["full_response"])
+    except Exception as e:
+        archive_stats["kept_inline"] += 1
+        log.warning("raw response archive failed, keeping it inline", extra={"error": str(e)})
+        return extracted_data
+    archive_stats["archived"] += 1
+    slim = {k: v for k, v in extracted_data.items() if k != "full_response"}
+    slim["raw_ref"] = raw_ref
+    return slim
+
+
+async def slim_document(doc):
+    if KYC_PAYLOAD_MODE != "slim":
+        return doc
+    return {**doc, "extracted_data": await asyncio.to_thread(slim_extracted_data, doc["extracted_data"])}
+
+
+@router.get("/kyc/audit/{session_id}")
+async def audit_documents(session_id: str):
+    """Documents of a session with their raw IDfy responses, read back from the archive."""
+    supabase = get_supabase()
+    from backend.kyc_repository import execute
+    try:
+        documents = await execute(supabase.table('kyc_documents').select(
+            'doc_type, image_url, extracted_data').eq('session_id', session_id))
+
+        async def with_raw(doc):
+            extracted = doc.get('extracted_data') or {}
+            raw_ref = extracted.get('raw_ref')
+            full_response = (await asyncio.to_thread(load_response, raw_ref) if raw_ref
+                             else extracted.get('full_response'))
+            return {**doc, "full_response": full_response}
+
+        return {"session_id": session_id,
+                "documents": await asyncio.gather(*(with_raw(doc) for doc in documents.data))}
+    except Exception as e:
+        log.error("loading audit data failed", extra={"session_id": session_id, "error": str(e)})
+        return JSONResponse({"session_id": session_id, "error": str(e)}, status_code=500)
+
+
+@router.get("/kyc/archive/stats")
+def get_archive_stats():
+    return {**archive_stats, "mode": KYC_PAYLOAD_MODE, "bucket": KYC_RAW_BUCKET}
+
+
+def backfill(batch_size=100, dry_run=False):
+    """Archive full_response of existing kyc_documents rows and slim them in place."""
+    supabase = get_supabase()
+    last_id = None
+    moved = saved = 0
+    while True:
+        query = supabase.table('kyc_documents').select('id, extracted_data').not_.is_(
+            'extracted_data->full_response', 'null').order('id').limit(batch_size)
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        rows = query.execute().data
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+        for row in rows:
+            extracted = row['extracted_data']
+            before = len(json.dumps(extracted))
+            if dry_run:
+                saved += before - len(json.dumps({k: v for k, v in extracted.items() if k != "full_response"}))
+                moved += 1
+                continue
+            slim = slim_extracted_data(extracted)
+            if "raw_ref" not in slim:
+                continue
+            supabase.table('kyc_documents').update({"extracted_data": slim}).eq('id', row['id']).execute()
+            saved += before - len(json.dumps(slim))
+            moved += 1
+        print(f"{'Would move' if dry_run else 'Moved'} {moved} responses so far, {saved / 1024:.1f} KB off the hot table")
+    return moved, saved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m backend.raw_archive")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = commands.add_parser("backfill", help=backfill.__doc__)
+    backfill_parser.add_argument("--batch-size", type=int, default=100)
+    backfill_parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    configure_logging()
+    if args.command == "backfill":
+        backfill(args.batch_size, args.dry_run)
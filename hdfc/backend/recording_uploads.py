@@ -0,0 +1,200 @@
+import os
+import logging
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+from uuid import uuid4
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from backend.metrics import span
+from backend.clients import get_supabase
+
+# Chunked, resumable upload of the session recording. The frontend records with a
+# timeslice and ships each chunk as it is produced:
+#   POST /upload/recording/init                      -> {upload_id, next_index, bytes}
+#   PUT  /upload/recording/{upload_id}/chunk?index=N  raw chunk body
+#   GET  /upload/recording/{upload_id}                -> {next_index, bytes} (resume point)
+#   POST /upload/recording/{upload_id}/finalize       {session_id} -> {url}
+# Chunks are appended to a spool file on disk next to a small JSON manifest, so memory
+# stays bounded by one network read and an interrupted upload (or a restarted backend)
+# resumes from the last acknowledged chunk.
+
+RECORDING_SPOOL_DIR = os.getenv("RECORDING_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "kyc_recordings"))
+RECORDING_MAX_CHUNK_BYTES = int(os.getenv("RECORDING_MAX_CHUNK_BYTES", str(16 * 1024 * 1024)))
+RECORDING_SPOOL_TTL = int(os.getenv("RECORDING_SPOOL_TTL", str(24 * 3600)))
+RECORDING_CONTENT_TYPES = {"webm": "video/webm", "mp4": "video/mp4"}
+
+log = logging.getLogger(__name__)
+router = APIRouter()
+
+_locks = {}
+
+
+def spool_paths(upload_id):
+    base = os.path.join(RECORDING_SPOOL_DIR, upload_id)
+    return base + ".part", base + ".json"
+
+
+def read_manifest(upload_id):
+    try:
+        with open(spool_paths(upload_id)[1]) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_manifest(upload_id, manifest):
+    path = spool_paths(upload_id)[1]
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
+def remove_spool(upload_id):
+    for path in spool_paths(upload_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def remove_stale_spools():
+    cutoff = time.time() - RECORDING_SPOOL_TTL
+    for name in os.listdir(RECORDING_SPOOL_DIR):
+        if name.endswith(".json") and os.path.getmtime(os.path.join(RECORDING_SPOOL_DIR, name)) < cutoff:
+            remove_spool(name[:-len(".json")])
+
+
+def store_recording(session_id, recording_type, spool_path, ext="webm"):
+    """Upload a spooled recording file to the kyc_recording bucket and record it; returns the public URL."""
+    supabase = get_supabase()
+    file_path = f"kyc_recording/{uuid4()}.{ext}"
+    # Passing a path lets the storage client stream the file instead of loading it
+    with span("storage_upload", size=os.path.getsize(spool_path), kind="kyc_recording"):
+        supabase.storage.from_('kyc_recording').upload(
+            file_path, spool_path, {"content-type": RECORDING_CONTENT_TYPES.get(ext, "application/octet-stream")})
+    public_url = supabase.storage.from_('kyc_recording').get_public_url(file_path)
+    record_recording(session_id, recording_type, public_url)
+    return public_url
+
+
+def record_recording(session_id, recording_type, public_url):
+    """Store the recording URL in the kyc_recordings table."""
+    supabase = get_supabase()
+    try:
+        if recording_type == "full_process":
+            supabase.table('kyc_recordings').insert({
+                "session_id": session_id,
+                "screen_recording_url": public_url,
+                "mic_audio_url": public_url
+            }).execute()
+        log.info("recording stored", extra={"session_id": session_id, "recording_type": recording_type})
+    except Exception as e:
+        log.error("storing recording failed", extra={"session_id": session_id, "error": str(e)})
+
+
+def spool_upload_file(file, ext):
+    """Copy an UploadFile to a spool file in fixed-size blocks; returns its path."""
+    os.makedirs(RECORDING_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(RECORDING_SPOOL_DIR, f"{uuid4()}.{ext}")
+    with open(path, "wb") as out:
+        shutil.copyfileobj(file, out, 1024 * 1024)
+    return path
+
+
+def upload_status(upload_id, manifest):
+    return {"upload_id": upload_id, "next_index": manifest["next_index"], "bytes": manifest["bytes"]}
+
+
+def upload_not_found(upload_id):
+    return JSONResponse({"error": "unknown upload", "upload_id": upload_id}, status_code=404)
+
+
+@router.post("/upload/recording/init")
+async def init_recording_upload(request: Request):
+    # The recorder starts before the KYC session exists, so session_id may come at finalize
+    data = await request.json()
+    os.makedirs(RECORDING_SPOOL_DIR, exist_ok=True)
+    await asyncio.to_thread(remove_stale_spools)
+
+    upload_id = str(uuid4())
+    manifest = {
+        "session_id": data.get("session_id"),
+        "recording_type": data.get("recording_type", "full_process"),
+        "ext": data.get("ext", "webm"),
+        "next_index": 0,
+        "bytes": 0,
+        "created_at": time.time(),
+    }
+    open(spool_paths(upload_id)[0], "wb").close()
+    write_manifest(upload_id, manifest)
+    return upload_status(upload_id, manifest)
+
+
+@router.get("/upload/recording/{upload_id}")
+def get_recording_upload(upload_id: str):
+    manifest = read_manifest(upload_id)
+    if manifest is None:
+        return upload_not_found(upload_id)
+    return upload_status(upload_id, manifest)
+
+
+@router.put("/upload/recording/{upload_id}/chunk")
+async def append_recording_chunk(upload_id: str, index: int, request: Request):
+    lock = _locks.setdefault(upload_id, asyncio.Lock())
+    async with lock:
+        manifest = read_manifest(upload_id)
+        if manifest is None:
+            return upload_not_found(upload_id)
+        if index < manifest["next_index"]:
+            # Retried chunk that already landed; acknowledge without writing it twice
+            return upload_status(upload_id, manifest)
+        if index > manifest["next_index"]:
+            return JSONResponse({"error": "out of order chunk", **upload_status(upload_id, manifest)}, status_code=409)
+
+        size = 0
+        with open(spool_paths(upload_id)[0], "r+b") as spool:
+            # Drop anything left over from an earlier attempt that was cut off mid-chunk
+            spool.seek(manifest["bytes"])
+            spool.truncate()
+            async for block in request.stream():
+                size += len(block)
+                if size > RECORDING_MAX_CHUNK_BYTES:
+                    spool.truncate(manifest["bytes"])
+                    return JSONResponse({"error": f"chunk larger than {RECORDING_MAX_CHUNK_BYTES} bytes"},
+                                        status_code=413)
+                spool.write(block)
+
+        manifest["next_index"] += 1
+        manifest["bytes"] += size
+        write_manifest(upload_id, manifest)
+        return upload_status(upload_id, manifest)
+
+
+@router.post("/upload/recording/{upload_id}/finalize")
+async def finalize_recording_upload(upload_id: str, request: Request):
+    data = await request.json() if await request.body() else {}
+    lock = _locks.setdefault(upload_id, asyncio.Lock())
+    async with lock:
+        manifest = read_manifest(upload_id)
+        if manifest is None:
+            return upload_not_found(upload_id)
+        manifest["session_id"] = data.get("session_id") or manifest["session_id"]
+        if not manifest["session_id"]:
+            return JSONResponse({"error": "session_id is required"}, status_code=400)
+        if manifest["next_index"] == 0:
+            return JSONResponse({"error": "no chunks received", **upload_status(upload_id, manifest)}, status_code=400)
+        try:
+            public_url = await asyncio.to_thread(
+                store_recording, manifest["session_id"], manifest["recording_type"],
+                spool_paths(upload_id)[0], manifest["ext"])
+        except Exception as e:
+            # Keep the spool so finalize can be retried
+            log.error("recording upload failed", extra={"upload_id": upload_id, "error": str(e)})
+            return JSONResponse({"error": str(e), **upload_status(upload_id, manifest)}, status_code=502)
+        remove_spool(upload_id)
+    _locks.pop(upload_id, None)
+    return {"url": public_url, "bytes": manifest["bytes"], "chunks": manifest["next_index"]}
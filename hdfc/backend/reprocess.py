@@ -0,0 +1,257 @@
+import os
+import logging
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+
+from backend import idfy_client, kyc_repository, shared_state
+from backend.clients import get_supabase
+from backend.logs import configure_logging
+from backend.idfy_governor import IdfyDegraded
+from backend.raw_archive import slim_document
+from backend.kyc_pipeline import aadhaar_document, pan_document, task_failed
+
+log = logging.getLogger(__name__)
+
+# Offline re-extraction of stored documents, e.g. after an IDfy outage or when the
+# extraction settings change:
+#
+#   python -m backend.reprocess run [--doc-type aadhaar] [--only-failed] [--qr-info]
+#                                   [--concurrency 8] [--page-size 200] [--batch-size 50]
+#                                   [--checkpoint .reprocess.json] [--resume] [--dry-run]
+#
+# kyc_documents rows are read page by page in id order into a bounded queue, a fixed
+# number of workers re-run the IDfy extraction on the stored image URL (through the
+# same rate limits, retries and breaker as the API), and the new extracted_data is
+# written back with one upsert per batch. The checkpoint file records the highest id
+# below which every row is written, so --resume continues after an interruption without
+# redoing or skipping rows. IDfy traffic of this process is governed separately from
+# the API's, so lower IDFY_RATE_PER_SEC for the run to leave room for live sessions.
+#
+# Updated sessions are dropped from the API's details cache only when the run uses the
+# same KYC_SHARED_STATE (sqlite/redis) as the API; with the default in-process backend
+# the API keeps serving cached details until KYC_DETAILS_CACHE_TTL expires them.
+# --dry-run reads and counts the rows that would be re-extracted without calling IDfy.
+
+KYC_REPROCESS_PROGRESS_SECONDS = float(os.getenv("KYC_REPROCESS_PROGRESS_SECONDS", "10"))
+# A partial batch is written once its oldest result has waited this long
+KYC_REPROCESS_FLUSH_SECONDS = float(os.getenv("KYC_REPROCESS_FLUSH_SECONDS", "2"))
+FAILED_IDS_KEPT = 1000
+
+DOCUMENT_SELECT = "id, session_id, doc_type, image_url, face_crop_url:extracted_data->>face_crop_url"
+# Rows of any other doc_type (e.g. from /upload/image) are never re-extracted
+DOC_TYPES = ("aadhaar", "pan")
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_checkpoint(path, checkpoint):
+    # Written aside and renamed, so an interrupted run never leaves a torn file
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+class Watermark:
+    """Highest id such that every dispatched row up to it has finished."""
+
+    def __init__(self, start):
+        self.value = start
+        self.dispatched = deque()
+        self.finished = set()
+
+    def dispatch(self, row_id):
+        self.dispatched.append(row_id)
+
+    def finish(self, row_id):
+        self.finished.add(row_id)
+        while self.dispatched and self.dispatched[0] in self.finished:
+            self.value = self.dispatched.popleft()
+            self.finished.discard(self.value)
+
+
+def fetch_page(doc_type, only_failed, after_id, page_size):
+    supabase = get_supabase()
+    query = supabase.table('kyc_documents').select(DOCUMENT_SELECT).order('id').limit(page_size)
+    query = query.eq('doc_type', doc_type) if doc_type else query.in_('doc_type', list(DOC_TYPES))
+    if only_failed:
+        query = query.not_.is_('extracted_data->>error', 'null')
+    if after_id is not None:
+        query = query.gt('id', after_id)
+    return query.execute().data
+
+
+def write_rows(rows):
+    from postgrest import ReturnMethod
+    supabase = get_supabase()
+    supabase.table('kyc_documents').upsert(rows, on_conflict="id", returning=ReturnMethod.minimal).execute()
+
+
+async def extract(row, qr_info):
+    """Re-run the extraction of one stored row; returns the replacement document."""
+    session_id = row['session_id']
+    if row['doc_type'] not in DOC_TYPES:
+        raise ValueError(f"cannot re-extract doc_type {row['doc_type']!r}")
+    if row['doc_type'] == "aadhaar":
+        data = {"document1": row['image_url'], "consent": "yes"}
+        if qr_info:
+            data["advanced_details"] = {"extract_qr_info": True, "extract_last_4_digit": True}
+        result = await idfy_client.run_task(idfy_client.AADHAAR_EXTRACT, task_id=session_id + "_aadhaar",
+                                            group_id="kyc_group", data=data)
+        return aadhaar_document(session_id, row['image_url'], result, row.get('face_crop_url')), result
+    result = await idfy_client.run_task(idfy_client.PAN_EXTRACT, task_id=session_id + "_pan",
+                                        group_id="kyc_group", data={"document1": row['image_url']})
+    return pan_document(session_id, row['image_url'], result), result
+
+
+async def reprocess(doc_type=None, only_failed=False, qr_info=False, concurrency=8, page_size=200,
+                    batch_size=50, checkpoint_path=".reprocess.json", resume=False, dry_run=False):
+    """Re-run IDfy extraction over stored documents and write the results back."""
+    checkpoint = load_checkpoint(checkpoint_path) if resume else {}
+    # The watermark only means something for the selection it was taken over
+    selection = {"doc_type": doc_type, "only_failed": only_failed}
+    if checkpoint.setdefault("selection", selection) != selection:
+        raise SystemExit(f"{checkpoint_path} was written for {checkpoint['selection']}, not {selection}")
+    watermark = Watermark(checkpoint.get("last_id"))
+    stats = {"read": 0, "eligible": 0, "updated": 0, "failed": 0, "skipped": 0, "degraded_waits": 0, "batches": 0}
+    # Another process's cache can only be reached through a shared backend
+    invalidate = shared_state.state.shared
+    if not invalidate and not dry_run:
+        log.warning("KYC_SHARED_STATE is not shared; the API's cached details are left to expire")
+    failed_ids = checkpoint.get("failed_ids", [])
+    totals = {key: checkpoint.get(key, 0) for key in ("updated", "failed")}  # of earlier runs
+    rows_in = asyncio.Queue(maxsize=concurrency * 2)
+    results = asyncio.Queue()
+    started = time.monotonic()
+
+    async def produce():
+        after_id = watermark.value
+        while True:
+            page = await asyncio.to_thread(fetch_page, doc_type, only_failed, after_id, page_size)
+            if not page:
+                break
+            after_id = page[-1]['id']
+            for row in page:
+                stats["read"] += 1
+                if row['doc_type'] not in DOC_TYPES:
+                    stats["skipped"] += 1
+                    continue
+                stats["eligible"] += 1
+                watermark.dispatch(row['id'])
+                # Blocks while the workers are behind, so memory stays at one page plus the queue
+                await rows_in.put(row)
+        for _ in range(concurrency):
+            await rows_in.put(None)
+
+    async def work():
+        while (row := await rows_in.get()) is not None:
+            if dry_run:
+                await results.put((row, None))
+                continue
+            while True:
+                try:
+                    document, result = await extract(row, qr_info)
+                    break
+                except IdfyDegraded as e:
+                    # IDfy is down: wait for the breaker instead of failing the rest of the run
+                    stats["degraded_waits"] += 1
+                    await asyncio.sleep(e.retry_after)
+                except Exception as e:
+                    log.warning("reprocess of document failed", extra={"document_id": row['id'], "error": str(e)})
+                    document, result = None, {"error": str(e)}
+                    break
+            # A failed re-extraction keeps the stored data rather than overwriting it
+            await results.put((row, None if task_failed(result) else document))
+        await results.put(None)
+
+    async def flush(batch):
+        documents = [document for _, document in batch if document is not None]
+        if documents and not dry_run:
+            try:
+                documents = await asyncio.gather(*(slim_document(doc) for doc in documents))
+                await asyncio.to_thread(write_rows, documents)
+                stats["batches"] += 1
+            except Exception as e:
+                log.error("reprocess batch write failed", extra={"rows": len(batch), "error": str(e)})
+                batch = [(row, None) for row, _ in batch]
+        for row, document in batch:
+            if document is not None:
+                stats["updated"] += 1
+                if invalidate:
+                    await kyc_repository.invalidate_details(row['session_id'])
+            elif not dry_run:
+                stats["failed"] += 1
+                failed_ids.append(row['id'])
+            watermark.finish(row['id'])
+        if not dry_run:
+            checkpoint.update(last_id=watermark.value, failed_ids=failed_ids[-FAILED_IDS_KEPT:],
+                              **{key: totals[key] + stats[key] for key in totals})
+            save_checkpoint(checkpoint_path, checkpoint)
+
+    async def write():
+        batch = []
+        running = concurrency
+        last_report = batch_started = time.monotonic()
+        while running:
+            try:
+                item = await asyncio.wait_for(results.get(), KYC_REPROCESS_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                item = False
+            if item is None:
+                running -= 1
+            elif item:
+                row, document = item
+                if not batch:
+                    batch_started = time.monotonic()
+                # Row ids are the primary key the upsert matches on
+                batch.append((row, {"id": row['id'], **document} if document else None))
+            if batch and (len(batch) >= batch_size or not running
+                          or time.monotonic() - batch_started >= KYC_REPROCESS_FLUSH_SECONDS):
+                await flush(batch)
+                batch = []
+            if time.monotonic() - last_report >= KYC_REPROCESS_PROGRESS_SECONDS:
+                last_report = time.monotonic()
+                report(stats, started, rows_in.qsize())
+
+    await asyncio.gather(produce(), write(), *(work() for _ in range(concurrency)))
+    await idfy_client.close_client()
+    report(stats, started, 0)
+    if failed_ids:
+        print(f"Failed document ids (last {min(len(failed_ids), 20)}): {failed_ids[-20:]}")
+    return stats
+
+
+def report(stats, started, queued):
+    elapsed = time.monotonic() - started
+    rate = stats["read"] / elapsed if elapsed else 0.0
+    print(f"{stats['read']} read, {stats['eligible']} eligible, {stats['updated']} updated, {stats['failed']} failed, "
+          f"{stats['skipped']} skipped, {queued} queued, {stats['batches']} batches, {rate:.1f} docs/s over {elapsed:.0f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m backend.reprocess")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help=reprocess.__doc__)
+    run_parser.add_argument("--doc-type", choices=["aadhaar", "pan"])
+    run_parser.add_argument("--only-failed", action="store_true", help="only rows whose stored extraction failed")
+    run_parser.add_argument("--qr-info", action="store_true", help="ask IDfy to read the Aadhaar QR code too")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--page-size", type=int, default=200)
+    run_parser.add_argument("--batch-size", type=int, default=50)
+    run_parser.add_argument("--checkpoint", default=".reprocess.json")
+    run_parser.add_argument("--resume", action="store_true")
+    run_parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    configure_logging()
+    if args.command == "run":
+        asyncio.run(reprocess(args.doc_type, args.only_failed, args.qr_info, args.concurrency, args.page_size,
+                              args.batch_size, args.checkpoint, args.resume, args.dry_run))
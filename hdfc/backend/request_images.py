@@ -0,0 +1,100 @@
+import os
+import json
+import base64
+import binascii
+
+# Reads KYC images from a request in any of the supported transports:
+#   - application/json with base64 data URLs (original frontend format)
+#   - multipart/form-data with the image as a file part
+#   - a raw binary body (image/* or application/octet-stream), other fields in the query string
+# Binary bodies are streamed in chunks and joined once, and the resulting bytes are
+# handed to storage upload as-is.
+
+KYC_MAX_IMAGE_BYTES = int(os.getenv("KYC_MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+# Room for the non-image fields of a JSON body
+JSON_FIELDS_ALLOWANCE = 64 * 1024
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+class BadImageRequest(Exception):
+    pass
+
+
+def decode_image(b64):
+    if not isinstance(b64, str):
+        raise BadImageRequest("image must be a base64 string")
+    try:
+        return base64.b64decode(b64.split(",")[-1], validate=True)
+    except binascii.Error:
+        raise BadImageRequest("image is not valid base64")
+
+
+def declared_length(request):
+    declared = request.headers.get("content-length")
+    if not declared:
+        return None
+    try:
+        return int(declared)
+    except ValueError:
+        raise BadImageRequest("invalid Content-Length header")
+
+
+async def read_stream(request, limit=KYC_MAX_IMAGE_BYTES):
+    declared = declared_length(request)
+    if declared is not None and declared > limit:
+        raise PayloadTooLarge(f"image larger than {limit} bytes")
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise PayloadTooLarge(f"image larger than {limit} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def read_kyc_request(request, image_fields):
+    """Return (fields, images) where images maps each present image field to raw bytes."""
+    content_type = request.headers.get("content-type", "")
+
+    if content_type.startswith("application/json"):
+        # Base64 adds a third; every image field may be present
+        body = await read_stream(request, len(image_fields) * KYC_MAX_IMAGE_BYTES * 4 // 3 + JSON_FIELDS_ALLOWANCE)
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise BadImageRequest("invalid JSON body")
+        if not isinstance(data, dict):
+            raise BadImageRequest("JSON body must be an object")
+        images = {f: decode_image(data[f]) for f in image_fields if data.get(f)}
+        if any(len(img) > KYC_MAX_IMAGE_BYTES for img in images.values()):
+            raise PayloadTooLarge(f"image larger than {KYC_MAX_IMAGE_BYTES} bytes")
+        fields = {k: v for k, v in data.items() if k not in image_fields}
+        return fields, images
+
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        images = {}
+        fields = {}
+        for key, value in form.multi_items():
+            if key in image_fields and hasattr(value, "read"):
+                if value.size is not None and value.size > KYC_MAX_IMAGE_BYTES:
+                    raise PayloadTooLarge(f"image larger than {KYC_MAX_IMAGE_BYTES} bytes")
+                images[key] = await value.read()
+            elif isinstance(value, str):
+                fields[key] = value
+        await form.close()
+        return fields, images
+
+    # Raw binary body; ?doc_type= picks the field when an endpoint takes several images
+    fields = dict(request.query_params)
+    if request.headers.get("x-session-id"):
+        fields.setdefault("session_id", request.headers["x-session-id"])
+    field = f"{fields['doc_type']}_image" if fields.get("doc_type") else image_fields[0]
+    if field not in image_fields:
+        return fields, {}
+    body = await read_stream(request)
+    return fields, ({field: body} if body else {})
@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Key/value state shared by every uvicorn worker on a node, selected by KYC_SHARED_STATE:
+#   memory                  single process (default); state lives in this worker only
+#   sqlite:///path/to/file  one SQLite file (WAL) shared by the workers of a node
+#   redis://host:port/db    Redis, or anything speaking its protocol (needs the redis package)
+# Used for the content caches, KYC jobs, idempotency records and session summaries, so a
+# request can land on any worker. Values must be JSON-serialisable; every entry has its
+# own expiry. Calls are synchronous; from async code go through offload(), which runs
+# them in a worker thread when they reach SQLite or Redis (the file lock or a network
+# round trip must not stall the event loop) and inline for the in-memory backend.
+
+KYC_SHARED_STATE = os.getenv("KYC_SHARED_STATE", "memory")
+KYC_SHARED_STATE_SIZE = int(os.getenv("KYC_SHARED_STATE_SIZE", "100000"))
+SQLITE_PURGE_EVERY = 1000
+
+
+class MemoryState:
+    shared = False
+
+    def __init__(self, maxsize=KYC_SHARED_STATE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            del self.entries[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self.lock:
+            entry = self._live(key)
+            return entry[1] if entry else None
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def add(self, key, value, ttl):
+        """Set key only if it is absent; returns whether it was set."""
+        with self.lock:
+            if self._live(key) is not None:
+                return False
+            self.entries[key] = (time.monotonic() + ttl, value)
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def ping(self):
+        return True
+
+
+class SQLiteState:
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit; BEGIN IMMEDIATE where a read and a write must not interleave
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM state WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+                              (key, json.dumps(value), time.time() + ttl))
+            self._purge()
+
+    def add(self, key, value, ttl):
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("DELETE FROM state WHERE key = ? AND expires_at <= ?", (key, now))
+                added = self.conn.execute("INSERT OR IGNORE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+                                          (key, json.dumps(value), now + ttl)).rowcount == 1
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def _purge(self):
+        self.writes += 1
+        if self.writes % SQLITE_PURGE_EVERY == 0:
+            self.conn.execute("DELETE FROM state WHERE expires_at <= ?", (time.time(),))
+
+    def ping(self):
+        with self.lock:
+            self.conn.execute("SELECT 1").fetchone()
+        return True
+
+
+class RedisState:
+    shared = True
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self.client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(key, json.dumps(value), px=max(1, int(ttl * 1000)))
+
+    def add(self, key, value, ttl):
+        return bool(self.client.set(key, json.dumps(value), px=max(1, int(ttl * 1000)), nx=True))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def ping(self):
+        return bool(self.client.ping())
+
+
+class Namespace:
+    """A prefixed view of the shared state with one TTL, usable where a TTLCache is."""
+
+    def __init__(self, state, name, ttl):
+        self.state = state
+        self.name = name
+        self.ttl = ttl
+
+    @property
+    def blocking(self):
+        return self.state.shared
+
+    def _key(self, key):
+        return f"kyc:{self.name}:{key}"
+
+    def get(self, key):
+        return self.state.get(self._key(key))
+
+    def set(self, key, value):
+        self.state.set(self._key(key), value, self.ttl)
+
+    def add(self, key, value):
+        return self.state.add(self._key(key), value, self.ttl)
+
+    def delete(self, key):
+        self.state.delete(self._key(key))
+
+
+def open_state(url):
+    if url == "memory":
+        return MemoryState()
+    if url.startswith("sqlite:///"):
+        # sqlite:///relative/path or sqlite:////absolute/path, as in SQLAlchemy URLs
+        return SQLiteState(url.removeprefix("sqlite:///"))
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisState(url)
+    raise ValueError(f"Unsupported KYC_SHARED_STATE: {url}")
+
+
+state = open_state(KYC_SHARED_STATE)
+
+
+def namespace(name, ttl):
+    return Namespace(state, name, ttl)
+
+
+async def offload(call, *args):
+    """Await call(*args), a bound method of a store; in a thread if its store is blocking."""
+    if getattr(call.__self__, "blocking", False):
+        return await asyncio.to_thread(call, *args)
+    return call(*args)
+
+
+def describe():
+    return {"backend": KYC_SHARED_STATE.split(":", 1)[0], "shared": state.shared}
@@ -1,18 +1,28 @@
 import os
-from dotenv import load_dotenv
+import asyncio
 from fastapi import APIRouter, UploadFile, File, Form
-from supabase import create_client, Client
 from uuid import uuid4
 
-# Load environment variables
-load_dotenv()
+from backend.metrics import span
+from backend.clients import get_supabase
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_API_KEY = os.getenv("SUPABASE_API_KEY")
+router = APIRouter()
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_API_KEY)
 
-router = APIRouter()
+def store_document(session_id, doc_type, file_path, content):
+    supabase = get_supabase()
+    with span("storage_upload", size=len(content), kind="kyc_document"):
+        supabase.storage.from_('kyc_document').upload(file_path, content)
+    public_url = supabase.storage.from_('kyc_document').get_public_url(file_path)
+    # Insert into kyc_documents table
+    with span("db_insert"):
+        supabase.table('kyc_documents').insert({
+            "session_id": session_id,
+            "doc_type": doc_type,
+            "image_url": public_url,
+        }).execute()
+    return public_url
+
 
 @router.post("/upload/image")
 async def upload_image(session_id: str = Form(...), doc_type: str = Form(...), file: UploadFile = File(...)):
@@ -20,35 +30,19 @@ async def upload_image(session_id: str = Form(...), doc_type: str = Form(...), f
     file_id = str(uuid4())
     file_path = f"kyc_document/{file_id}.{ext}"
     content = await file.read()
-    supabase.storage.from_('kyc_document').upload(file_path, content)
-    public_url = supabase.storage.from_('kyc_document').get_public_url(file_path)
-    # Insert into kyc_documents table
-    supabase.table('kyc_documents').insert({
-        "session_id": session_id,
-        "doc_type": doc_type,
-        "image_url": public_url,
-    }).execute()
+    # Storage and database calls block, so they run in a worker thread
+    public_url = await asyncio.to_thread(store_document, session_id, doc_type, file_path, content)
     return {"url": public_url}
 
 @router.post("/upload/recording")
 async def upload_recording(session_id: str = Form(...), file: UploadFile = File(...), recording_type: str = Form(...)):
+    # Whole-file upload kept for old clients; new clients use the chunked protocol in
+    # backend.recording_uploads. The file goes through a disk spool rather than memory.
+    from backend.recording_uploads import spool_upload_file, store_recording
     ext = file.filename.split('.')[-1]
-    file_id = str(uuid4())
-    file_path = f"kyc_recording/{file_id}.{ext}"
-    content = await file.read()
-    supabase.storage.from_('kyc_recording').upload(file_path, content)
-    public_url = supabase.storage.from_('kyc_recording').get_public_url(file_path)
-    
-    # Store recording URL in kyc_recordings table
+    spool_path = await asyncio.to_thread(spool_upload_file, file.file, ext)
     try:
-        if recording_type == "full_process":
-            supabase.table('kyc_recordings').insert({
-                "session_id": session_id,
-                "screen_recording_url": public_url,
-                "mic_audio_url": public_url
-            }).execute()
-        print(f"✓ Recording stored for session {session_id}")
-    except Exception as e:
-        print(f"Error storing recording: {e}")
-    
+        public_url = await asyncio.to_thread(store_recording, session_id, recording_type, spool_path, ext)
+    finally:
+        os.remove(spool_path)
     return {"url": public_url}
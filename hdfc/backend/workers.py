@@ -0,0 +1,58 @@
+import os
+import logging
+import asyncio
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+log = logging.getLogger(__name__)
+
+# Shared process pool for CPU-bound image work (decode, resize, encode, detection),
+# so OpenCV calls never run on the event loop.
+
+KYC_PROCESS_WORKERS = int(os.getenv("KYC_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_pool = None
+
+
+def warm_worker():
+    # Import OpenCV and load the face detector once per worker process
+    # instead of on the first request
+    from backend.face_detect import get_detector
+    get_detector()
+
+
+def get_process_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=KYC_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=warm_worker,
+        )
+    return _pool
+
+
+def ping():
+    return os.getpid()
+
+
+async def warm_process_pool():
+    """Start the pool's worker processes in the background instead of on the first image."""
+    try:
+        await asyncio.gather(*(run_in_process(ping) for _ in range(KYC_PROCESS_WORKERS)))
+    except Exception as e:
+        log.warning("process pool warm-up failed", extra={"error": str(e)})
+
+
+async def run_in_process(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), partial(fn, *args, **kwargs))
+
+
+def shutdown_process_pool():
+    global _pool
+    if _pool is not None:
+        # Wait for the workers to exit so none outlive the server process
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,216 @@
+"""Drive full KYC sessions against the backend and report latency, throughput and memory.
+
+Each session runs Aadhaar -> PAN -> face -> get-details -> update the way the frontend
+does. Concurrency levels run one after another; for each one the report has sessions/s,
+session p50/p95/p99, p95 per step (ms, one column per step), errors and backend RSS (from /metrics).
+
+    # start the mock dependencies and a backend wired to them, then run the load
+    python benchmarks/load_kyc.py --start --concurrency 1 5 20
+
+    # several backend workers sharing state through a SQLite file
+    python benchmarks/load_kyc.py --start --workers 4 --concurrency 20
+
+    # captures PUT straight to storage through signed URLs, as the frontend does
+    python benchmarks/load_kyc.py --start --direct --concurrency 5
+
+    # or load an already running backend
+    python benchmarks/load_kyc.py --url http://127.0.0.1:8000 --concurrency 5
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STEPS = ["aadhaar", "pan", "face", "details", "update"]
+IMAGES = {"aadhaar": "test_aadhar.png", "pan": "test_pan.png", "face": "test_tanish.jpeg"}
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def load_images():
+    images = {}
+    for doc_type, name in IMAGES.items():
+        with open(os.path.join(ROOT, name), "rb") as f:
+            images[doc_type] = f.read()
+    return images
+
+
+async def direct_step(client, doc_type, data, session_id):
+    """Sign, PUT the image to storage, then complete; returns the completion response."""
+    sign = await client.post("/upload/sign", json={"kind": doc_type, "ext": "png", "session_id": session_id})
+    if sign.status_code >= 400:
+        return sign
+    upload = sign.json()
+    put = await client.put(upload["signed_url"], content=data, headers={"content-type": upload["content_type"]})
+    if put.status_code >= 400:
+        return put
+    return await client.post(upload["complete_url"], json={"session_id": session_id or upload["session_id"]})
+
+
+async def run_session(client, images, n, unique, direct=False):
+    """One session; returns ({step: seconds}, error or None)."""
+    timings = {}
+
+    def image(doc_type):
+        # Trailing bytes change the content hash without affecting decoding, so each
+        # session misses the upload and extraction caches like a real user would
+        return images[doc_type] + (f"session-{n}-{time.time_ns()}".encode() if unique else b"")
+
+    async def step(name, method, path, **kwargs):
+        started = time.perf_counter()
+        if direct and name in IMAGES:
+            response = await direct_step(client, name, kwargs["files"][f"{name}_image"][1],
+                                         kwargs.get("data", {}).get("session_id"))
+        else:
+            response = await client.request(method, path, **kwargs)
+        timings[name] = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError(f"{name}: HTTP {response.status_code} {response.text[:120]}")
+        return response.json()
+
+    try:
+        body = await step("aadhaar", "POST", "/kyc/process-aadhaar",
+                          files={"aadhaar_image": ("aadhaar.png", image("aadhaar"), "image/png")})
+        session_id = body["session_id"]
+        await step("pan", "POST", "/kyc/process-pan", data={"session_id": session_id},
+                   files={"pan_image": ("pan.png", image("pan"), "image/png")})
+        await step("face", "POST", "/kyc/process-face", data={"session_id": session_id},
+                   files={"face_image": ("face.jpg", image("face"), "image/jpeg")})
+        await step("details", "GET", f"/kyc/get-details/{session_id}")
+        await step("update", "POST", "/kyc/update", json={"session_id": session_id})
+        return timings, None
+    except Exception as e:
+        return timings, str(e) or type(e).__name__
+
+
+async def backend_rss_mb(client):
+    try:
+        text = (await client.get("/metrics")).text
+    except httpx.HTTPError:
+        return None
+    for line in text.splitlines():
+        if line.startswith("process_resident_memory_bytes "):
+            return float(line.split()[1]) / 1024 / 1024
+    return None
+
+
+async def run_level(url, concurrency, sessions, images, unique, direct=False):
+    limits = httpx.Limits(max_connections=concurrency * 2)
+    async with httpx.AsyncClient(base_url=url, timeout=120.0, limits=limits) as client:
+        queue = asyncio.Queue()
+        for n in range(sessions):
+            queue.put_nowait(n)
+        results = []
+
+        async def user():
+            while not queue.empty():
+                n = queue.get_nowait()
+                started = time.perf_counter()
+                timings, error = await run_session(client, images, n, unique, direct)
+                results.append((time.perf_counter() - started, timings, error))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        rss = await backend_rss_mb(client)
+
+    ok = [total for total, _, error in results if error is None]
+    errors = [error for _, _, error in results if error is not None]
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "sessions_per_s": len(ok) / elapsed,
+        "p50": percentile(ok, 0.50),
+        "p95": percentile(ok, 0.95),
+        "p99": percentile(ok, 0.99),
+        "step_p95": {s: percentile([t[s] for _, t, e in results if s in t], 0.95) for s in STEPS},
+        "errors": errors,
+        "rss_mb": rss,
+    }
+
+
+def start_services(mock_port, backend_port, env_overrides, workers=1):
+    """Start the mock dependencies and a backend pointed at them; returns the processes."""
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    env = {**os.environ,
+           "IDFY_BASE_URL": mock_url, "IDFY_ACCOUNT_ID": "mock", "IDFY_API_KEY": "mock",
+           "SUPABASE_URL": mock_url, "SUPABASE_API_KEY": "mock",
+           "CARTESIA_BASE_URL": mock_url, "CARTESIA_API_KEY": "mock",
+           "TTS_CACHE_DIR": tempfile.mkdtemp(prefix="kyc-load-tts-"),
+           **env_overrides}
+    if workers > 1:
+        env.setdefault("KYC_SHARED_STATE", f"sqlite:///{tempfile.mkdtemp(prefix='kyc-load-state-')}/state.db")
+    mock = subprocess.Popen([sys.executable, "-m", "uvicorn", "--app-dir", os.path.join(ROOT, "benchmarks"),
+                             "mock_services:app", "--port", str(mock_port), "--log-level", "warning"],
+                            cwd=ROOT, env=env)
+    backend = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(backend_port),
+                                "--workers", str(workers), "--log-level", "warning"],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    for url in (mock_url + "/mock/stats", f"http://127.0.0.1:{backend_port}/readyz"):
+        for _ in range(100):
+            try:
+                if httpx.get(url, timeout=1.0).status_code == 200:
+                    break
+                time.sleep(0.2)
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        else:
+            raise RuntimeError(f"{url} did not come up")
+    return [mock, backend]
+
+
+def print_report(r):
+    step_p95 = " ".join(f"{r['step_p95'][s] * 1000:>7.0f}" for s in STEPS)
+    rss = f"{r['rss_mb']:.0f}" if r["rss_mb"] is not None else "-"
+    print(f"{r['concurrency']:>5} {r['sessions']:>8} {r['sessions_per_s']:>8.2f} {r['p50'] * 1000:>8.0f} "
+          f"{r['p95'] * 1000:>8.0f} {r['p99'] * 1000:>8.0f} {step_p95} {len(r['errors']):>6} {rss:>7}")
+    for error in sorted(set(r["errors"]))[:3]:
+        print(f"      error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--sessions", type=int, help="sessions per level (default 3x concurrency)")
+    parser.add_argument("--cached", action="store_true", help="reuse identical images (cache hits)")
+    parser.add_argument("--start", action="store_true", help="start mock services and a backend")
+    parser.add_argument("--direct", action="store_true", help="upload images through signed storage URLs")
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--backend-port", type=int, default=8100)
+    parser.add_argument("--workers", type=int, default=1, help="backend worker processes (with --start)")
+    parser.add_argument("--env", nargs="*", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the started services, e.g. MOCK_IDFY_TASK_MS=500")
+    args = parser.parse_args()
+
+    processes = []
+    url = args.url
+    if args.start:
+        processes = start_services(args.mock_port, args.backend_port, dict(kv.split("=", 1) for kv in args.env),
+                                   args.workers)
+        url = f"http://127.0.0.1:{args.backend_port}"
+    try:
+        images = load_images()
+        print(f"{'conc':>5} {'sessions':>8} {'sess/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              + " ".join(f"{s[:7]:>7}" for s in STEPS) + f" {'errors':>6} {'RSS MB':>7}")
+        for concurrency in args.concurrency:
+            sessions = args.sessions or concurrency * 3
+            print_report(asyncio.run(run_level(url, concurrency, sessions, images, not args.cached, args.direct)))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Caller-side cost of logging one KYC step: print of the full payload vs the structured logger.
+
+Each "request" logs what verify_aadhaar does: the IDfy extraction result and the store
+confirmation. Output is discarded (--sink null) or written to a pipe read by a slow
+consumer (--sink pipe, like a container log driver under load). us/request is what the
+request handler pays with the listener thread running alongside (it competes for the
+GIL); the "enqueue only" row pauses the listener to show the caller-side cost alone.
+drain is how long the listener then needs to write everything out, CPU ms the process
+CPU time of the whole run, and MB what reached the sink.
+
+    python benchmarks/log_overhead.py --requests 20000 --sink pipe
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from backend import logs
+
+AADHAAR_RESULT = {
+    "action": "extract", "task_id": "bench_aadhaar", "group_id": "kyc_group", "status": "completed",
+    "request_id": "4c6b0f0e-6a6d-4d4e-9c55-1f0c2b7a9d11", "created_at": "2024-01-01T10:00:00+05:30",
+    "completed_at": "2024-01-01T10:00:02+05:30",
+    "result": {"extraction_output": {
+        "name_on_card": "Ravi Kumar Sharma", "fathers_name": "Mohan Lal Sharma", "id_number": "XXXXXXXX1234",
+        "date_of_birth": "1990-05-14", "year_of_birth": "1990", "gender": "Male",
+        "address": "12, MG Road, Sector 4, Near City Mall, Bengaluru, Karnataka", "district": "Bengaluru",
+        "state": "Karnataka", "pincode": "560001", "is_scanned": False, "minor": False,
+        "qr_info": {"status": "not_present"}, "id_proof_type": "ID_AND_ADDRESS_PROOF",
+    }},
+}
+
+
+class Sink:
+    """Stand-in for stdout that counts the bytes written and forwards them (or not)."""
+
+    def __init__(self, target=None):
+        self.target = target
+        self.written = 0
+
+    def write(self, text):
+        self.written += len(text)
+        if self.target is not None:
+            self.target.write(text)
+
+    def flush(self):
+        if self.target is not None:
+            self.target.flush()
+
+
+def run_print(requests):
+    started = time.perf_counter()
+    for i in range(requests):
+        print("Aadhaar result:", AADHAAR_RESULT)
+        print("✓ Aadhaar stored")
+    return time.perf_counter() - started, 0.0
+
+
+def run_logger(requests, sample, paused=False):
+    logs.KYC_LOG_PAYLOAD_SAMPLE = sample
+    logs.configure_logging()
+    if paused:
+        logs._listener.stop()
+    log = logging.getLogger("backend.kyc_pipeline")
+    started = time.perf_counter()
+    for i in range(requests):
+        logs.bind(f"bench-{i}")
+        log.info("aadhaar extraction finished",
+                 extra={"task_status": AADHAAR_RESULT["status"], "payload": AADHAAR_RESULT})
+        log.info("aadhaar stored")
+    elapsed = time.perf_counter() - started
+    drain_started = time.perf_counter()
+    if paused:
+        logs._listener.start()
+    logs.stop_logging()
+    return elapsed, time.perf_counter() - drain_started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--sink", choices=["null", "pipe"], default="null")
+    parser.add_argument("--reader-delay", type=float, default=0.0005,
+                        help="pipe reader pause per 4 KB read, in seconds")
+    args = parser.parse_args()
+    # Large enough that nothing is dropped, so every mode writes the same records
+    logs.KYC_LOG_QUEUE_SIZE = args.requests * 2
+
+    sample = logs.KYC_LOG_PAYLOAD_SAMPLE
+    modes = [
+        ("print full payload", lambda: run_print(args.requests)),
+        (f"queue logger, sample {sample:g}", lambda: run_logger(args.requests, sample)),
+        ("queue logger, sample 1 (redacted)", lambda: run_logger(args.requests, 1.0)),
+        ("queue logger, enqueue only", lambda: run_logger(args.requests, sample, True)),
+    ]
+    stdout = sys.stdout
+    results = []
+    reader = ("import sys, time\n"
+              f"while sys.stdin.buffer.read1(4096):\n    time.sleep({args.reader_delay})\n")
+    for name, run in modes:
+        consumer = None
+        if args.sink == "pipe":
+            consumer = subprocess.Popen([sys.executable, "-c", reader], stdin=subprocess.PIPE, text=True)
+            sink = Sink(consumer.stdin)
+        else:
+            sink = Sink()
+        sys.stdout = sink
+        cpu_started = time.process_time()
+        try:
+            elapsed, drain = run()
+            cpu = time.process_time() - cpu_started
+        finally:
+            sys.stdout = stdout
+            if consumer is not None:
+                consumer.stdin.close()
+                consumer.wait()
+        results.append((name, elapsed, drain, cpu, sink.written))
+
+    print(f"{args.requests} requests, 2 log calls each, sink {args.sink}")
+    print(f"{'mode':<36} {'us/request':>11} {'drain s':>8} {'CPU ms':>8} {'MB':>7}")
+    for name, elapsed, drain, cpu, written in results:
+        print(f"{name:<36} {elapsed / args.requests * 1e6:>11.1f} {drain:>8.2f} {cpu * 1000:>8.0f} {written / 1e6:>7.1f}")
+    print(f"dropped: {logs.log_stats['dropped']}")
+    ratio = results[1][1] / results[0][1]
+    if ratio > 1:
+        print(f"the queue logger costs the caller {ratio:.1f}x what print does on this sink")
+    else:
+        print(f"the queue logger costs the caller {1 / ratio:.1f}x less than print on this sink")
+
+
+if __name__ == "__main__":
+    main()
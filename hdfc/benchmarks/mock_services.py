@@ -0,0 +1,324 @@
+"""Local stand-ins for IDfy, Supabase (storage incl. signed uploads + PostgREST) and Cartesia TTS.
+
+Lets the backend run end to end without calling paid APIs. Point it here with
+IDFY_BASE_URL, SUPABASE_URL and CARTESIA_BASE_URL (benchmarks/load_kyc.py --start does
+this). Latency and failures are configurable through MOCK_* environment variables:
+
+    MOCK_IDFY_TASK_MS / MOCK_IDFY_TASK_SIGMA   time until an async task completes (lognormal)
+    MOCK_IDFY_FAILURE_RATE                     share of tasks that end in status "failed"
+    MOCK_IDFY_THROTTLE_RATE                    share of IDfy calls answered with 429
+    MOCK_HTTP_MS                               added latency per IDfy / Supabase request
+    MOCK_TTS_TTFB_MS, MOCK_TTS_CHUNKS          Cartesia first-chunk delay and chunk count
+
+    uvicorn --app-dir benchmarks mock_services:app --port 9100
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import itertools
+from uuid import uuid4
+from collections import OrderedDict
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+MOCK_IDFY_TASK_MS = float(os.getenv("MOCK_IDFY_TASK_MS", "1500"))
+MOCK_IDFY_TASK_SIGMA = float(os.getenv("MOCK_IDFY_TASK_SIGMA", "0.4"))
+MOCK_IDFY_FAILURE_RATE = float(os.getenv("MOCK_IDFY_FAILURE_RATE", "0"))
+MOCK_IDFY_THROTTLE_RATE = float(os.getenv("MOCK_IDFY_THROTTLE_RATE", "0"))
+MOCK_HTTP_MS = float(os.getenv("MOCK_HTTP_MS", "20"))
+MOCK_TTS_TTFB_MS = float(os.getenv("MOCK_TTS_TTFB_MS", "150"))
+MOCK_TTS_CHUNKS = int(os.getenv("MOCK_TTS_CHUNKS", "8"))
+MOCK_STORAGE_MAX_OBJECTS = int(os.getenv("MOCK_STORAGE_MAX_OBJECTS", "2000"))
+
+app = FastAPI()
+
+counters = {"idfy_submits": 0, "idfy_polls": 0, "idfy_throttled": 0, "storage_uploads": 0,
+            "storage_bytes": 0, "db_inserts": 0, "db_rows": 0, "db_selects": 0, "db_updates": 0, "tts": 0}
+
+
+async def http_latency():
+    if MOCK_HTTP_MS:
+        await asyncio.sleep(random.expovariate(1000 / MOCK_HTTP_MS))
+
+
+@app.get("/mock/stats")
+def mock_stats():
+    return {**counters, "tables": {name: len(rows) for name, rows in tables.items()}}
+
+
+# --- IDfy ---------------------------------------------------------------------
+
+tasks = {}
+
+EXTRACTIONS = {
+    "ind_aadhaar_plus": lambda: {"name_on_card": "Test User", "id_number": "XXXX XXXX 1234",
+                                 "date_of_birth": "1990-01-01", "gender": "M", "address": "Mumbai"},
+    "ind_pan": lambda: {"name_on_card": "TEST USER", "id_number": "ABCDE1234F", "date_of_birth": "1990-01-01"},
+}
+
+
+def task_result(kind):
+    for name, extraction in EXTRACTIONS.items():
+        if kind.endswith(name):
+            return {"extraction_output": extraction()}
+    if "liveness" in kind:
+        return {"is_live": True, "face_detected": True}
+    return {"match_band": "green", "match_score": round(random.uniform(80, 99), 1)}
+
+
+def throttled():
+    if random.random() < MOCK_IDFY_THROTTLE_RATE:
+        counters["idfy_throttled"] += 1
+        return JSONResponse({"error": "RATE_LIMITED", "message": "Too many requests"}, status_code=429)
+    return None
+
+
+@app.post("/v3/tasks/async/{kind:path}")
+async def idfy_submit(kind: str, request: Request):
+    await http_latency()
+    if (response := throttled()) is not None:
+        return response
+    body = await request.json()
+    counters["idfy_submits"] += 1
+    request_id = str(uuid4())
+    duration = random.lognormvariate(0, MOCK_IDFY_TASK_SIGMA) * MOCK_IDFY_TASK_MS / 1000
+    tasks[request_id] = {
+        "kind": kind,
+        "task_id": body.get("task_id"),
+        "group_id": body.get("group_id"),
+        "done_at": time.monotonic() + duration,
+        "fails": random.random() < MOCK_IDFY_FAILURE_RATE,
+    }
+    return JSONResponse({"request_id": request_id}, status_code=202)
+
+
+@app.get("/v3/tasks")
+async def idfy_task(request_id: str):
+    await http_latency()
+    if (response := throttled()) is not None:
+        return response
+    counters["idfy_polls"] += 1
+    task = tasks.get(request_id)
+    if task is None:
+        return JSONResponse({"error": "NOT_FOUND", "message": "Unknown request_id"}, status_code=404)
+    body = {"request_id": request_id, "task_id": task["task_id"], "group_id": task["group_id"],
+            "type": task["kind"].split("/")[-1]}
+    if time.monotonic() < task["done_at"]:
+        return [{**body, "status": "in_progress"}]
+    tasks.pop(request_id, None)
+    if task["fails"]:
+        return [{**body, "status": "failed", "error": "BAD_REQUEST", "message": "Mock failure"}]
+    return [{**body, "status": "completed", "result": task_result(task["kind"])}]
+
+
+# --- Supabase storage -----------------------------------------------------------
+
+objects = OrderedDict()
+
+
+def remember_object(key, data):
+    objects[key] = data
+    while len(objects) > MOCK_STORAGE_MAX_OBJECTS:
+        objects.popitem(last=False)
+
+
+signed_uploads = {}
+
+
+@app.post("/storage/v1/object/upload/sign/{bucket}/{path:path}")
+async def storage_sign_upload(bucket: str, path: str):
+    await http_latency()
+    token = str(uuid4())
+    signed_uploads[token] = f"{bucket}/{path}"
+    return {"url": f"/object/upload/sign/{bucket}/{path}?token={token}"}
+
+
+@app.put("/storage/v1/object/upload/sign/{bucket}/{path:path}")
+async def storage_signed_upload(bucket: str, path: str, token: str, request: Request):
+    await http_latency()
+    if signed_uploads.pop(token, None) != f"{bucket}/{path}":
+        return JSONResponse({"statusCode": "403", "error": "invalid_token", "message": "Invalid token"},
+                            status_code=403)
+    data = await request.body()
+    counters["storage_uploads"] += 1
+    counters["storage_bytes"] += len(data)
+    remember_object(f"{bucket}/{path}", data)
+    return {"Key": f"{bucket}/{path}"}
+
+
+@app.head("/storage/v1/object/{bucket}/{path:path}")
+async def storage_head(bucket: str, path: str):
+    await http_latency()
+    return Response(status_code=200 if f"{bucket}/{path}" in objects else 404)
+
+
+@app.post("/storage/v1/object/{bucket}/{path:path}")
+@app.put("/storage/v1/object/{bucket}/{path:path}")
+async def storage_upload(bucket: str, path: str, request: Request):
+    await http_latency()
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        data = await form["file"].read()
+        await form.close()
+    else:
+        data = await request.body()
+    counters["storage_uploads"] += 1
+    counters["storage_bytes"] += len(data)
+    remember_object(f"{bucket}/{path}", data)
+    return {"Key": f"{bucket}/{path}", "Id": str(uuid4())}
+
+
+@app.get("/storage/v1/object/public/{bucket}/{path:path}")
+@app.get("/storage/v1/object/authenticated/{bucket}/{path:path}")
+@app.get("/storage/v1/object/{bucket}/{path:path}")
+# Image transformation: the object is returned as stored, without resizing
+@app.get("/storage/v1/render/image/authenticated/{bucket}/{path:path}")
+async def storage_download(bucket: str, path: str):
+    await http_latency()
+    data = objects.get(f"{bucket}/{path}")
+    if data is None:
+        return JSONResponse({"statusCode": "404", "error": "not_found", "message": "Object not found"},
+                            status_code=404)
+    return Response(data, media_type="application/octet-stream")
+
+
+# --- Supabase PostgREST ---------------------------------------------------------
+
+tables = {}
+row_ids = itertools.count(1)
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+def json_path(row, expr):
+    """Resolve a PostgREST column expression such as extracted_data->>full_name."""
+    parts = expr.replace("->>", "->").split("->")
+    value = row.get(parts[0])
+    for part in parts[1:]:
+        value = value.get(part) if isinstance(value, dict) else None
+    if "->>" in expr and value is not None and not isinstance(value, str):
+        value = json.dumps(value)
+    return value
+
+
+def matches(row, column, condition):
+    negate = condition.startswith("not.")
+    if negate:
+        condition = condition[4:]
+    op, _, operand = condition.partition(".")
+    value = json_path(row, column)
+    if op == "eq":
+        result = value is not None and str(value) == operand
+    elif op == "gt":
+        if isinstance(value, int):
+            result = value > int(operand)
+        else:
+            result = value is not None and str(value) > operand
+    elif op == "in":
+        result = value is not None and str(value) in operand.strip("()").split(",")
+    elif op == "is":
+        result = value is None if operand == "null" else str(value).lower() == operand
+    else:
+        raise ValueError(f"unsupported filter {op}")
+    return result != negate
+
+
+def filtered(table, params):
+    rows = tables.get(table, [])
+    for column, condition in params.multi_items():
+        if column not in RESERVED_PARAMS:
+            rows = [row for row in rows if matches(row, column, condition)]
+    return rows
+
+
+def project(row, select):
+    if not select or select.strip() == "*":
+        return dict(row)
+    out = {}
+    for item in select.split(","):
+        item = item.strip()
+        alias, _, expr = item.partition(":") if ":" in item else (None, None, item)
+        out[alias or expr.replace("->>", "->").split("->")[-1]] = json_path(row, expr)
+    return out
+
+
+@app.post("/rest/v1/{table}")
+async def db_insert(table: str, request: Request):
+    await http_latency()
+    body = await request.json()
+    rows = body if isinstance(body, list) else [body]
+    counters["db_inserts"] += 1
+    counters["db_rows"] += len(rows)
+    existing = tables.setdefault(table, [])
+    on_conflict = request.query_params.get("on_conflict")
+    merge = "resolution=merge-duplicates" in request.headers.get("prefer", "")
+    inserted = []
+    for row in rows:
+        duplicate = on_conflict and next((r for r in existing if r.get(on_conflict) == row.get(on_conflict)), None)
+        if duplicate:
+            if merge:
+                duplicate.update(row)
+            continue
+        row = {"id": next(row_ids), **row}
+        existing.append(row)
+        inserted.append(row)
+    if "return=representation" in request.headers.get("prefer", ""):
+        return JSONResponse(inserted, status_code=201)
+    return Response(status_code=201)
+
+
+@app.get("/rest/v1/{table}")
+async def db_select(table: str, request: Request):
+    await http_latency()
+    counters["db_selects"] += 1
+    params = request.query_params
+    rows = filtered(table, params)
+    if "order" in params:
+        column, _, direction = params["order"].partition(".")
+        rows = sorted(rows, key=lambda row: row.get(column), reverse=direction == "desc")
+    if "limit" in params:
+        rows = rows[:int(params["limit"])]
+    return [project(row, params.get("select")) for row in rows]
+
+
+@app.patch("/rest/v1/{table}")
+async def db_update(table: str, request: Request):
+    await http_latency()
+    counters["db_updates"] += 1
+    changes = await request.json()
+    rows = filtered(table, request.query_params)
+    for row in rows:
+        row.update(changes)
+    if "return=representation" in request.headers.get("prefer", ""):
+        return rows
+    return Response(status_code=204)
+
+
+# --- Cartesia -------------------------------------------------------------------
+
+def silent_wav(seconds, sample_rate=16000):
+    data_size = int(seconds * sample_rate) * 2
+    header = (b"RIFF" + (36 + data_size).to_bytes(4, "little") + b"WAVEfmt "
+              + (16).to_bytes(4, "little") + (1).to_bytes(2, "little") + (1).to_bytes(2, "little")
+              + sample_rate.to_bytes(4, "little") + (sample_rate * 2).to_bytes(4, "little")
+              + (2).to_bytes(2, "little") + (16).to_bytes(2, "little")
+              + b"data" + data_size.to_bytes(4, "little"))
+    return header + bytes(data_size)
+
+
+@app.post("/tts/bytes")
+async def tts_bytes(request: Request):
+    body = await request.json()
+    counters["tts"] += 1
+    # Roughly 15 characters of speech per second
+    audio = silent_wav(max(1.0, len(body.get("transcript", "")) / 15))
+    chunk_size = len(audio) // MOCK_TTS_CHUNKS + 1
+
+    async def chunks():
+        await asyncio.sleep(MOCK_TTS_TTFB_MS / 1000)
+        for i in range(0, len(audio), chunk_size):
+            yield audio[i:i + chunk_size]
+            await asyncio.sleep(0.01)
+
+    return StreamingResponse(chunks(), media_type="audio/wav")
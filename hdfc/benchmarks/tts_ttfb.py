@@ -0,0 +1,56 @@
+"""Time to first audio byte and payload size per TTS format against a running backend.
+
+Compares the JSON endpoint (whole clip, base64) with the streaming endpoint for each
+compact format. Use --fresh to bypass the TTS cache with unique text per request.
+
+    python benchmarks/tts_ttfb.py --url http://127.0.0.1:8000 --runs 5
+"""
+import time
+import argparse
+import statistics
+import httpx
+
+TEXT = "Please show your Aadhaar card to the camera and click Capture."
+FORMATS = ["wav44k_f32", "wav22k", "wav16k", "mp3"]
+
+
+def measure_json(client, url, text):
+    started = time.perf_counter()
+    response = client.post(f"{url}/cartesia/tts", json={"text": text})
+    total = time.perf_counter() - started
+    # Nothing is playable until the whole JSON body has arrived
+    return total, total, len(response.content)
+
+
+def measure_stream(client, url, text, fmt):
+    started = time.perf_counter()
+    first = None
+    size = 0
+    with client.stream("GET", f"{url}/cartesia/tts/stream", params={"text": text, "format": fmt}) as response:
+        for chunk in response.iter_bytes():
+            if first is None and chunk:
+                first = time.perf_counter() - started
+            size += len(chunk)
+    return first or 0.0, time.perf_counter() - started, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--fresh", action="store_true", help="unique text per request (cache misses)")
+    args = parser.parse_args()
+
+    print(f"{'endpoint':>20} {'ttfb p50 ms':>12} {'total p50 ms':>13} {'bytes':>9}")
+    with httpx.Client(timeout=60.0) as client:
+        cases = [("json wav44k_f32", lambda text: measure_json(client, args.url, text))]
+        cases += [(f"stream {fmt}", lambda text, fmt=fmt: measure_stream(client, args.url, text, fmt)) for fmt in FORMATS]
+        for name, measure in cases:
+            results = [measure(f"{TEXT} ({i} {time.time()})" if args.fresh else TEXT) for i in range(args.runs)]
+            ttfb = statistics.median(r[0] for r in results) * 1000
+            total = statistics.median(r[1] for r in results) * 1000
+            print(f"{name:>20} {ttfb:>12.1f} {total:>13.1f} {results[-1][2]:>9}")
+
+
+if __name__ == "__main__":
+    main()
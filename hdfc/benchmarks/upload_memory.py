@@ -0,0 +1,121 @@
+"""Peak memory per /kyc/process-aadhaar request for each image transport.
+
+Drives the ASGI app directly with the body delivered in 64 KB chunks (as uvicorn does)
+and the KYC step replaced by a no-op (quality gate off: the payload is random bytes, not
+an image), so only request parsing and decoding are measured.
+Each transport runs in its own process so peak RSS figures do not bleed into each other.
+
+    python benchmarks/upload_memory.py --sizes 0.5 2 8
+"""
+import os
+import sys
+import json
+import base64
+import asyncio
+import argparse
+import resource
+import subprocess
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ["json", "multipart", "binary"]
+CHUNK = 64 * 1024
+BOUNDARY = b"----kycbenchboundary"
+
+
+def build_request(mode, img):
+    if mode == "json":
+        body = (b'{"session_id": "bench", "aadhaar_image": "data:image/png;base64,'
+                + base64.b64encode(img) + b'"}')
+        return body, b"application/json", b""
+    if mode == "multipart":
+        body = (b"--" + BOUNDARY + b'\r\nContent-Disposition: form-data; name="session_id"\r\n\r\nbench\r\n'
+                + b"--" + BOUNDARY + b'\r\nContent-Disposition: form-data; name="aadhaar_image"; filename="aadhaar.png"\r\n'
+                + b"Content-Type: image/png\r\n\r\n" + img + b"\r\n--" + BOUNDARY + b"--\r\n")
+        return body, b"multipart/form-data; boundary=" + BOUNDARY, b""
+    return img, b"image/png", b"session_id=bench"
+
+
+async def send_request(app, chunks, content_length, content_type, query_string):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/kyc/process-aadhaar",
+        "raw_path": b"/kyc/process-aadhaar", "query_string": query_string, "root_path": "",
+        "headers": [(b"content-type", content_type), (b"content-length", str(content_length).encode())],
+        "server": ("bench", 80), "client": ("bench", 1),
+    }
+    status = {}
+
+    async def receive():
+        chunk = chunks.pop(0)
+        return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    await app(scope, receive, send)
+    return status.get("code")
+
+
+def run_mode(mode, size_mb):
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+    os.environ.setdefault("SUPABASE_API_KEY", "bench")
+    os.environ["KYC_QUALITY_GATE"] = "false"
+    from backend import main
+
+    async def noop_step(session_id, img_bytes):
+        return {"session_id": session_id, "bytes": len(img_bytes)}, 200
+    main.run_aadhaar_step = noop_step
+
+    img = os.urandom(int(size_mb * 1024 * 1024))
+    body, content_type, query_string = build_request(mode, img)
+    content_length = len(body)
+    chunks = [body[i:i + CHUNK] for i in range(0, len(body), CHUNK)]
+    del img, body
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    code = asyncio.run(send_request(main.app, chunks, content_length, content_type, query_string))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "mode": mode,
+        "size_mb": size_mb,
+        "status": code,
+        "wire_mb": round(content_length / 1024 / 1024, 2),
+        "python_peak_mb": round(peak / 1024 / 1024, 2),
+        "rss_growth_mb": round((rss_after - rss_before) / 1024, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[0.5, 2, 8], help="image sizes in MB")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.sizes[0])))
+        return
+
+    print(f"{'size MB':>8} {'transport':>10} {'status':>6} {'wire MB':>8} {'py peak MB':>11} {'RSS +MB':>8}")
+    for size_mb in args.sizes:
+        for mode in MODES:
+            out = subprocess.run([sys.executable, __file__, "--mode", mode, "--sizes", str(size_mb)],
+                                 capture_output=True, text=True, cwd=ROOT)
+            lines = out.stdout.strip().splitlines()
+            if out.returncode != 0 or not lines:
+                print(f"{size_mb:>8} {mode:>10} failed: {out.stderr.strip().splitlines()[-1:]}")
+                continue
+            r = json.loads(lines[-1])
+            if r["status"] != 200:
+                print(f"{size_mb:>8} {mode:>10} failed: status {r['status']}, the step was not reached")
+                continue
+            print(f"{size_mb:>8} {mode:>10} {r['status']:>6} {r['wire_mb']:>8} {r['python_peak_mb']:>11} {r['rss_growth_mb']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,22 @@
 let mediaRecorder = null;
 let recordedChunks = [];
 let recordingStream = null;
+// Chunked recording upload: each timesliced chunk is sent as soon as it is recorded
+let recordingUploadId = null;
+let recordingChunkIndex = 0;
+let recordingUploadChain = Promise.resolve();
+const RECORDING_TIMESLICE_MS = 5000;
+const RECORDING_CHUNK_RETRIES = 5;
+// Captures go straight to storage through signed upload URLs; the backend only signs
+// the upload and is told when it is complete. Off by default: such captures skip the
+// backend's quality gate, downscaling and duplicate-capture reuse.
+const DIRECT_UPLOADS = false;
+// Live capture: preview frames are streamed to the backend, which submits the best one
+const STREAM_FRAME_INTERVAL_MS = 400;
+const STREAM_MAX_INTERVAL_MS = 2000;
+const STREAM_MAX_SIDE = 960;
+const STREAM_MAX_BUFFERED = 256 * 1024;
+let captureSocket = null;
 
 document.addEventListener('DOMContentLoaded', () => {
     // Voice-driven permission and camera flow
@@ -29,20 +45,9 @@ document.addEventListener('DOMContentLoaded', () => {
     const BACKEND_URL = 'http://127.0.0.1:8000';
 
     async function cartesiaSpeak(text) {
-        // Call backend endpoint to get Cartesia TTS audio
-        const response = await fetch(`${BACKEND_URL}/cartesia/tts`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ text })
-        });
-        const data = await response.json();
-        if (data.audio_url) {
-            const audio = new Audio(data.audio_url);
-            audio.play();
-        } else if (data.audio_b64) {
-            const audio = new Audio(`data:audio/wav;base64,${data.audio_b64}`);
-            audio.play();
-        }
+        // Stream Cartesia TTS audio from the backend; playback starts on the first chunk
+        const audio = new Audio(`${BACKEND_URL}/cartesia/tts/stream?format=mp3&text=${encodeURIComponent(text)}`);
+        await audio.play();
     }
 
     function speak(text) {
@@ -54,6 +59,46 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    async function initRecordingUpload() {
+        try {
+            const response = await fetch(`${BACKEND_URL}/upload/recording/init`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ recording_type: 'full_process', ext: 'webm' })
+            });
+            if (!response.ok) return null;
+            return (await response.json()).upload_id;
+        } catch (err) {
+            console.warn('Chunked recording upload unavailable, buffering locally', err);
+            return null;
+        }
+    }
+
+    async function sendRecordingChunk(index, blob) {
+        // Retries with backoff; the backend acknowledges repeats of chunks it already has
+        for (let attempt = 0; attempt < RECORDING_CHUNK_RETRIES; attempt++) {
+            try {
+                const response = await fetch(`${BACKEND_URL}/upload/recording/${recordingUploadId}/chunk?index=${index}`, {
+                    method: 'PUT',
+                    headers: { 'Content-Type': 'application/octet-stream' },
+                    body: blob
+                });
+                if (response.ok) return;
+                if (response.status === 409 || response.status === 404 || response.status === 413) break;
+            } catch (err) {
+                console.warn(`Recording chunk ${index} failed (attempt ${attempt + 1})`, err);
+            }
+            await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+        }
+        throw new Error(`Recording chunk ${index} could not be uploaded`);
+    }
+
+    function queueRecordingChunk(blob) {
+        const index = recordingChunkIndex++;
+        // Chunks must arrive in order, so each upload waits for the previous one
+        recordingUploadChain = recordingUploadChain.then(() => sendRecordingChunk(index, blob));
+    }
+
     async function startScreenAudioRecording() {
         try {
             const screenStream = await navigator.mediaDevices.getDisplayMedia({ video: true, audio: true });
@@ -65,29 +110,67 @@ document.addEventListener('DOMContentLoaded', () => {
             ];
             recordingStream = new MediaStream(combinedTracks);
             recordedChunks = [];
+            recordingChunkIndex = 0;
+            recordingUploadChain = Promise.resolve();
+            // Without a chunked upload the recording is buffered and sent whole at the end
+            recordingUploadId = await initRecordingUpload();
             mediaRecorder = new MediaRecorder(recordingStream, { mimeType: 'video/webm; codecs=vp8,opus' });
             mediaRecorder.ondataavailable = (e) => {
-                if (e.data.size > 0) recordedChunks.push(e.data);
+                if (e.data.size === 0) return;
+                if (recordingUploadId) {
+                    queueRecordingChunk(e.data);
+                } else {
+                    recordedChunks.push(e.data);
+                }
             };
-            mediaRecorder.start();
+            mediaRecorder.start(RECORDING_TIMESLICE_MS);
         } catch (err) {
             alert('Screen/audio recording permission denied or not supported.');
         }
     }
 
+    async function uploadWholeRecording(session_id) {
+        const blob = new Blob(recordedChunks, { type: 'video/webm' });
+        const formData = new FormData();
+        formData.append('session_id', session_id);
+        formData.append('file', blob, 'kyc_recording.webm');
+        formData.append('recording_type', 'full_process');
+        await fetch(`${BACKEND_URL}/upload/recording`, {
+            method: 'POST',
+            body: formData
+        });
+    }
+
+    async function finalizeRecordingUpload(session_id) {
+        await recordingUploadChain;
+        const response = await fetch(`${BACKEND_URL}/upload/recording/${recordingUploadId}/finalize`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ session_id })
+        });
+        if (!response.ok) throw new Error(`Recording finalize failed: ${response.status}`);
+    }
+
     async function stopAndUploadRecording(session_id = 'kyc-session') {
         if (mediaRecorder && mediaRecorder.state !== 'inactive') {
             return new Promise((resolve) => {
                 mediaRecorder.onstop = async () => {
-                    const blob = new Blob(recordedChunks, { type: 'video/webm' });
-                    const formData = new FormData();
-                    formData.append('session_id', session_id);
-                    formData.append('file', blob, 'kyc_recording.webm');
-                    formData.append('recording_type', 'full_process');
-                    await fetch(`${BACKEND_URL}/upload/recording`, {
-                        method: 'POST',
-                        body: formData
-                    });
+                    try {
+                        if (recordingUploadId) {
+                            await finalizeRecordingUpload(session_id);
+                        } else if (DIRECT_UPLOADS) {
+                            const blob = new Blob(recordedChunks, { type: 'video/webm' });
+                            await directUpload('recording', blob, 'webm', { session_id, recording_type: 'full_process' })
+                                .catch(err => {
+                                    console.warn('Direct recording upload failed, sending through the backend', err);
+                                    return uploadWholeRecording(session_id);
+                                });
+                        } else {
+                            await uploadWholeRecording(session_id);
+                        }
+                    } catch (err) {
+                        console.error('Recording upload failed', err);
+                    }
                     resolve();
                 };
                 mediaRecorder.stop();
@@ -130,6 +213,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 document.getElementById('aadhaarCaptureBtn').onclick = () => {
                     captureImage('aadhaar', stream);
                 };
+                startCaptureStream('aadhaar', stream);
             })
             .catch(err => {
                 app.innerHTML += `<p>Camera access denied. Please enable camera to continue.</p>`;
@@ -140,63 +224,216 @@ document.addEventListener('DOMContentLoaded', () => {
     let panImage = null;
     let faceImage = null;
     let sessionId = null;
+    let pendingJobs = [];
+    let captureInFlight = false;
+    const JOB_WAIT_TIMEOUT_MS = 60000;
+    const STEP_RETRIES = 3;
 
     function captureImage(type, stream) {
+        // Ignore a double-clicked Capture while the previous capture is being sent
+        if (captureInFlight) return;
+        captureInFlight = true;
+        stopCaptureStream();
         const video = document.getElementById('video');
         const canvas = document.createElement('canvas');
         canvas.width = video.videoWidth;
         canvas.height = video.videoHeight;
         canvas.getContext('2d').drawImage(video, 0, 0, canvas.width, canvas.height);
-        const dataUrl = canvas.toDataURL('image/png');
-        
-        if (type === 'aadhaar') {
-            aadhaarImage = dataUrl;
-        } else if (type === 'pan') {
-            panImage = dataUrl;
-        } else if (type === 'face') {
-            faceImage = dataUrl;
-        }
-        
-        // Send to IDfy immediately
-        sendToIDfy(type, dataUrl, stream);
+        // Binary blob instead of a base64 data URL: ~33% smaller upload, no JSON encoding
+        canvas.toBlob((blob) => {
+            if (type === 'aadhaar') {
+                aadhaarImage = blob;
+            } else if (type === 'pan') {
+                panImage = blob;
+            } else if (type === 'face') {
+                faceImage = blob;
+            }
+            
+            // Send to IDfy immediately
+            sendToIDfy(type, blob, stream);
+        }, 'image/png');
     }
 
     function sendToIDfy(type, imageData, stream) {
-        // Don't show processing screen - move to next step immediately
+        // Don't show processing screen - move to next step as soon as the capture is accepted
         
         const endpoint = type === 'aadhaar' ? '/kyc/process-aadhaar' :
                         type === 'pan' ? '/kyc/process-pan' :
                         '/kyc/process-face';
         
-        // Build request body with session_id if it exists
-        const requestBody = {
-            [type + '_image']: imageData
-        };
+        // Build multipart request body with session_id if it exists
+        const formData = new FormData();
+        formData.append(type + '_image', imageData, `${type}.png`);
         
         // Only add session_id if we already have one (for pan and face)
         if (sessionId) {
-            requestBody.session_id = sessionId;
+            formData.append('session_id', sessionId);
         }
+        // Job mode: backend returns a job id immediately and processes in the background
+        formData.append('mode', 'job');
         
-        // Send to backend asynchronously (non-blocking)
-        fetch(`${BACKEND_URL}${endpoint}`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(requestBody)
-        })
-        .then(res => res.json())
-        .then(data => {
-            // Get session_id from backend response (especially important for first call)
-            if (data.session_id && !sessionId) {
-                sessionId = data.session_id;
-                console.log(`Session ID generated: ${sessionId}`);
-            }
-        })
+        // Send to backend; in job mode it answers within milliseconds
+        const proxied = () => postKycStep(`${BACKEND_URL}${endpoint}`, formData, crypto.randomUUID());
+        const request = DIRECT_UPLOADS
+            ? directUpload(type, imageData, 'png', { session_id: sessionId, mode: 'job' }).catch(err => {
+                console.warn('Direct upload failed, sending through the backend', err);
+                return proxied();
+            })
+            : proxied();
+        request.then(data => handleStepResult(type, data, stream))
         .catch(err => {
+            captureInFlight = false;
             console.error('Error:', err);
+            nextCapture(type, stream);
         });
-        
-        // Immediately move to next step (don't wait for processing)
+    }
+
+    function handleStepResult(type, data, stream) {
+        captureInFlight = false;
+        // Get session_id from backend response (especially important for first call)
+        if (data.session_id && !sessionId) {
+            sessionId = data.session_id;
+            console.log(`Session ID generated: ${sessionId}`);
+        }
+        if (data.status === 'retake') {
+            // Rejected by the backend quality check before any IDfy call
+            askRetake(type, data.message, stream);
+            return;
+        }
+        pendingJobs.push(data.job_id ? watchJob(data.job_id) : Promise.resolve(data));
+        nextCapture(type, stream);
+    }
+
+    function startCaptureStream(type, stream) {
+        // Send downscaled JPEG previews; the backend scores them and submits a sharp,
+        // steady frame on its own. The Capture button stays as the manual fallback.
+        stopCaptureStream();
+        let query = 'mode=job';
+        if (sessionId) query += `&session_id=${encodeURIComponent(sessionId)}`;
+        let socket;
+        try {
+            socket = new WebSocket(`${BACKEND_URL.replace(/^http/, 'ws')}/kyc/capture/${type}?${query}`);
+        } catch (err) {
+            return;
+        }
+        captureSocket = socket;
+        let interval = STREAM_FRAME_INTERVAL_MS;
+        let timer = null;
+        const canvas = document.createElement('canvas');
+
+        const schedule = () => {
+            if (captureSocket === socket) timer = setTimeout(sendFrame, interval);
+        };
+        const sendFrame = () => {
+            const video = document.getElementById('video');
+            // Skip a frame while earlier ones are still waiting in the socket buffer
+            if (socket.readyState !== WebSocket.OPEN || !video || !video.videoWidth
+                || socket.bufferedAmount > STREAM_MAX_BUFFERED) {
+                schedule();
+                return;
+            }
+            const scale = Math.min(1, STREAM_MAX_SIDE / Math.max(video.videoWidth, video.videoHeight));
+            canvas.width = Math.round(video.videoWidth * scale);
+            canvas.height = Math.round(video.videoHeight * scale);
+            canvas.getContext('2d').drawImage(video, 0, 0, canvas.width, canvas.height);
+            canvas.toBlob((blob) => {
+                if (blob && captureSocket === socket && socket.readyState === WebSocket.OPEN) socket.send(blob);
+                schedule();
+            }, 'image/jpeg', 0.8);
+        };
+
+        socket.onopen = schedule;
+        socket.onmessage = (e) => {
+            if (captureSocket !== socket) return;
+            const msg = JSON.parse(e.data);
+            if (msg.type === 'slow_down') {
+                interval = Math.min(interval * 2, STREAM_MAX_INTERVAL_MS);
+            } else if (msg.type === 'hint') {
+                showCaptureHint(msg.message);
+            } else if (msg.type === 'committed' && !captureInFlight) {
+                stopCaptureStream();
+                handleStepResult(type, msg.body, stream);
+            }
+        };
+        socket.onclose = () => {
+            clearTimeout(timer);
+            if (captureSocket === socket) captureSocket = null;
+        };
+    }
+
+    function stopCaptureStream() {
+        if (captureSocket) {
+            const socket = captureSocket;
+            captureSocket = null;
+            socket.close();
+        }
+    }
+
+    function showCaptureHint(message) {
+        let hint = document.getElementById('captureHint');
+        if (!hint) {
+            hint = document.createElement('p');
+            hint.id = 'captureHint';
+            app.appendChild(hint);
+        }
+        hint.textContent = message;
+    }
+
+    async function postKycStep(url, body, idempotencyKey, headers = {}) {
+        // The same Idempotency-Key on every attempt makes retries safe: the backend
+        // replays or joins the first attempt instead of starting a second IDfy task
+        for (let attempt = 0; ; attempt++) {
+            try {
+                const res = await fetch(url, {
+                    method: 'POST',
+                    headers: { 'Idempotency-Key': idempotencyKey, ...headers },
+                    body
+                });
+                if (res.status < 500 || attempt >= STEP_RETRIES) return await res.json();
+                const retryAfter = Number(res.headers.get('Retry-After')) || 0;
+                await new Promise(resolve => setTimeout(resolve, Math.max(retryAfter * 1000, 500 * 2 ** attempt)));
+            } catch (err) {
+                if (attempt >= STEP_RETRIES) throw err;
+                await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+            }
+        }
+    }
+
+    async function directUpload(kind, blob, ext, fields) {
+        // 1. ask the backend for a signed URL, 2. PUT the bytes to storage,
+        // 3. tell the backend the object is there so it can start extraction
+        const signRes = await fetch(`${BACKEND_URL}/upload/sign`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ kind, ext, session_id: fields.session_id })
+        });
+        if (!signRes.ok) throw new Error(`Upload signing failed: ${signRes.status}`);
+        const upload = await signRes.json();
+        const putRes = await fetch(upload.signed_url, {
+            method: 'PUT',
+            headers: { 'Content-Type': upload.content_type },
+            body: blob
+        });
+        if (!putRes.ok) throw new Error(`Storage upload failed: ${putRes.status}`);
+        // Completion is idempotent per upload, so it is retried like a KYC step
+        return postKycStep(`${BACKEND_URL}${upload.complete_url}`,
+            JSON.stringify({ ...fields, session_id: fields.session_id || upload.session_id }),
+            upload.upload_id, { 'Content-Type': 'application/json' });
+    }
+
+    function askRetake(type, message, stream) {
+        speak(message);
+        if (type === 'aadhaar') {
+            askAadhaarCard(stream, message);
+        } else if (type === 'pan') {
+            askPanCard(stream, message);
+        } else {
+            askFace(stream, message);
+        }
+    }
+
+    function nextCapture(type, stream) {
+        // Move to next step (don't wait for IDfy processing)
         if (type === 'aadhaar') {
             speak('Now please show your PAN card.');
             askPanCard(stream);
@@ -205,13 +442,34 @@ document.addEventListener('DOMContentLoaded', () => {
             askFace(stream);
         } else if (type === 'face') {
             speak('Please wait while we verify your details...');
-            // Wait for all processing to complete (Aadhaar 5s + PAN 5s + Face 5s)
-            setTimeout(() => {
+            // Wait for all background jobs to finish (with a safety timeout)
+            const timeout = new Promise(resolve => setTimeout(resolve, JOB_WAIT_TIMEOUT_MS));
+            Promise.race([Promise.all(pendingJobs), timeout]).then(() => {
+                pendingJobs = [];
                 fetchAndShowDetails();
-            }, 8000);
+            });
         }
     }
 
+    function watchJob(jobId) {
+        // Follow job progress over server-sent events until it completes or fails
+        return new Promise(resolve => {
+            const source = new EventSource(`${BACKEND_URL}/kyc/jobs/${jobId}/events`);
+            source.addEventListener('job', (e) => {
+                const job = JSON.parse(e.data);
+                console.log(`Job ${job.kind}: ${job.status}`);
+                if (job.status === 'completed' || job.status === 'failed') {
+                    source.close();
+                    resolve(job);
+                }
+            });
+            source.onerror = () => {
+                source.close();
+                resolve(null);
+            };
+        });
+    }
+
     function fetchAndShowDetails() {
         fetch(`${BACKEND_URL}/kyc/get-details/${sessionId}`)
             .then(res => res.json())
@@ -223,22 +481,35 @@ document.addEventListener('DOMContentLoaded', () => {
             });
     }
 
-    function askPanCard(stream) {
-        app.innerHTML = `<h2>Now, please show your PAN card to the camera and click Capture.</h2><video id="video" autoplay playsinline width="300"></video><br><button id="panCaptureBtn">Capture PAN</button>`;
-        speak('Now, please show your PAN card to the camera and click Capture.');
+    function askAadhaarCard(stream, retakeMessage) {
+        app.innerHTML = `<h2>${retakeMessage}</h2><video id="video" autoplay playsinline width="300"></video><br><button id="aadhaarCaptureBtn">Capture Aadhaar</button>`;
+        document.getElementById('video').srcObject = stream;
+        document.getElementById('aadhaarCaptureBtn').onclick = () => {
+            captureImage('aadhaar', stream);
+        };
+        startCaptureStream('aadhaar', stream);
+    }
+
+    function askPanCard(stream, retakeMessage) {
+        const prompt = retakeMessage || 'Now, please show your PAN card to the camera and click Capture.';
+        app.innerHTML = `<h2>${prompt}</h2><video id="video" autoplay playsinline width="300"></video><br><button id="panCaptureBtn">Capture PAN</button>`;
+        if (!retakeMessage) speak(prompt);
         document.getElementById('video').srcObject = stream;
         document.getElementById('panCaptureBtn').onclick = () => {
             captureImage('pan', stream);
         };
+        startCaptureStream('pan', stream);
     }
 
-    function askFace(stream) {
-        app.innerHTML = `<h2>Now, please align your face in the camera and click Capture Face.</h2><video id="video" autoplay playsinline width="300"></video><br><button id="faceCaptureBtn">Capture Face</button>`;
-        speak('Now, please align your face in the camera and click Capture Face.');
+    function askFace(stream, retakeMessage) {
+        const prompt = retakeMessage || 'Now, please align your face in the camera and click Capture Face.';
+        app.innerHTML = `<h2>${prompt}</h2><video id="video" autoplay playsinline width="300"></video><br><button id="faceCaptureBtn">Capture Face</button>`;
+        if (!retakeMessage) speak(prompt);
         document.getElementById('video').srcObject = stream;
         document.getElementById('faceCaptureBtn').onclick = () => {
             captureImage('face', stream);
         };
+        startCaptureStream('face', stream);
     }
 
 
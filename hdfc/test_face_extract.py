@@ -1,45 +1,7 @@
-import cv2
-import numpy as np
-import requests
-from io import BytesIO
-import base64
+import httpx
 import sys
 
-def detect_face_from_bytes(img_bytes: bytes):
-    """Extract face from image bytes using OpenCV Haar Cascade"""
-    image_array = np.frombuffer(img_bytes, np.uint8)
-    img = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
-    if img is None:
-        raise ValueError("Invalid image data")
-    
-    print(f"Image shape: {img.shape}")
-    
-    gray_image = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    face_classifier = cv2.CascadeClassifier(
-        cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-    )
-    
-    print("Detecting faces...")
-    faces = face_classifier.detectMultiScale(
-        gray_image, scaleFactor=1.1, minNeighbors=5, minSize=(40, 40)
-    )
-    
-    print(f"Faces found: {len(faces)}")
-    
-    if faces is None or len(faces) == 0:
-        raise ValueError("No face detected in image")
-    
-    (x, y, w, h) = faces[0]
-    print(f"Face coordinates: x={x}, y={y}, w={w}, h={h}")
-    
-    cropped_face = img[y:y + h, x:x + w]
-    print(f"Cropped face shape: {cropped_face.shape}")
-    
-    success, encoded = cv2.imencode('.png', cropped_face)
-    if not success:
-        raise ValueError("Failed to encode cropped face")
-    
-    return encoded.tobytes()
+from backend.face_detect import detect_face_from_bytes
 
 def test_with_url(image_url):
     """Test face extraction with image URL"""
@@ -49,7 +11,7 @@ def test_with_url(image_url):
     try:
         # Download image
         print("Downloading image...")
-        response = requests.get(image_url)
+        response = httpx.get(image_url, follow_redirects=True)
         response.raise_for_status()
         img_bytes = response.content
         print(f"Downloaded: {len(img_bytes)} bytes")